@@ -45,9 +45,17 @@ export default function App() {
     const fetchPatientList = useCallback(async () => {
         setIsLoading(true);
         try {
-            const response = await fetch(`${API_BASE_URL}/patients/`);
-            if (!response.ok) throw new Error('Could not connect to API server.');
-            const patients = await response.json();
+            // The list endpoint is paginated; follow X-Next-Cursor until the last page.
+            const patients = [];
+            let cursor = null;
+            do {
+                const params = new URLSearchParams({ limit: '5000' });
+                if (cursor) params.set('after', cursor);
+                const response = await fetch(`${API_BASE_URL}/patients/?${params}`);
+                if (!response.ok) throw new Error('Could not connect to API server.');
+                patients.push(...await response.json());
+                cursor = response.headers.get('X-Next-Cursor');
+            } while (cursor);
             setPatientList(patients);
             if (patients.length > 0 && !currentPatientId) {
                 setCurrentPatientId(patients[0].id);
@@ -1,25 +1,34 @@
 import os
+import asyncio
 import uuid
 import re
+import random
 import json
 from typing import TypedDict, List, Dict, Optional
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from pydantic import Field
+from pydantic import Field, ValidationError
+from langchain_core.exceptions import OutputParserException
 from langgraph.graph import StateGraph, END
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+import aiosqlite
 
 # FIX is here: CareProtocolStep is now imported from app.tools
 from app.tools import (
     generate_clinical_profile, get_care_pathway, 
-    simulate_patient_journey_realistic, behavioral_tool, load_care_protocol,
+    simulate_patient_journey_realistic, run_journey_simulation, behavioral_tool, care_protocol_registry,
     CareProtocolStep 
 )
 # Import ALL the other models we'll need from models.py
 from app.models import (
     PatientPersona as PydanticPatientPersona, 
-    CliniversePatient
+    CliniversePatient,
+    CarePlan,
+    NotesSection,
+    MessagesSection
 )
+from app.fast_generator import a1c_series, todo_items, care_team, additional_details
 from app.database import add_patient_to_db
+from app.llm_gateway import llm_gateway
 
 # --- Agent State ---
 class AgentState(TypedDict):
@@ -32,107 +41,167 @@ class AgentState(TypedDict):
     # Final, formatted data
     cliniverse_patient: Dict
     profile_name: Optional[str] 
-
-# --- LLM and Tools Setup ---
-from dotenv import load_dotenv
-load_dotenv()
-llm = ChatOpenAI(model="gpt-4o", temperature=0.7)
+    # When set, the save node skips the write so the caller can bulk-save the batch
+    defer_save: bool
+    # Fixed demographics drawn from the population profile (see app/demographics.py)
+    demographics: Optional[dict]
 
 # --- Agent Nodes ---
 
-def profiler_agent(state: AgentState):
+async def profiler_agent(state: AgentState):
     """Node 1: Generates baseline clinical profile."""
     print("--- 1. PROFILER AGENT ---")
     pathway = get_care_pathway.invoke({})
     profile = generate_clinical_profile.invoke({"condition": pathway})
+    demographics = state.get("demographics") or {}
+    if demographics.get("comorbidities"):
+        profile["comorbidities"] = demographics["comorbidities"]
     return {
         "patient_id": f"SYN_{uuid.uuid4().hex[:8].upper()}",
         "care_pathway": pathway,
         "clinical_profile": profile,
     }
 
-def persona_agent(state: AgentState):
+async def persona_agent(state: AgentState):
     """Node 2: Generates a detailed persona."""
     print("--- 2. PERSONA AGENT ---")
     profile = state["clinical_profile"]
     pathway = state["care_pathway"]
     class InitialPersona(PydanticPatientPersona):
         identified_barriers: List[str] = Field(default=[], description="Placeholder for barriers.")
+        age: Optional[int] = Field(default=None, description="The patient's age in years.")
+        gender: Optional[str] = Field(default=None, description="The patient's gender.")
+    demographics = state.get("demographics") or {}
+    fixed = "".join(f"\n- {key.replace('_', ' ').title()}: {', '.join(value) if isinstance(value, list) else value}"
+                    for key, value in demographics.items() if value)
+    human = f"Generate a persona for a patient with this profile:\n- Care Pathway: {pathway}\n- Baseline A1c: {profile['baseline_a1c']}\n- Baseline Weight: {profile['baseline_weight']} lbs"
+    if fixed:
+        human += f"\nThe patient has these fixed demographics; keep them exactly as given:{fixed}"
     prompt = ChatPromptTemplate.from_messages([
         ("system", "Generate a compelling and believable patient persona based on the clinical data. Provide a common American name, age, gender, and a caregiver if appropriate (e.g., for a pediatric patient)."),
-        ("human", f"Generate a persona for a patient with this profile:\n- Care Pathway: {pathway}\n- Baseline A1c: {profile['baseline_a1c']}\n- Baseline Weight: {profile['baseline_weight']} lbs")
+        ("human", human)
     ]).format_prompt()
-    persona = llm.with_structured_output(InitialPersona).invoke(prompt)
-    return {"persona": persona.model_dump()}
+    # coalesce=False: two patients with the same profile must still get distinct personas.
+    persona = (await llm_gateway.ainvoke(prompt, schema=InitialPersona, coalesce=False)).model_dump()
+    # Sampled demographics win over whatever the model wrote, so no rejection loop is needed.
+    for key in ("age", "gender"):
+        if demographics.get(key) is not None:
+            persona[key] = demographics[key]
+    if demographics:
+        persona["demographics"] = demographics
+    return {"persona": persona}
 
-def journey_simulator_agent(state: AgentState):
+async def journey_simulator_agent(state: AgentState):
     """Node 3: Simulates the 12-month care journey."""
     print("--- 3. JOURNEY SIMULATOR ---")
-    protocol = load_care_protocol.invoke({})
-    log = simulate_patient_journey_realistic.invoke({
-        "pathway": state["care_pathway"],
-        "baseline_a1c": state['clinical_profile']['baseline_a1c'],
-        "baseline_weight": state['clinical_profile']['baseline_weight'],
-        "care_protocol": protocol
-    })
+    protocol = await asyncio.to_thread(care_protocol_registry.index)
+    # Call the plain function rather than the @tool so the cached protocol is not
+    # re-validated through the tool's argument schema on every patient.
+    log = run_journey_simulation(
+        state["care_pathway"],
+        state['clinical_profile']['baseline_a1c'],
+        state['clinical_profile']['baseline_weight'],
+        protocol
+    )
     return {"journey_log": log}
 
-def formatter_agent(state: AgentState):
-    """
-    Node 4: Transforms raw data into the detailed Cliniverse UI format.
-    This node generates all the missing pieces of data.
-    """
-    print("--- 4. UI FORMATTER AGENT ---")
-    
-    if state.get("profile_name"):
-        print(f"Using profile name: {state['profile_name']}")
-        profile_json["profile_name"] = state.get("profile_name")
+FORMATTER_SECTION_ATTEMPTS = int(os.getenv("FORMATTER_SECTION_ATTEMPTS", "2"))
 
-    context = f"""
-    Raw Patient Data:
-    - Patient ID: {state['patient_id']}
-    - Care Pathway: {state['care_pathway']}
-    - Persona: {state['persona']}
-    - Initial Clinical Profile: {state['clinical_profile']}
-    - Simulated Journey Log: {state['journey_log']}
+def _section_context(state: AgentState) -> str:
+    persona = state['persona']
+    profile = state['clinical_profile']
+    journey = "; ".join(f"Month {e['month']}: {e['event']} (A1c {e['a1c']})" for e in state['journey_log'])
+    demographics = ", ".join(f"{key.replace('_', ' ')}: {', '.join(value) if isinstance(value, list) else value}"
+                             for key, value in (persona.get('demographics') or {}).items()
+                             if value and key not in ('age', 'gender'))
+    return f"""
+    Patient: {persona.get('name')}, {persona.get('age')} yo, {persona.get('gender')}
+    Demographics: {demographics or 'not specified'}
+    Care Pathway: {state['care_pathway']}
+    Motivation: {persona.get('motivation')}
+    Baseline A1c: {profile['baseline_a1c']}, Baseline Weight: {profile['baseline_weight']} lbs
+    Journey: {journey}
     """
 
-    formatter_llm = llm.with_structured_output(CliniversePatient)
-    
-    prompt = f"""
-    You are a data transformation and enrichment agent. Your task is to convert the provided raw patient data into a complete, detailed JSON object that matches the `CliniversePatient` schema for a clinical UI.
-
-    Instructions:
-    1.  **Map Existing Data**: Use the raw data to populate the new structure. For example, `persona.name` becomes `name`.
-    2.  **Generate Missing Data**: Create realistic data for fields that don't exist in the raw data. This includes `additionalDetails`, `carePlan` (fully populated), `toDo` list, `notes` (in SOAP format), and `careTeam`. All generated data must be medically and contextually consistent with the raw data.
-    3.  **Generate Messages**: The `messages` list should contain sample messages to simulate a conversation between a Patient and the Health care professional (Health Coach, Dietician, Nutritionist, Pharmacist, Nurse, Physician, Endocrinologist). The messages should be contextually relevant. For example, a message from a the Health care professional asking a question about a new device, or a follow up on an appointment, and a response back from the patient. It should be real back and forth conversation.
-    4.  **Transform Data**: Convert the `journey_log` into the `a1cData` array. Each entry in the log that mentions an A1c value should become a data point. The 'name' of the data point should be a short date like 'Month 1', 'Month 4', etc.
-    5.  **Create Summaries**: The top-level `details` field should be a concise summary string (e.g., "Pediatric • 14 yo, Female").
-    6.  **Ensure IDs Match**: The top-level `id` must be identical to `additionalDetails.participantId`.
+SECTION_INSTRUCTIONS = {
+    "carePlan": "Write the patient's care plan: care lead name (e.g. 'L. Rodriguez'), motivators, primary health concerns, devices (comma-separated), high-level goals, preferred language and a relative lastUpdated time (e.g. '2d ago').",
+    "notes": "Write two or three SOAP notes (subjective, objective, assessment, plan, and a relative 'updated' time) that follow the journey and its A1c values.",
+    "messages": "Write a realistic back-and-forth message thread between the patient and care team members (Health Coach, Dietitian, Pharmacist, Nurse, Physician, Endocrinologist) about the journey, e.g. a new device or an appointment follow-up. Use 'Patient' or the patient's name as the sender for patient messages.",
+}
+SECTION_SCHEMAS = {"carePlan": CarePlan, "notes": NotesSection, "messages": MessagesSection}
 
+async def _generate_section(section: str, context: str):
+    """Generates one narrative section, regenerating just that section if it fails validation."""
+    prompt = f"""
+    You are writing part of a synthetic patient record for a clinical UI. All content must be medically and contextually consistent with this patient.
     {context}
+    Task: {SECTION_INSTRUCTIONS[section]}
+    """
+    for attempt in range(FORMATTER_SECTION_ATTEMPTS):
+        try:
+            return await llm_gateway.ainvoke(prompt, schema=SECTION_SCHEMAS[section], coalesce=False)
+        except (ValidationError, OutputParserException) as e:
+            if attempt == FORMATTER_SECTION_ATTEMPTS - 1:
+                raise
+            print(f"Formatter section '{section}' was invalid, regenerating it: {e}")
 
-    Now, generate the complete `CliniversePatient` JSON object, including the `messages` field.
+def _details(persona: dict) -> str:
+    age, gender = persona.get('age'), persona.get('gender') or "Unknown"
+    if age is None:
+        return gender
+    group = 'Pediatric' if age < 18 else 'Senior' if age >= 65 else 'Adult'
+    return f"{group} • {age} yo, {gender}"
+
+async def formatter_agent(state: AgentState):
+    """
+    Node 4: Transforms raw data into the detailed Cliniverse UI format.
+    The id is the one the profiler assigned; a1cData, additionalDetails, toDo and careTeam
+    are derived locally; the narrative sections (carePlan, notes, messages) are generated
+    by parallel LLM calls.
     """
-    
-    cliniverse_profile = formatter_llm.invoke(prompt)
-    profile_json_str = cliniverse_profile.model_dump_json(by_alias=True)
-    profile_json = json.loads(profile_json_str)
+    print("--- 4. UI FORMATTER AGENT ---")
+    context = _section_context(state)
+    care_plan, notes, messages = await asyncio.gather(
+        *(_generate_section(section, context) for section in ("carePlan", "notes", "messages"))
+    )
+
+    rng = random.Random()
+    persona = state['persona']
+    patient_id = state['patient_id']
+    profile_json = {
+        "id": patient_id,
+        "name": persona['name'],
+        "details": _details(persona),
+        "additionalDetails": additional_details(rng, patient_id, persona['name']),
+        "carePlan": care_plan.model_dump(),
+        "a1cData": a1c_series(state['clinical_profile']['baseline_a1c'], state['journey_log']),
+        "toDo": todo_items(rng, state['journey_log']),
+        "notes": notes.model_dump()["notes"],
+        "careTeam": care_team(rng),
+        "messages": messages.model_dump(by_alias=True)["messages"],
+        "care_pathway": state["care_pathway"],
+    }
+    if state.get("profile_name"):
+        print(f"Using profile name: {state['profile_name']}")
+        profile_json["profile_name"] = state.get("profile_name")
+    # Cheap local check that the merged sections form a valid patient.
+    profile_json = CliniversePatient.model_validate(profile_json).model_dump(by_alias=True)
     return {
         "cliniverse_patient": profile_json
     }
-    # return {"cliniverse_patient": cliniverse_profile.model_dump(by_alias=True)}
 
 
-def save_to_database_node(state: AgentState):
+async def save_to_database_node(state: AgentState):
     """Node 5: Saves the final, formatted patient profile to the SQLite database."""
+    if state.get("defer_save"):
+        return {}
     print("--- 5. SAVING TO DATABASE ---")
     formatted_profile = state.get("cliniverse_patient")
     if not formatted_profile:
         print("ERROR: No formatted patient profile found to save.")
         return {}
         
-    add_patient_to_db(formatted_profile)
+    await asyncio.to_thread(add_patient_to_db, formatted_profile)
     return {}
 
 # --- Graph Definition ---
@@ -152,3 +221,93 @@ workflow.add_edge("save_to_db", END)
 
 app_graph = workflow.compile()
 print("LangGraph agent compiled with UI Formatter and SQLite saving.")
+
+# --- Checkpointed Runs ---
+# Runs that go through run_patient_graph persist their state after every node in
+# a local SQLite checkpoint DB, keyed by thread id. A node that raises is retried
+# from the last checkpoint, so the LLM calls of the nodes before it are not paid
+# for again; calling again with the same thread id (e.g. after a restart) resumes.
+
+CHECKPOINT_DB_FILE = os.getenv("CHECKPOINT_DB_FILE", "cliniverse_checkpoints.db")
+GRAPH_MAX_ATTEMPTS = int(os.getenv("GRAPH_MAX_ATTEMPTS", "3"))
+
+_checkpointed_graphs: Dict[asyncio.AbstractEventLoop, asyncio.Future] = {}
+
+async def _open_checkpointed_graph() -> tuple:
+    conn = await aiosqlite.connect(CHECKPOINT_DB_FILE)
+    saver = AsyncSqliteSaver(conn)
+    await saver.setup()
+    return conn, saver, workflow.compile(checkpointer=saver)
+
+async def get_checkpointed_graph():
+    """The graph compiled with an AsyncSqliteSaver (one per event loop)."""
+    loop = asyncio.get_running_loop()
+    # Store the opening task itself, so concurrent first callers share one connection.
+    if loop not in _checkpointed_graphs:
+        _checkpointed_graphs[loop] = asyncio.ensure_future(_open_checkpointed_graph())
+    opening = _checkpointed_graphs[loop]
+    try:
+        return (await asyncio.shield(opening))[2]
+    except Exception:
+        if _checkpointed_graphs.get(loop) is opening:
+            del _checkpointed_graphs[loop]
+        raise
+
+async def close_checkpointer():
+    opening = _checkpointed_graphs.pop(asyncio.get_running_loop(), None)
+    if opening is not None:
+        try:
+            conn = (await opening)[0]
+        except Exception:
+            return
+        await conn.close()
+
+async def run_patient_graph(
+    thread_id: str,
+    inputs: dict,
+    max_attempts: int = GRAPH_MAX_ATTEMPTS,
+    resumable: bool = True,
+) -> AgentState:
+    """
+    Runs (or resumes) one patient's graph under `thread_id`. A thread that already
+    finished returns its final state without re-running anything. The checkpoint
+    is deleted once the run completes; with `resumable=False` (callers that never
+    retry the same thread id) it is deleted after a failure too.
+    """
+    if max_attempts < 1:
+        raise ValueError(f"max_attempts must be at least 1, got {max_attempts}.")
+    graph = await get_checkpointed_graph()
+    config = {"configurable": {"thread_id": thread_id}}
+    snapshot = await graph.aget_state(config)
+    if snapshot.values and not snapshot.next:
+        return snapshot.values
+    payload = None if snapshot.next else inputs
+    completed = False
+    try:
+        for attempt in range(max_attempts):
+            try:
+                state = await graph.ainvoke(payload, config)
+                break
+            except Exception as e:
+                if attempt == max_attempts - 1:
+                    raise
+                failed = (await graph.aget_state(config)).next
+                print(f"Run {thread_id} failed in {failed or 'graph'}: {e}. Resuming from the last checkpoint.")
+                payload = None if failed else inputs
+        completed = True
+    finally:
+        if completed or not resumable:
+            await graph.checkpointer.adelete_thread(thread_id)
+    return state
+
+async def purge_checkpoints(prefix: str) -> int:
+    """Deletes leftover checkpoint threads whose id starts with `prefix`, e.g. after a crash."""
+    graph = await get_checkpointed_graph()
+    pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    async with graph.checkpointer.conn.execute(
+        "SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id LIKE ? ESCAPE '\\'", (pattern,)
+    ) as cursor:
+        thread_ids = [row[0] for row in await cursor.fetchall()]
+    for thread_id in thread_ids:
+        await graph.checkpointer.adelete_thread(thread_id)
+    return len(thread_ids)
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import sqlite3
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.database import add_patients_to_db
+from app.models import CliniversePatient
+
+# --- Bulk Import ---
+# Reads an NDJSON body (one CliniversePatient per line) as it arrives, validates
+# each line on its own and upserts valid patients in batched transactions. Bad
+# lines are reported by line number and skipped. Only the current batch, the batch
+# being written and a capped error list are held in memory; the next batch is
+# parsed while the previous one is written.
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(4 * 1024 * 1024)))
+IMPORT_MAX_ERROR_REPORTS = int(os.getenv("IMPORT_MAX_ERROR_REPORTS", "1000"))
+
+
+async def _ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    Yields (line number, line) for each non-blank line. Lines longer than
+    IMPORT_MAX_LINE_BYTES are yielded as None instead of being buffered.
+    """
+    buffer = b""
+    line_no = 0
+    skipping = False  # Inside an oversized line; drop bytes until its newline
+    async for chunk in chunks:
+        buffer += chunk
+        while True:
+            end = buffer.find(b"\n")
+            if end < 0:
+                break
+            line, buffer = buffer[:end], buffer[end + 1:]
+            line_no += 1
+            if skipping:
+                skipping = False
+                yield line_no, None
+            elif len(line) > IMPORT_MAX_LINE_BYTES:
+                yield line_no, None
+            elif line.strip():
+                yield line_no, line
+        if len(buffer) > IMPORT_MAX_LINE_BYTES:
+            buffer, skipping = b"", True
+    line_no += 1
+    if skipping:
+        yield line_no, None
+    elif buffer.strip():
+        yield line_no, buffer
+
+
+def _error_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'line'}: {e['msg']}" for e in error.errors(include_url=False)
+    )
+
+
+class ImportReport:
+    """Counts plus per-line errors, capped at IMPORT_MAX_ERROR_REPORTS entries."""
+
+    def __init__(self):
+        self.lines = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+
+    def error(self, line: int, message: str, patient_id: Optional[str] = None):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERROR_REPORTS:
+            report = {"line": line, "error": message}
+            if patient_id is not None:
+                report["id"] = patient_id
+            self.errors.append(report)
+
+    def as_dict(self) -> Dict:
+        return {
+            "lines": self.lines,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def import_patients_ndjson(chunks: AsyncIterator[bytes], batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """
+    Validates and upserts every patient in an NDJSON byte stream. Existing ids are
+    replaced (and their version bumped); if an id repeats, the last line wins.
+    Returns the import report.
+    """
+    report = ImportReport()
+    batch: Dict[str, Tuple[int, Dict]] = {}
+    writing: Optional[asyncio.Task] = None
+
+    async def write(pending: Dict[str, Tuple[int, Dict]]):
+        try:
+            await asyncio.to_thread(add_patients_to_db, [patient for _, patient in pending.values()])
+            report.imported += len(pending)
+        except sqlite3.Error as e:
+            for patient_id, (line, _) in pending.items():
+                report.error(line, f"database error: {e}", patient_id)
+
+    async def flush():
+        nonlocal writing, batch
+        if writing is not None:
+            await writing
+        writing = asyncio.create_task(write(batch)) if batch else None
+        batch = {}
+
+    try:
+        async for line_no, line in _ndjson_lines(chunks):
+            report.lines += 1
+            if line is None:
+                report.error(line_no, f"line exceeds {IMPORT_MAX_LINE_BYTES} bytes")
+                continue
+            try:
+                patient = CliniversePatient.model_validate_json(line)
+            except ValidationError as e:
+                report.error(line_no, _error_message(e))
+                continue
+            batch.pop(patient.id, None)  # Keep the id's latest line, in arrival order
+            batch[patient.id] = (line_no, patient.model_dump(by_alias=True))
+            if len(batch) >= batch_size:
+                await flush()
+        await flush()
+        if writing is not None:
+            await writing
+    finally:
+        if writing is not None and not writing.done():
+            await writing
+    return report.as_dict()
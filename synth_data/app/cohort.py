@@ -0,0 +1,85 @@
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.tools import CARE_PATHWAY_LOGIC, PATHWAY_WEIGHTS, BASELINE_RANGES
+
+# --- Vectorized Cohort Engine ---
+# Batched equivalent of get_care_pathway -> generate_clinical_profile ->
+# simulate_patient_journey. Every draw for the whole cohort is made in one NumPy
+# pass, so there is no per-patient tool invocation or Python-level RNG call.
+
+PATHWAY_NAMES = list(CARE_PATHWAY_LOGIC.keys())
+JITTER = {'a1c': 0.1, 'weight': 2.0}  # Same +/- bounds as simulate_patient_journey
+
+
+def _event_tables():
+    """Pads CARE_PATHWAY_LOGIC into (pathways x events) arrays of months and deltas."""
+    num_events = max(len(events) for events in CARE_PATHWAY_LOGIC.values())
+    shape = (len(PATHWAY_NAMES), num_events + 1)  # Column 0 is enrollment
+    months = np.zeros(shape, dtype=np.int16)
+    a1c_change = np.zeros(shape)
+    weight_change = np.zeros(shape)
+    active = np.zeros(shape)
+    for p, pathway in enumerate(PATHWAY_NAMES):
+        events = CARE_PATHWAY_LOGIC[pathway]
+        for e, event in enumerate(events, start=1):
+            months[p, e] = event['month']
+            a1c_change[p, e] = event['a1c_change']
+            weight_change[p, e] = event['weight_change']
+            active[p, e] = 1.0
+        # Shorter pathways repeat their last month with no change or jitter
+        months[p, len(events) + 1:] = months[p, len(events)]
+    return months, a1c_change, weight_change, active
+
+_MONTHS, _A1C_CHANGE, _WEIGHT_CHANGE, _ACTIVE = _event_tables()
+_A1C_RANGES = np.array([BASELINE_RANGES[p]['a1c'] for p in PATHWAY_NAMES], dtype=float)
+_WEIGHT_RANGES = np.array([BASELINE_RANGES[p]['weight'] for p in PATHWAY_NAMES], dtype=float)
+
+
+def generate_cohort(
+    n: int,
+    seed: Optional[int] = None,
+    profile: Optional[Dict[str, float]] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Draws pathways, baselines and full trajectories for `n` patients at once.
+    Args:
+        n: Number of patients.
+        seed: Seed for a local NumPy Generator; the same seed reproduces the cohort.
+        profile: Optional pathway mix, e.g. {'Obesity': 1.0}. Defaults to PATHWAY_WEIGHTS.
+    Returns:
+        A columnar dict: `pathway` holds int codes into `pathway_names`; `baseline_a1c`
+        and `baseline_weight` are shape (n,); `month`, `a1c` and `weight` are shape
+        (n, events + 1) with column 0 at enrollment.
+    """
+    rng = np.random.default_rng(seed)
+    weights = profile or PATHWAY_WEIGHTS
+    probs = np.array([weights.get(p, 0.0) for p in PATHWAY_NAMES], dtype=float)
+    if probs.sum() <= 0:
+        raise ValueError(f"Profile must weight at least one of {PATHWAY_NAMES}.")
+    probs /= probs.sum()
+
+    pathway = rng.choice(len(PATHWAY_NAMES), size=n, p=probs).astype(np.int8)
+
+    lo, hi = _A1C_RANGES[pathway].T
+    baseline_a1c = np.round(rng.uniform(lo, hi), 2)
+    lo, hi = _WEIGHT_RANGES[pathway].T
+    baseline_weight = np.round(rng.uniform(lo, hi), 1)
+
+    steps = _MONTHS.shape[1]
+    active = _ACTIVE[pathway]
+    a1c_steps = _A1C_CHANGE[pathway] + active * rng.uniform(-JITTER['a1c'], JITTER['a1c'], size=(n, steps))
+    weight_steps = _WEIGHT_CHANGE[pathway] + active * rng.uniform(-JITTER['weight'], JITTER['weight'], size=(n, steps))
+    a1c_steps[:, 0] = baseline_a1c
+    weight_steps[:, 0] = baseline_weight
+
+    return {
+        "pathway_names": np.array(PATHWAY_NAMES),
+        "pathway": pathway,
+        "baseline_a1c": baseline_a1c,
+        "baseline_weight": baseline_weight,
+        "month": _MONTHS[pathway],
+        "a1c": np.cumsum(a1c_steps, axis=1, out=a1c_steps),
+        "weight": np.cumsum(weight_steps, axis=1, out=weight_steps),
+    }
@@ -0,0 +1,109 @@
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+# --- Patient Context Compaction ---
+# /chat used to embed the whole patient as indented JSON. The compactor writes the
+# sections a clinician asks about as dense text lines, leaves out contact details,
+# and drops the oldest notes and messages until the context fits a token budget.
+# Notes and messages are treated as oldest-first, the order they are generated in.
+
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1500"))
+MAX_ITEM_CHARS = 400  # Longer note fields and message bodies are cut to this
+MAX_A1C_POINTS = 13   # Baseline plus the most recent readings
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough OpenAI token estimate (about 4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def _clip(text, limit: int = MAX_ITEM_CHARS) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def _header_lines(patient: Dict) -> List[str]:
+    lines = [f"Patient: {patient.get('name', '?')} | {patient.get('details', '')}"
+             + (f" | pathway {patient['care_pathway']}" if patient.get("care_pathway") else "")]
+    plan = patient.get("carePlan") or {}
+    if plan:
+        lines.append("Care plan: " + "; ".join(f"{key}={_clip(value, 160)}" for key, value in plan.items() if value))
+    account = patient.get("additionalDetails") or {}
+    if account:
+        lines.append(f"Account: {account.get('clientAccount', '')}, {account.get('accountStatus', '')}")
+    # Imported or patched patients can carry null or missing readings; only numeric ones count.
+    a1c = [point for point in patient.get("a1cData") or []
+           if isinstance(point.get("a1c"), (int, float)) and not isinstance(point.get("a1c"), bool)]
+    if a1c:
+        shown = a1c if len(a1c) <= MAX_A1C_POINTS else [a1c[0]] + a1c[-(MAX_A1C_POINTS - 1):]
+        series = ", ".join(f"{point.get('name')} {point['a1c']}" for point in shown)
+        change = a1c[-1]["a1c"] - a1c[0]["a1c"]
+        lines.append(f"A1c: {series} (change {change:+.2f})")
+    open_todos = [t for t in patient.get("toDo") or [] if not t.get("completed")]
+    if open_todos:
+        lines.append("Open to-dos: " + "; ".join(f"[{t.get('priority')}] {_clip(t.get('text', ''), 160)}" for t in open_todos))
+    team = patient.get("careTeam") or []
+    if team:
+        lines.append("Care team: " + "; ".join(f"{m.get('name')} ({m.get('role')})" for m in team))
+    return lines
+
+
+def _note_line(note: Dict) -> str:
+    return (f"- {note.get('updated', '')}: S: {_clip(note.get('subjective', ''))} | O: {_clip(note.get('objective', ''))}"
+            f" | A: {_clip(note.get('assessment', ''))} | P: {_clip(note.get('plan', ''))}")
+
+
+def _message_line(message: Dict) -> str:
+    sender = message.get("from", message.get("from_party", ""))
+    return f"- {sender}, {message.get('time', '')}: {_clip(message.get('subject', ''), 120)} — {_clip(message.get('content', ''))}"
+
+
+def compact_patient_context(
+    patient: Optional[Dict],
+    token_budget: int = CHAT_CONTEXT_TOKEN_BUDGET,
+    measure_baseline: bool = False,
+) -> Tuple[str, Dict]:
+    """
+    Serializes a patient for the chat system prompt within `token_budget` tokens.
+    Returns the text and stats: estimated tokens sent and how many notes/messages
+    were dropped. With `measure_baseline`, the stats also give the tokens the old
+    indented-JSON context would have used and the tokens saved; that serializes the
+    whole patient, so request handlers leave it off.
+    """
+    if not patient:
+        stats = {"context_tokens": 3, "dropped_notes": 0, "dropped_messages": 0}
+        if measure_baseline:
+            stats.update(baseline_tokens=1, tokens_saved=0)
+        return "No patient selected.", stats
+    header = "\n".join(_header_lines(patient))
+    notes = [_note_line(n) for n in patient.get("notes") or []]
+    messages = [_message_line(m) for m in patient.get("messages") or []]
+
+    # Drop from the front (oldest) of whichever section is currently larger.
+    budget_chars = token_budget * 4 - len(header) - 80  # Room for the section headings
+    note_chars, message_chars = sum(len(n) + 1 for n in notes), sum(len(m) + 1 for m in messages)
+    first_note = first_message = 0
+    while note_chars + message_chars > budget_chars and (first_note < len(notes) or first_message < len(messages)):
+        if first_message < len(messages) and (message_chars >= note_chars or first_note == len(notes)):
+            message_chars -= len(messages[first_message]) + 1
+            first_message += 1
+        else:
+            note_chars -= len(notes[first_note]) + 1
+            first_note += 1
+
+    parts = [header]
+    if notes:
+        kept = notes[first_note:]
+        parts.append(f"Notes ({len(kept)} of {len(notes)}, latest last):" + "".join("\n" + n for n in kept))
+    if messages:
+        kept = messages[first_message:]
+        parts.append(f"Messages ({len(kept)} of {len(messages)}, latest last):" + "".join("\n" + m for m in kept))
+    text = "\n".join(parts)
+
+    context_tokens = estimate_tokens(text)
+    stats = {"context_tokens": context_tokens, "dropped_notes": first_note, "dropped_messages": first_message}
+    if measure_baseline:
+        baseline_tokens = estimate_tokens(json.dumps(patient, indent=2))
+        stats.update(baseline_tokens=baseline_tokens, tokens_saved=max(0, baseline_tokens - context_tokens))
+    return text, stats
@@ -1,12 +1,149 @@
 import sqlite3
 import json
-from typing import List, Dict, Optional
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 
 DB_FILE = "cliniverse_synth.db"
 
+class VersionConflict(Exception):
+    """Raised when a conditional write targets a stale patient version."""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Patient has been modified; current version is {current_version}.")
+        self.current_version = current_version
+
+# --- Connection Management ---
+# Connections are opened once and reused instead of per call. Readers share a
+# small pool and run concurrently under WAL; all writes go through one writer
+# connection serialized by a lock, so writers queue instead of failing with
+# "database is locked". Each connection keeps its own prepared-statement cache.
+
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",       # Durable across app crashes under WAL; fsync at checkpoints only
+    "busy_timeout": 5000,
+    "cache_size": -64000,          # ~64 MB page cache per connection
+    "mmap_size": 268435456,        # 256 MB memory-mapped reads
+    "temp_store": "MEMORY",
+}
+
+def _connect(db_file: str) -> sqlite3.Connection:
+    con = sqlite3.connect(db_file, check_same_thread=False, cached_statements=256)
+    con.row_factory = sqlite3.Row
+    for pragma, value in SQLITE_PRAGMAS.items():
+        con.execute(f"PRAGMA {pragma} = {value}")
+    return con
+
+class ConnectionPool:
+    """
+    A fixed-size pool of reader connections plus one lock-guarded writer. Closing
+    it closes the idle readers and the writer; readers still checked out by other
+    threads are closed as they are returned.
+    """
+
+    def __init__(self, db_file: str, size: int = SQLITE_POOL_SIZE):
+        self.db_file = db_file
+        self.pid = os.getpid()
+        self.closed = False
+        self._size = size
+        self._created = 0
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._create_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            con = self._idle.get_nowait()
+        except queue.Empty:
+            with self._create_lock:
+                if self._created < self._size or self.closed:
+                    self._created += 1
+                    return _connect(self.db_file)
+            con = self._idle.get()
+        # None is the wake-up left by a reader returned after close; use a one-off connection.
+        return con if con is not None else _connect(self.db_file)
+
+    @contextmanager
+    def reader(self):
+        con = self._acquire_reader()
+        try:
+            yield con
+        finally:
+            if con.in_transaction:
+                con.rollback()
+            with self._create_lock:  # Serialized with close() so no reader is left idle in a closed pool
+                if self.closed:
+                    con.close()
+                    self._idle.put(None)  # Wakes a thread still waiting on this pool
+                else:
+                    self._idle.put(con)
+
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = _connect(self.db_file)
+            try:
+                with self._writer:  # Commits on success, rolls back on error
+                    yield self._writer
+            finally:
+                if self.closed:  # Used through a stale reference after close()
+                    self._writer.close()
+                    self._writer = None
+
+    def close(self):
+        with self._write_lock, self._create_lock:
+            self.closed = True
+            while True:
+                try:
+                    con = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if con is not None:
+                    con.close()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Returns the pool for the current DB_FILE, (re)creating it after a change of file or a fork."""
+    global _pool
+    pool = _pool
+    if pool is None or pool.db_file != DB_FILE or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.db_file != DB_FILE or _pool.pid != os.getpid():
+                if _pool is not None and _pool.pid == os.getpid():
+                    _pool.close()
+                _pool = ConnectionPool(DB_FILE)
+            pool = _pool
+    return pool
+
+def close_pool():
+    """Closes every pooled connection; the next call reopens them."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def _read():
+    return get_pool().reader()
+
+def _write():
+    return get_pool().writer()
+
 def init_db():
     """Initializes the SQLite database and creates the patients table."""
-    with sqlite3.connect(DB_FILE) as con:
+    with _write() as con:
         cur = con.cursor()
         cur.execute('''
             CREATE TABLE IF NOT EXISTS patients (
@@ -16,67 +153,424 @@ def init_db():
                 profile_name TEXT
             )
         ''')
+        _migrate_patient_extra_columns(cur)
+        _create_patient_section_tables(cur)
         cur.execute('''
             CREATE TABLE IF NOT EXISTS population_profiles (
                 name TEXT PRIMARY KEY,
                 data TEXT NOT NULL
             )
         ''')
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS population_stats_cache (
+                key TEXT PRIMARY KEY,
+                condition TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+        ''')
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_population_stats_cache_lru ON population_stats_cache (last_accessed)")
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS llm_response_cache (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                signature BLOB,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+        ''')
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_cache_lru ON llm_response_cache (last_accessed)")
+        # LSH buckets for near-duplicate lookups: one row per (band hash, entry).
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS llm_response_cache_bands (
+                band_key TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (band_key, key)
+            ) WITHOUT ROWID
+        ''')
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_cache_bands_key ON llm_response_cache_bands (key)")
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS generation_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                request TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS generation_job_results (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                patient_id TEXT,
+                error TEXT,
+                PRIMARY KEY (job_id, seq)
+            )
+        ''')
     print(f"Database '{DB_FILE}' is ready.")
 
+# --- Patients ---
+# Filterable values are copied out of the JSON document into real, indexed
+# columns on every write so listing and filtering never parse `data`. Every
+# write bumps `version`, which the API exposes as an ETag for optimistic
+# concurrency.
+
+PATIENT_EXTRA_COLUMNS = {
+    "care_pathway": "TEXT",
+    "latest_a1c": "REAL",
+    "storage": "TEXT NOT NULL DEFAULT 'blob'",
+    "version": "INTEGER NOT NULL DEFAULT 1",
+}
+INSERT_PATIENT_SQL = '''
+    INSERT INTO patients (id, name, data, profile_name, care_pathway, latest_a1c, storage)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        name = excluded.name, data = excluded.data, profile_name = excluded.profile_name,
+        care_pathway = excluded.care_pathway, latest_a1c = excluded.latest_a1c,
+        storage = excluded.storage, version = patients.version + 1
+'''
+
+def _migrate_patient_extra_columns(cur: sqlite3.Cursor):
+    """Adds and backfills the extra patient columns on databases created before they existed."""
+    existing = {row[1] for row in cur.execute("PRAGMA table_info(patients)")}
+    missing = [col for col in PATIENT_EXTRA_COLUMNS if col not in existing]
+    for col in missing:
+        cur.execute(f"ALTER TABLE patients ADD COLUMN {col} {PATIENT_EXTRA_COLUMNS[col]}")
+    if {"care_pathway", "latest_a1c"} & set(missing):
+        cur.execute('''
+            UPDATE patients SET
+                care_pathway = json_extract(data, '$.care_pathway'),
+                latest_a1c = json_extract(data, '$.a1cData[#-1].a1c')
+        ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_patients_profile_name ON patients (profile_name, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_patients_care_pathway ON patients (care_pathway, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_patients_latest_a1c ON patients (latest_a1c)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_patients_name ON patients (name)")
+
+def _latest_a1c(patient_data: Dict) -> Optional[float]:
+    a1c_data = patient_data.get('a1cData') or []
+    return a1c_data[-1].get('a1c') if a1c_data else None
+
+def _patient_row(patient_data: Dict, data_json: str, storage: str) -> tuple:
+    """Builds the INSERT_PATIENT_SQL parameters for one patient document."""
+    return (
+        patient_data['id'],
+        patient_data['name'],
+        data_json,
+        patient_data.get('profile_name', 'default'),
+        patient_data.get('care_pathway'),
+        _latest_a1c(patient_data),
+        storage,
+    )
+
+# --- Normalized Patient Sections ---
+# With PATIENT_STORAGE_MODE=normalized, the repeating sections of a patient are
+# stored as rows in child tables instead of inside `patients.data`, so a chart
+# can read only a1cData and toggling one to-do touches one row. Each patient row
+# records how it was stored, so both layouts can coexist in one database; child
+# rows of a patient later rewritten as a blob are simply ignored.
+
+PATIENT_STORAGE_MODE = os.getenv("PATIENT_STORAGE_MODE", "blob")
+
+# Section key -> (child table, [(document key, column, SQL type)])
+PATIENT_SECTIONS = {
+    "a1cData": ("patient_a1c_points", [
+        ("name", "name", "TEXT"), ("a1c", "a1c", "REAL"),
+    ]),
+    "toDo": ("patient_todos", [
+        ("id", "todo_id", "INTEGER"), ("text", "text", "TEXT"),
+        ("priority", "priority", "TEXT"), ("completed", "completed", "BOOLEAN"),
+    ]),
+    "notes": ("patient_notes", [
+        ("subjective", "subjective", "TEXT"), ("objective", "objective", "TEXT"),
+        ("assessment", "assessment", "TEXT"), ("plan", "plan", "TEXT"),
+        ("updated", "updated", "TEXT"),
+    ]),
+    "messages": ("patient_messages", [
+        ("from", "from_party", "TEXT"), ("subject", "subject", "TEXT"),
+        ("time", "time", "TEXT"), ("unread", "unread", "BOOLEAN"),
+        ("content", "content", "TEXT"),
+    ]),
+}
+
+def _create_patient_section_tables(cur: sqlite3.Cursor):
+    for table, columns in PATIENT_SECTIONS.values():
+        column_ddl = ", ".join(f"{column} {sql_type}" for _, column, sql_type in columns)
+        # WITHOUT ROWID clusters each patient's rows together on the primary key.
+        cur.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                patient_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                {column_ddl},
+                PRIMARY KEY (patient_id, idx)
+            ) WITHOUT ROWID
+        ''')
+
+def _section_from_rows(section: str, rows) -> List[Dict]:
+    _, columns = PATIENT_SECTIONS[section]
+    items = []
+    for row in rows:
+        item = {}
+        for key, column, sql_type in columns:
+            value = row[column]
+            item[key] = bool(value) if sql_type == "BOOLEAN" and value is not None else value
+        items.append(item)
+    return items
+
+def _write_patients(con: sqlite3.Connection, patients: List[Dict]):
+    """Writes full patient documents in the configured storage mode."""
+    if PATIENT_STORAGE_MODE != "normalized":
+        con.executemany(INSERT_PATIENT_SQL, [_patient_row(p, json.dumps(p), "blob") for p in patients])
+        return
+    con.executemany(INSERT_PATIENT_SQL, [
+        _patient_row(p, json.dumps({k: v for k, v in p.items() if k not in PATIENT_SECTIONS}), "normalized")
+        for p in patients
+    ])
+    ids = [(p['id'],) for p in patients]
+    for section, (table, columns) in PATIENT_SECTIONS.items():
+        con.executemany(f"DELETE FROM {table} WHERE patient_id = ?", ids)
+        placeholders = ", ".join("?" for _ in range(len(columns) + 2))
+        con.executemany(
+            f"INSERT INTO {table} (patient_id, idx, {', '.join(c for _, c, _ in columns)}) VALUES ({placeholders})",
+            [
+                (p['id'], idx, *(item.get(key) for key, _, _ in columns))
+                for p in patients
+                for idx, item in enumerate(p.get(section) or [])
+            ]
+        )
+
+def _assemble_patients(con: sqlite3.Connection, rows) -> Dict[str, Dict]:
+    """Turns (id, data, storage) rows into full documents, batch-loading child rows."""
+    documents = {row["id"]: json.loads(row["data"]) for row in rows}
+    normalized = [row["id"] for row in rows if row["storage"] == "normalized"]
+    if normalized:
+        placeholders = ", ".join("?" for _ in normalized)
+        for section, (table, _) in PATIENT_SECTIONS.items():
+            for patient_id in normalized:
+                documents[patient_id][section] = []
+            child_rows = con.execute(
+                f"SELECT * FROM {table} WHERE patient_id IN ({placeholders}) ORDER BY patient_id, idx",
+                normalized
+            ).fetchall()
+            for row in child_rows:
+                documents[row["patient_id"]][section].extend(_section_from_rows(section, [row]))
+    return documents
+
 def add_patient_to_db(patient_data: Dict):
     """Adds or replaces a patient record in the database."""
-    patient_json = json.dumps(patient_data)
-    with sqlite3.connect(DB_FILE) as con:
-        cur = con.cursor()
-        cur.execute(
-            "INSERT OR REPLACE INTO patients (id, name, data, profile_name) VALUES (?, ?, ?, ?)",
-            (
-                patient_data['id'],
-                patient_data['name'],
-                patient_json,
-                patient_data.get('profile_name', 'default')
-            )
-        )
+    with _write() as con:
+        _write_patients(con, [patient_data])
     print(f"Saved patient {patient_data['name']} to DB.")
 
+def add_patients_to_db(patients: List[Dict]):
+    """Adds or replaces many patient records in a single transaction."""
+    if not patients:
+        return
+    with _write() as con:
+        _write_patients(con, patients)
+    print(f"Saved {len(patients)} patients to DB.")
+
 def update_patient_in_db(patient_id: str, patient_data: Dict):
     """Updates an existing patient record in the database."""
-    patient_json = json.dumps(patient_data)
-    with sqlite3.connect(DB_FILE) as con:
-        cur = con.cursor()
-        cur.execute(
-            "UPDATE patients SET name = ?, data = ? WHERE id = ?",
-            (
-                patient_data.get('name', 'Unknown'), # Update name as well
-                patient_json,
-                patient_id
-            )
-        )
+    with _write() as con:
+        row = con.execute("SELECT profile_name, care_pathway FROM patients WHERE id = ?", (patient_id,)).fetchone()
+        if row:
+            document = {**patient_data, "id": patient_id, "name": patient_data.get('name', 'Unknown')}
+            # Optional fields the payload leaves out (or sends as null) keep their stored values.
+            for key in ("profile_name", "care_pathway"):
+                if document.get(key) is None:
+                    document[key] = row[key]
+            _write_patients(con, [document])
     print(f"Updated patient {patient_id} in DB.")
 
 
 def get_all_patients_from_db() -> List[Dict]:
     """Retrieves a summary of all patients from the database."""
-    with sqlite3.connect(DB_FILE) as con:
-        con.row_factory = sqlite3.Row
+    with _read() as con:
         cur = con.cursor()
         cur.execute("SELECT id, name, profile_name FROM patients")
         patients = [dict(row) for row in cur.fetchall()]
     return patients
 
+def _patient_filters(
+    after: Optional[str] = None,
+    profile_name: Optional[str] = None,
+    care_pathway: Optional[str] = None,
+    a1c_min: Optional[float] = None,
+    a1c_max: Optional[float] = None,
+    name_prefix: Optional[str] = None,
+) -> Tuple[str, list]:
+    """Builds the WHERE clause and parameters shared by listing and export."""
+    clauses, params = [], []
+    if after is not None:
+        clauses.append("id > ?")
+        params.append(after)
+    if profile_name is not None:
+        clauses.append("profile_name = ?")
+        params.append(profile_name)
+    if care_pathway is not None:
+        clauses.append("care_pathway = ?")
+        params.append(care_pathway)
+    if a1c_min is not None:
+        clauses.append("latest_a1c >= ?")
+        params.append(a1c_min)
+    if a1c_max is not None:
+        clauses.append("latest_a1c <= ?")
+        params.append(a1c_max)
+    if name_prefix:
+        # A range instead of LIKE so the name index can be used
+        clauses.append("name >= ? AND name < ?")
+        params += [name_prefix, name_prefix + "\U0010ffff"]
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+def list_patients_from_db(
+    limit: int = 100,
+    after: Optional[str] = None,
+    profile_name: Optional[str] = None,
+    care_pathway: Optional[str] = None,
+    a1c_min: Optional[float] = None,
+    a1c_max: Optional[float] = None,
+    name_prefix: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Returns one page of patient summaries ordered by id, using keyset pagination:
+    pass the last id of a page as `after` to get the next one.
+    """
+    where, params = _patient_filters(after, profile_name, care_pathway, a1c_min, a1c_max, name_prefix)
+    with _read() as con:
+        rows = con.execute(
+            f"SELECT id, name, profile_name, care_pathway, latest_a1c FROM patients {where} ORDER BY id LIMIT ?",
+            params + [limit]
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def iter_patients_from_db(
+    chunk_size: int = 500,
+    profile_name: Optional[str] = None,
+    care_pathway: Optional[str] = None,
+    a1c_min: Optional[float] = None,
+    a1c_max: Optional[float] = None,
+    name_prefix: Optional[str] = None,
+) -> Iterator[List[Dict]]:
+    """
+    Yields full patient documents in id order, `chunk_size` at a time. Each chunk
+    is its own short keyset-paged read, so a slow consumer (a streaming HTTP export)
+    never holds a pooled reader or a read snapshot between chunks. Patients written
+    during the export appear if their id sorts after the current position.
+    """
+    after = None
+    while True:
+        where, params = _patient_filters(after, profile_name, care_pathway, a1c_min, a1c_max, name_prefix)
+        with _read() as con:
+            con.execute("BEGIN")  # Rows and their child sections come from one snapshot
+            rows = con.execute(
+                f"SELECT id, data, storage FROM patients {where} ORDER BY id LIMIT ?", params + [chunk_size]
+            ).fetchall()
+            if not rows:
+                return
+            patients = list(_assemble_patients(con, rows).values())
+        after = rows[-1]["id"]
+        yield patients
+
 def get_patient_details_from_db(patient_id: str) -> Optional[Dict]:
     """Retrieves the full JSON data for a single patient."""
-    with sqlite3.connect(DB_FILE) as con:
-        cur = con.cursor()
-        cur.execute("SELECT data FROM patients WHERE id = ?", (patient_id,))
-        row = cur.fetchone()
-        return json.loads(row[0]) if row else None
+    found = get_patient_with_version_from_db(patient_id)
+    return found[0] if found else None
+
+def get_patient_with_version_from_db(patient_id: str) -> Optional[Tuple[Dict, int]]:
+    """Retrieves a patient's full JSON data together with its current version."""
+    with _read() as con:
+        row = con.execute(
+            "SELECT id, data, storage, version FROM patients WHERE id = ?", (patient_id,)
+        ).fetchone()
+        return (_assemble_patients(con, [row])[patient_id], row["version"]) if row else None
+
+def patch_patient_in_db(
+    patient_id: str,
+    apply_patch: Callable[[Dict], Dict],
+    expected_version: Optional[int] = None
+) -> Optional[Tuple[Dict, Dict, int]]:
+    """
+    Applies `apply_patch` to the stored document inside one write transaction and
+    saves the result. Returns (old, new, new_version), or None if the patient does
+    not exist. Raises VersionConflict if `expected_version` is stale.
+    """
+    with _write() as con:
+        row = con.execute(
+            "SELECT id, data, storage, version FROM patients WHERE id = ?", (patient_id,)
+        ).fetchone()
+        if not row:
+            return None
+        if expected_version is not None and row["version"] != expected_version:
+            raise VersionConflict(row["version"])
+        old = _assemble_patients(con, [row])[patient_id]
+        new = apply_patch(json.loads(json.dumps(old)))
+        new["id"] = patient_id
+        _write_patients(con, [new])
+        return old, new, row["version"] + 1
+
+def get_patient_section_from_db(patient_id: str, section: str) -> Optional[List[Dict]]:
+    """Reads one repeating section (e.g. 'a1cData') without loading the rest of the patient."""
+    table, _ = PATIENT_SECTIONS[section]
+    with _read() as con:
+        row = con.execute(
+            f"SELECT storage, json_extract(data, '$.{section}') AS section FROM patients WHERE id = ?",
+            (patient_id,)
+        ).fetchone()
+        if not row:
+            return None
+        if row["storage"] != "normalized":
+            return json.loads(row["section"]) if row["section"] else []
+        rows = con.execute(
+            f"SELECT * FROM {table} WHERE patient_id = ? ORDER BY idx", (patient_id,)
+        ).fetchall()
+        return _section_from_rows(section, rows)
+
+def update_patient_todo_in_db(patient_id: str, todo_id: int, changes: Dict) -> Optional[Dict]:
+    """
+    Updates fields of one to-do item and returns it, or None if the patient or item
+    does not exist. Normalized patients update a single child row.
+    """
+    _, columns = PATIENT_SECTIONS["toDo"]
+    column_for = {key: column for key, column, _ in columns}
+    changes = {key: value for key, value in changes.items() if key in column_for and key != "id"}
+    with _write() as con:
+        row = con.execute("SELECT id, data, storage FROM patients WHERE id = ?", (patient_id,)).fetchone()
+        if not row:
+            return None
+        if row["storage"] == "normalized":
+            if changes:
+                assignments = ", ".join(f"{column_for[key]} = ?" for key in changes)
+                cur = con.execute(
+                    f"UPDATE patient_todos SET {assignments} WHERE patient_id = ? AND todo_id = ?",
+                    (*changes.values(), patient_id, todo_id)
+                )
+                if cur.rowcount:
+                    con.execute("UPDATE patients SET version = version + 1 WHERE id = ?", (patient_id,))
+            item = con.execute(
+                "SELECT * FROM patient_todos WHERE patient_id = ? AND todo_id = ?", (patient_id, todo_id)
+            ).fetchone()
+            return _section_from_rows("toDo", [item])[0] if item else None
+        document = json.loads(row["data"])
+        for item in document.get("toDo", []):
+            if item.get("id") == todo_id:
+                item.update(changes)
+                con.execute(
+                    "UPDATE patients SET data = ?, version = version + 1 WHERE id = ?",
+                    (json.dumps(document), patient_id)
+                )
+                return item
+        return None
 
 def add_population_profile_to_db(name: str, data: Dict):
     """Adds or replaces a population profile in the database."""
     profile_json = json.dumps(data)
-    with sqlite3.connect(DB_FILE) as con:
+    with _write() as con:
         cur = con.cursor()
         cur.execute(
             "INSERT OR REPLACE INTO population_profiles (name, data) VALUES (?, ?)",
@@ -88,8 +582,7 @@ def add_population_profile_to_db(name: str, data: Dict):
 def get_all_population_profiles_from_db() -> List[Dict]:
     """Retrieves all population profiles from the database."""
     profiles = []
-    with sqlite3.connect(DB_FILE) as con:
-        con.row_factory = sqlite3.Row
+    with _read() as con:
         cur = con.cursor()
         cur.execute("SELECT name, data FROM population_profiles")
         for row in cur.fetchall():
@@ -97,4 +590,234 @@ def get_all_population_profiles_from_db() -> List[Dict]:
                 "name": row["name"],
                 "data": json.loads(row["data"])
             })
-    return profiles
\ No newline at end of file
+    return profiles
+
+def get_population_profile_from_db(name: str) -> Optional[Dict]:
+    """Returns a saved population profile's data, or None."""
+    with _read() as con:
+        row = con.execute("SELECT data FROM population_profiles WHERE name = ?", (name,)).fetchone()
+    return json.loads(row["data"]) if row else None
+
+# --- Population Stats Cache ---
+
+def get_cached_population_stats(key: str, ttl_seconds: float) -> Optional[Dict]:
+    """Returns cached stats for `key` if younger than the TTL, refreshing its LRU timestamp."""
+    now = time.time()
+    with _write() as con:
+        row = con.execute(
+            "SELECT data, created_at FROM population_stats_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        if now - row[1] > ttl_seconds:
+            con.execute("DELETE FROM population_stats_cache WHERE key = ?", (key,))
+            return None
+        con.execute("UPDATE population_stats_cache SET last_accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+def put_cached_population_stats(key: str, condition: str, prompt_version: str, data: Dict, max_entries: int) -> int:
+    """Stores stats for `key` and evicts least-recently-used entries beyond `max_entries`.
+    Returns the number of evicted entries."""
+    now = time.time()
+    with _write() as con:
+        con.execute(
+            "INSERT OR REPLACE INTO population_stats_cache (key, condition, prompt_version, data, created_at, last_accessed) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, condition, prompt_version, json.dumps(data), now, now)
+        )
+        return con.execute(
+            """
+            DELETE FROM population_stats_cache WHERE key IN (
+                SELECT key FROM population_stats_cache ORDER BY last_accessed DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (max_entries,)
+        ).rowcount
+
+def count_cached_population_stats() -> int:
+    """Returns the number of entries in the population stats cache."""
+    with _read() as con:
+        return con.execute("SELECT COUNT(*) FROM population_stats_cache").fetchone()[0]
+
+
+# --- LLM Response Cache ---
+
+def _delete_cached_llm_responses(con: sqlite3.Connection, keys: List[str]):
+    con.executemany("DELETE FROM llm_response_cache_bands WHERE key = ?", [(k,) for k in keys])
+    con.executemany("DELETE FROM llm_response_cache WHERE key = ?", [(k,) for k in keys])
+
+def get_cached_llm_response(key: str, ttl_seconds: float) -> Optional[Dict]:
+    """Returns the cached response for `key` if younger than the TTL, refreshing its LRU timestamp."""
+    now = time.time()
+    with _write() as con:
+        row = con.execute("SELECT data, created_at FROM llm_response_cache WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        if now - row[1] > ttl_seconds:
+            _delete_cached_llm_responses(con, [key])
+            return None
+        con.execute("UPDATE llm_response_cache SET last_accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+def find_cached_llm_response_candidates(band_keys: List[str], ttl_seconds: float) -> List[Tuple[str, bytes]]:
+    """Returns (key, signature) for unexpired entries sharing at least one LSH band."""
+    if not band_keys:
+        return []
+    placeholders = ", ".join("?" for _ in band_keys)
+    with _read() as con:
+        return [tuple(row) for row in con.execute(
+            f"""
+            SELECT DISTINCT c.key, c.signature FROM llm_response_cache_bands b
+            JOIN llm_response_cache c ON c.key = b.key
+            WHERE b.band_key IN ({placeholders}) AND c.created_at >= ?
+            """,
+            (*band_keys, time.time() - ttl_seconds)
+        )]
+
+def put_cached_llm_response(key: str, namespace: str, prompt: str, signature: Optional[bytes],
+                            data: Dict, band_keys: List[str], max_entries: int) -> int:
+    """Stores a response with its LSH bands and evicts least-recently-used entries beyond
+    `max_entries`. Returns the number of evicted entries."""
+    now = time.time()
+    with _write() as con:
+        _delete_cached_llm_responses(con, [key])
+        con.execute(
+            "INSERT INTO llm_response_cache (key, namespace, prompt, signature, data, created_at, last_accessed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, namespace, prompt, signature, json.dumps(data), now, now)
+        )
+        con.executemany(
+            "INSERT OR IGNORE INTO llm_response_cache_bands (band_key, key) VALUES (?, ?)",
+            [(band_key, key) for band_key in band_keys]
+        )
+        evicted = [row[0] for row in con.execute(
+            "SELECT key FROM llm_response_cache ORDER BY last_accessed DESC LIMIT -1 OFFSET ?", (max_entries,)
+        )]
+        _delete_cached_llm_responses(con, evicted)
+        return len(evicted)
+
+def count_cached_llm_responses() -> int:
+    """Returns the number of entries in the LLM response cache."""
+    with _read() as con:
+        return con.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0]
+
+
+# --- Generation Jobs ---
+
+def create_generation_job(job_id: str, request: Dict, total: int):
+    """Inserts a new job in the 'queued' state."""
+    now = time.time()
+    with _write() as con:
+        con.execute(
+            "INSERT INTO generation_jobs (id, status, request, total, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+            (job_id, json.dumps(request), total, now, now)
+        )
+
+def _job_row_to_dict(con: sqlite3.Connection, row: sqlite3.Row) -> Dict:
+    counts = con.execute(
+        "SELECT COUNT(patient_id), COUNT(error) FROM generation_job_results WHERE job_id = ?",
+        (row["id"],)
+    ).fetchone()
+    return {
+        "id": row["id"],
+        "status": row["status"],
+        "request": json.loads(row["request"]),
+        "total": row["total"],
+        "completed": counts[0],
+        "failed": counts[1],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+def get_generation_job(job_id: str) -> Optional[Dict]:
+    """Returns a job with its completed/failed counts, or None."""
+    with _read() as con:
+        row = con.execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_row_to_dict(con, row) if row else None
+
+def get_generation_job_status(job_id: str) -> Optional[str]:
+    """Returns just a job's status, or None; cheap enough to poll between patients."""
+    with _read() as con:
+        row = con.execute("SELECT status FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+def claim_next_generation_job() -> Optional[Dict]:
+    """Atomically moves the oldest queued job to 'running' and returns it."""
+    with _write() as con:
+        while True:
+            row = con.execute(
+                "SELECT * FROM generation_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if not row:
+                return None
+            cur = con.execute(
+                "UPDATE generation_jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), row["id"])
+            )
+            con.commit()
+            if cur.rowcount == 1:
+                return _job_row_to_dict(con, row) | {"status": "running"}
+
+def set_generation_job_status(job_id: str, status: str, only_if: Optional[List[str]] = None) -> bool:
+    """Sets a job's status, optionally only when it is currently in one of `only_if`."""
+    query = "UPDATE generation_jobs SET status = ?, updated_at = ? WHERE id = ?"
+    params = [status, time.time(), job_id]
+    if only_if:
+        query += f" AND status IN ({', '.join('?' for _ in only_if)})"
+        params += only_if
+    with _write() as con:
+        return con.execute(query, params).rowcount == 1
+
+def requeue_interrupted_generation_jobs() -> int:
+    """Puts jobs left 'running' by a previous process back in the queue."""
+    with _write() as con:
+        return con.execute(
+            "UPDATE generation_jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+            (time.time(),)
+        ).rowcount
+
+def add_generation_job_result(job_id: str, seq: int, patient_id: Optional[str] = None, error: Optional[str] = None):
+    """Records the outcome of one patient within a job."""
+    with _write() as con:
+        con.execute(
+            "INSERT OR REPLACE INTO generation_job_results (job_id, seq, patient_id, error) VALUES (?, ?, ?, ?)",
+            (job_id, seq, patient_id, error)
+        )
+
+def add_generation_job_results(job_id: str, results: List[tuple]):
+    """Records many (seq, patient_id, error) outcomes in a single transaction."""
+    with _write() as con:
+        con.executemany(
+            "INSERT OR REPLACE INTO generation_job_results (job_id, seq, patient_id, error) VALUES (?, ?, ?, ?)",
+            [(job_id, seq, patient_id, error) for seq, patient_id, error in results]
+        )
+
+def get_finished_generation_job_seqs(job_id: str) -> set:
+    """Returns the sequence numbers that already have a stored result."""
+    with _read() as con:
+        rows = con.execute("SELECT seq FROM generation_job_results WHERE job_id = ?", (job_id,))
+        return {row[0] for row in rows}
+
+def get_generation_job_results(job_id: str, after: int = 0, limit: int = 100) -> List[Dict]:
+    """
+    Returns results in the order they were recorded, joined with the saved patient data.
+    Each result carries a `cursor` (its rowid); pass the last one back as `after` to resume.
+    """
+    with _read() as con:
+        rows = con.execute(
+            """
+            SELECT r.rowid AS cursor, r.seq, r.patient_id, r.error, p.id, p.data, p.storage
+            FROM generation_job_results r LEFT JOIN patients p ON p.id = r.patient_id
+            WHERE r.job_id = ? AND r.rowid > ?
+            ORDER BY r.rowid LIMIT ?
+            """,
+            (job_id, after, limit)
+        ).fetchall()
+        documents = _assemble_patients(con, [row for row in rows if row["data"] is not None])
+    results = []
+    for row in rows:
+        result = {"cursor": row["cursor"], "seq": row["seq"]}
+        if row["error"] is not None:
+            result["error"] = row["error"]
+        else:
+            result["patient"] = documents.get(row["patient_id"])
+        results.append(result)
+    return results
@@ -1,6 +1,7 @@
 import os
 import json
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, Table, Column, MetaData, Text
+from sqlalchemy.dialects.postgresql import insert as pg_insert, JSONB
 from typing import List, Dict, Optional
 
 # This line reads the database connection URL that Railway will provide as an environment variable.
@@ -13,6 +14,14 @@ if not DATABASE_URL:
 # Create a SQLAlchemy engine to manage the connection pool to the database.
 engine = create_engine(DATABASE_URL)
 
+# Table metadata for statements built with SQLAlchemy Core (e.g. bulk upserts).
+patients_table = Table(
+    "patients", MetaData(),
+    Column("id", Text, primary_key=True),
+    Column("name", Text, nullable=False),
+    Column("data", JSONB, nullable=False),
+)
+
 def init_db():
     """Initializes the PostgreSQL database and creates the patients table."""
     with engine.connect() as con:
@@ -43,6 +52,21 @@ def add_patient_to_db(patient_data: Dict):
         con.commit()
     print(f"Saved patient {patient_data['name']} to DB.")
 
+def add_patients_to_db(patients: List[Dict], chunk_size: int = 1000):
+    """Upserts many patient records in one transaction using multi-row INSERT ... ON CONFLICT statements."""
+    if not patients:
+        return
+    with engine.begin() as con:
+        for start in range(0, len(patients), chunk_size):
+            rows = [{"id": p['id'], "name": p['name'], "data": p} for p in patients[start:start + chunk_size]]
+            stmt = pg_insert(patients_table).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["id"],
+                set_={"name": stmt.excluded.name, "data": stmt.excluded.data}
+            )
+            con.execute(stmt)
+    print(f"Saved {len(patients)} patients to DB.")
+
 def update_patient_in_db(patient_id: str, patient_data: Dict):
     """Updates an existing patient record in the database."""
     patient_json = json.dumps(patient_data)
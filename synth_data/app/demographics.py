@@ -0,0 +1,194 @@
+import hashlib
+import json
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.database import get_population_profile_from_db
+
+# --- Demographic Sampler ---
+# Draws patient demographics from a population profile (the JSON returned by
+# /population-stats/ and stored in population_profiles). Each distribution becomes
+# an alias table once per profile; a cohort is then drawn in one vectorized pass.
+# With `stratified`, every category first gets floor(n * p) patients (shuffled),
+# and only the few remaining slots are random draws, so marginals match the target
+# to within one patient per category. Profiles only carry marginals, so attributes
+# are drawn independently: correlations such as age band vs. insurance are not kept.
+
+PROFILE_DISTRIBUTIONS = {
+    "gender": "genderDistribution",
+    "age_band": "ageDistribution",
+    "race_ethnicity": "raceEthnicityDistribution",
+    "insurance": "insuranceDistribution",
+    "education": "educationDistribution",
+    "income": "incomeDistribution",
+    "geography": "geographicDistribution",
+}
+COMORBIDITY_DEFAULT_RATE = 0.3  # Used when the profile lists comorbidities without rates
+MAX_AGE = 90
+
+
+def _weight(value) -> float:
+    """Accepts 52, 52.0 or '52%'; anything unparseable counts as 0."""
+    if isinstance(value, (int, float)):
+        return max(float(value), 0.0)
+    match = re.search(r"[-+]?\d*\.?\d+", str(value))
+    return max(float(match.group()), 0.0) if match else 0.0
+
+
+def _age_bounds(band: str) -> Tuple[int, int]:
+    """'18-44' -> (18, 44); '65+' -> (65, MAX_AGE); anything else -> (18, MAX_AGE)."""
+    numbers = [int(n) for n in re.findall(r"\d+", band)]
+    if len(numbers) >= 2:
+        return numbers[0], numbers[1]
+    if len(numbers) == 1 and "+" in band:
+        return numbers[0], MAX_AGE
+    return 18, MAX_AGE
+
+
+class AliasTable:
+    """Walker/Vose alias table: O(k) to build, O(1) per draw."""
+
+    def __init__(self, weights: np.ndarray):
+        k = len(weights)
+        self.probabilities = weights / weights.sum()
+        scaled = self.probabilities * k
+        self.prob = np.ones(k)
+        self.alias = np.arange(k)
+        small = [i for i in range(k) if scaled[i] < 1.0]
+        large = [i for i in range(k) if scaled[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+
+    def sample(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        columns = rng.integers(0, len(self.prob), n)
+        return np.where(rng.random(n) < self.prob[columns], columns, self.alias[columns])
+
+
+class DemographicSampler:
+    """Alias tables for every distribution present in a profile."""
+
+    def __init__(self, profile: Dict):
+        self.categories: Dict[str, List[str]] = {}
+        self.tables: Dict[str, AliasTable] = {}
+        for attribute, key in PROFILE_DISTRIBUTIONS.items():
+            distribution = profile.get(key)
+            if not isinstance(distribution, dict):
+                continue
+            names = list(distribution)
+            weights = np.array([_weight(distribution[name]) for name in names])
+            if weights.sum() <= 0:
+                continue
+            self.categories[attribute] = names
+            self.tables[attribute] = AliasTable(weights)
+
+        comorbidities = profile.get("commonComorbidities") or []
+        if isinstance(comorbidities, dict):
+            self.comorbidities = list(comorbidities)
+            self.comorbidity_rates = np.array([_weight(v) / 100 for v in comorbidities.values()]).clip(0, 1)
+        else:
+            self.comorbidities = [str(c) for c in comorbidities]
+            self.comorbidity_rates = np.full(len(self.comorbidities), COMORBIDITY_DEFAULT_RATE)
+        bounds = [_age_bounds(band) for band in self.categories.get("age_band", [])]
+        self._age_low = np.array([b[0] for b in bounds], dtype=np.int64)
+        self._age_high = np.array([b[1] for b in bounds], dtype=np.int64)
+
+    def _draw(self, attribute: str, rng: np.random.Generator, n: int, stratified: bool) -> np.ndarray:
+        table = self.tables[attribute]
+        if not stratified:
+            return table.sample(rng, n)
+        quotas = np.floor(table.probabilities * n).astype(np.int64)
+        codes = np.concatenate([np.repeat(np.arange(len(quotas)), quotas),
+                                table.sample(rng, n - int(quotas.sum()))])
+        rng.shuffle(codes)
+        return codes
+
+    def sample(self, n: int, seed: Optional[int] = None, stratified: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Draws `n` patients. Returns integer codes per attribute (index into
+        `categories[attribute]`), an `age` array within each patient's age band, and
+        a boolean (n x k) `comorbidities` matrix over `self.comorbidities`.
+        """
+        rng = np.random.default_rng(seed)
+        codes = {attribute: self._draw(attribute, rng, n, stratified) for attribute in self.tables}
+        if "age_band" in codes:
+            low, high = self._age_low[codes["age_band"]], self._age_high[codes["age_band"]]
+            codes["age"] = low + (rng.random(n) * (high - low + 1)).astype(np.int64)
+        codes["comorbidities"] = rng.random((n, len(self.comorbidities))) < self.comorbidity_rates
+        return codes
+
+    def to_records(self, sample: Dict[str, np.ndarray]) -> List[Dict]:
+        """Per-patient dicts with category names, ready to pass into a graph run."""
+        n = len(sample["comorbidities"])
+        columns = {attribute: np.array(self.categories[attribute], dtype=object)[sample[attribute]]
+                   for attribute in self.tables}
+        records = []
+        for i in range(n):
+            record = {attribute: str(values[i]) for attribute, values in columns.items()}
+            if "gender" in record:
+                record["gender"] = record["gender"].capitalize()
+            if "age" in sample:
+                record["age"] = int(sample["age"][i])
+            record["comorbidities"] = [c for c, has in zip(self.comorbidities, sample["comorbidities"][i]) if has]
+            records.append(record)
+        return records
+
+    def marginals_report(self, sample: Dict[str, np.ndarray]) -> Dict:
+        """Target vs. sampled share per category, with the max gap and total variation distance."""
+        report = {}
+        n = len(sample["comorbidities"])
+        for attribute, table in self.tables.items():
+            actual = np.bincount(sample[attribute], minlength=len(table.probabilities)) / max(n, 1)
+            report[attribute] = {
+                "categories": {
+                    name: {"target": round(float(target), 4), "actual": round(float(share), 4)}
+                    for name, target, share in zip(self.categories[attribute], table.probabilities, actual)
+                },
+                "max_abs_diff": round(float(np.abs(actual - table.probabilities).max()), 4),
+                "total_variation": round(float(np.abs(actual - table.probabilities).sum() / 2), 4),
+            }
+        if self.comorbidities:
+            prevalence = sample["comorbidities"].mean(axis=0) if n else np.zeros(len(self.comorbidities))
+            report["comorbidities"] = {
+                name: {"target": round(float(rate), 4), "actual": round(float(share), 4)}
+                for name, rate, share in zip(self.comorbidities, self.comorbidity_rates, prevalence)
+            }
+        return {"patients": n, "marginals": report}
+
+
+@lru_cache(maxsize=64)
+def _cached_sampler(profile_json: str) -> DemographicSampler:
+    return DemographicSampler(json.loads(profile_json))
+
+
+def sampler_for_profile(profile: Dict) -> DemographicSampler:
+    """Reuses alias tables across requests for the same profile."""
+    return _cached_sampler(json.dumps(profile, sort_keys=True))
+
+
+def sample_demographics(profile: Optional[Dict], n: int, seed: Optional[int] = None) -> List[Optional[Dict]]:
+    """Per-patient demographics for a cohort, or Nones when there is no usable profile."""
+    if not profile:
+        return [None] * n
+    sampler = sampler_for_profile(profile)
+    if not sampler.tables and not sampler.comorbidities:
+        return [None] * n
+    return sampler.to_records(sampler.sample(n, seed))
+
+
+def resolve_population_profile(profile: Optional[Dict], profile_name: Optional[str]) -> Optional[Dict]:
+    """The request's inline profile, else the saved profile with that name, else None."""
+    if profile:
+        return profile
+    return get_population_profile_from_db(profile_name) if profile_name else None
+
+
+def seed_from_text(text: str) -> int:
+    """A stable 32-bit seed, e.g. from a job id, so resumed jobs redraw the same cohort."""
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
@@ -0,0 +1,269 @@
+"""
+Bulk export of stored patients. Run from synth_data/:
+
+    python -m app.export --format parquet --out exports/
+    python -m app.export --format ndjson --out exports/ --care-pathway T2D_HighRisk
+"""
+import argparse
+import csv
+import io
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.database import PATIENT_SECTIONS, iter_patients_from_db
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+# --- Bulk Export ---
+# NDJSON writes one full patient document per line. CSV and Parquet are flat:
+# a `patients` table with one row per patient (carePlan and additionalDetails
+# spread into columns) plus one child table per repeating section, keyed by
+# (patient_id, idx) and named like the normalized storage tables. Patients are
+# read in fixed-size chunks and each chunk is encoded and handed off before the
+# next is read, so memory stays flat regardless of cohort size.
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+EXPORT_FORMATS = ("ndjson", "csv", "parquet")
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# (document path, column, SQL type); dotted paths reach into nested objects.
+PATIENT_COLUMNS = [
+    ("id", "id", "TEXT"), ("name", "name", "TEXT"), ("details", "details", "TEXT"),
+    ("profile_name", "profile_name", "TEXT"), ("care_pathway", "care_pathway", "TEXT"),
+    *[(f"additionalDetails.{key}", f"additionalDetails_{key}", "TEXT") for key in (
+        "participantId", "email", "phoneNumber", "address", "clientAccount", "accountStatus")],
+    *[(f"carePlan.{key}", f"carePlan_{key}", "TEXT") for key in (
+        "careLead", "motivators", "concerns", "devices", "goals", "language", "lastUpdated")],
+]
+
+# Table -> (section key or None for the patient row itself, columns)
+EXPORT_TABLES: Dict[str, Tuple[Optional[str], List[Tuple[str, str, str]]]] = {
+    "patients": (None, PATIENT_COLUMNS),
+    **{table: (section, columns) for section, (table, columns) in PATIENT_SECTIONS.items()},
+    "patient_care_team": ("careTeam", [("name", "name", "TEXT"), ("role", "role", "TEXT")]),
+}
+
+
+def _lookup(document: Dict, path: str):
+    value = document
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def table_columns(table: str) -> List[Tuple[str, str]]:
+    """(column, SQL type) pairs for an export table, child tables led by patient_id and idx."""
+    section, columns = EXPORT_TABLES[table]
+    lead = [] if section is None else [("patient_id", "TEXT"), ("idx", "INTEGER")]
+    return lead + [(column, sql_type) for _, column, sql_type in columns]
+
+
+def table_rows(table: str, patients: Iterable[Dict]) -> List[tuple]:
+    """Flattens a chunk of patient documents into rows of one export table."""
+    section, columns = EXPORT_TABLES[table]
+    if section is None:
+        return [tuple(_lookup(p, path) for path, _, _ in columns) for p in patients]
+    # Messages are stored with their wire alias ("from"); accept either spelling.
+    return [
+        (p["id"], idx, *(item.get(key, item.get("from_party")) if key == "from" else item.get(key)
+                         for key, _, _ in columns))
+        for p in patients
+        for idx, item in enumerate(p.get(section) or [])
+    ]
+
+
+# --- Encoders ---
+# Each encoder turns row chunks into bytes: `begin()` once, `encode(rows)` per
+# chunk, `end()` once. The HTTP endpoint streams those bytes; the CLI writes them
+# to one file per table.
+
+class CsvEncoder:
+    def __init__(self, columns: List[Tuple[str, str]]):
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def begin(self) -> bytes:
+        self._writer.writerow([column for column, _ in self.columns])
+        return self._drain()
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        self._writer.writerows(rows)
+        return self._drain()
+
+    def end(self) -> bytes:
+        return b""
+
+
+class _DrainableSink:
+    """A write-only file object whose contents are handed off after every row group."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+PARQUET_TYPES = {"TEXT": "string", "REAL": "float64", "INTEGER": "int64", "BOOLEAN": "bool"}
+
+
+class ParquetEncoder:
+    """Writes each chunk as one Parquet row group."""
+
+    def __init__(self, columns: List[Tuple[str, str]]):
+        self.columns = columns
+        self.schema = pa.schema([(column, PARQUET_TYPES[sql_type]) for column, sql_type in columns])
+        self._sink = _DrainableSink()
+        self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+
+    def begin(self) -> bytes:
+        return self._sink.drain()
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        if rows:
+            arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(self.schema)]
+            self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        return self._sink.drain()
+
+    def end(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+class NdjsonEncoder:
+    """Full patient documents, one per line; used with the patients themselves rather than rows."""
+
+    def begin(self) -> bytes:
+        return b""
+
+    def encode(self, patients: List[Dict]) -> bytes:
+        return "".join(json.dumps(p) + "\n" for p in patients).encode("utf-8")
+
+    def end(self) -> bytes:
+        return b""
+
+
+def check_export_request(fmt: str, table: Optional[str]) -> str:
+    """Validates format/table before streaming starts; returns the table to export."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'; expected one of {', '.join(EXPORT_FORMATS)}.")
+    if fmt == "ndjson":
+        if table not in (None, "patients"):
+            raise ValueError("NDJSON exports whole patient documents; 'table' only applies to csv and parquet.")
+        return "patients"
+    table = table or "patients"
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table '{table}'; expected one of {', '.join(EXPORT_TABLES)}.")
+    if fmt == "parquet" and pa is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow).")
+    return table
+
+
+def _encoder(fmt: str, table: str):
+    if fmt == "ndjson":
+        return NdjsonEncoder()
+    columns = table_columns(table)
+    return CsvEncoder(columns) if fmt == "csv" else ParquetEncoder(columns)
+
+
+def stream_export(fmt: str, table: Optional[str] = None, chunk_size: int = EXPORT_CHUNK_SIZE, **filters) -> Iterator[bytes]:
+    """Yields the encoded export of one table, chunk by chunk. Filters match list_patients_from_db."""
+    table = check_export_request(fmt, table)
+    encoder = _encoder(fmt, table)
+    yield encoder.begin()
+    for patients in iter_patients_from_db(chunk_size, **filters):
+        data = encoder.encode(patients if fmt == "ndjson" else table_rows(table, patients))
+        if data:
+            yield data
+    yield encoder.end()
+
+
+def export_to_directory(fmt: str, out_dir: str, chunk_size: int = EXPORT_CHUNK_SIZE, **filters) -> Dict[str, int]:
+    """
+    Writes a full export to `out_dir` in one pass over the database: patients.ndjson,
+    or one .csv/.parquet file per table. Returns the row count per file.
+    """
+    check_export_request(fmt, None)
+    os.makedirs(out_dir, exist_ok=True)
+    tables = ["patients"] if fmt == "ndjson" else list(EXPORT_TABLES)
+    files = {table: open(os.path.join(out_dir, f"{table}.{fmt}"), "wb") for table in tables}
+    counts = dict.fromkeys(tables, 0)
+    try:
+        encoders = {table: _encoder(fmt, table) for table in tables}
+        for table, encoder in encoders.items():
+            files[table].write(encoder.begin())
+        for patients in iter_patients_from_db(chunk_size, **filters):
+            for table, encoder in encoders.items():
+                rows = patients if fmt == "ndjson" else table_rows(table, patients)
+                files[table].write(encoder.encode(rows))
+                counts[table] += len(rows)
+        for table, encoder in encoders.items():
+            files[table].write(encoder.end())
+    finally:
+        for f in files.values():
+            f.close()
+    return {f"{table}.{fmt}": count for table, count in counts.items()}
+
+
+def main():
+    from app import database
+
+    parser = argparse.ArgumentParser(description="Export stored patients as NDJSON, CSV or Parquet.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--out", default="exports", help="Output directory")
+    parser.add_argument("--db", default=database.DB_FILE, help="SQLite database file")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument("--profile-name")
+    parser.add_argument("--care-pathway")
+    parser.add_argument("--a1c-min", type=float)
+    parser.add_argument("--a1c-max", type=float)
+    parser.add_argument("--name-prefix")
+    args = parser.parse_args()
+
+    database.DB_FILE = args.db
+    counts = export_to_directory(
+        args.format, args.out, args.chunk_size,
+        profile_name=args.profile_name, care_pathway=args.care_pathway,
+        a1c_min=args.a1c_min, a1c_max=args.a1c_max, name_prefix=args.name_prefix,
+    )
+    for filename, rows in counts.items():
+        print(f"{os.path.join(args.out, filename)}: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
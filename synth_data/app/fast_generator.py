@@ -0,0 +1,220 @@
+import random
+import uuid
+from typing import List, Dict, Optional
+
+from app.tools import (
+    sample_care_pathway, sample_clinical_profile, run_journey_simulation,
+    care_protocol_registry, ProtocolIndex
+)
+
+# --- Local Templates ---
+# Everything the LLM nodes would otherwise invent, drawn from fixed pools so a
+# cohort can be rebuilt exactly from its seed without any network calls.
+
+FIRST_NAMES = {
+    "Female": ["Maria", "Jennifer", "Linda", "Patricia", "Aisha", "Mei", "Sofia", "Grace",
+               "Denise", "Rosa", "Emily", "Latoya", "Karen", "Ana", "Priya", "Hannah"],
+    "Male": ["James", "Robert", "Michael", "Carlos", "David", "Jamal", "Wei", "Jose",
+             "William", "Anthony", "Kevin", "Luis", "Daniel", "Raj", "Marcus", "Thomas"],
+}
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Garcia", "Martinez", "Brown", "Nguyen", "Lee",
+              "Davis", "Rodriguez", "Lopez", "Wilson", "Patel", "Jackson", "Kim", "Thompson",
+              "Hernandez", "Moore", "Clark", "Walker"]
+STREET_NAMES = ["Oak", "Maple", "Cedar", "Pine", "Elm", "Washington", "Lake", "Hill",
+                "Park", "Sunset", "Highland", "Jefferson"]
+STREET_SUFFIXES = ["St", "Ave", "Rd", "Blvd", "Ln", "Dr"]
+CITIES = [("Austin", "TX", "787"), ("Phoenix", "AZ", "850"), ("Columbus", "OH", "432"),
+          ("Atlanta", "GA", "303"), ("Denver", "CO", "802"), ("Fresno", "CA", "937"),
+          ("Memphis", "TN", "381"), ("Tampa", "FL", "336"), ("Raleigh", "NC", "276"),
+          ("Tucson", "AZ", "857")]
+EMAIL_DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "icloud.com"]
+LANGUAGES = ["English", "English", "English", "Spanish", "Mandarin", "Vietnamese"]
+CARE_LEADS = ["L. Rodriguez", "M. Chen", "S. Okafor", "J. Patel", "K. Morgan"]
+CARE_TEAM_ROLES = ["Health coach", "Registered dietitian", "Pharmacist", "Nurse practitioner",
+                   "Endocrinologist"]
+RELATIVE_TIMES = ["Now", "1 hr ago", "3 hr ago", "Yesterday", "2d ago", "5d ago", "1w ago"]
+
+PATHWAY_TEMPLATES = {
+    'T2D_HighRisk': {
+        "concerns": "Uncontrolled blood glucose, medication adherence, risk of complications",
+        "devices": ["CGM, BGM, Insulin pump", "CGM, BGM", "BGM, Insulin pen"],
+        "goals": "Bring A1c below 8% and stabilize daily glucose readings",
+    },
+    'T2D_ModerateRisk': {
+        "concerns": "Rising A1c, post-meal glucose spikes, weight management",
+        "devices": ["BGM", "CGM", "BGM, Smart scale"],
+        "goals": "Reach an A1c below 7% through diet, activity and medication review",
+    },
+    'Obesity': {
+        "concerns": "Weight-related joint pain, pre-diabetes, low energy",
+        "devices": ["Smart scale", "Smart scale, Activity tracker", "Activity tracker"],
+        "goals": "Lose 5-10% of body weight and keep A1c in the normal range",
+    },
+}
+MOTIVATIONS = [
+    "Wants to stay active for their grandchildren",
+    "Hopes to come off insulin",
+    "Wants more energy at work",
+    "Was scared by a family member's heart attack",
+    "Wants to run a 5K next spring",
+    "Wants to avoid the complications a parent had",
+]
+MESSAGE_THREADS = [
+    [
+        ("Health Coach", "Checking in on your new device", "How are the CGM readings going this week? Any trouble with the sensor?"),
+        ("Patient", "Re: Checking in on your new device", "It fell off once after a shower, but the readings look steadier than before."),
+    ],
+    [
+        ("Registered Dietitian", "Meal plan follow-up", "Were you able to try the breakfast swaps we talked about?"),
+        ("Patient", "Re: Meal plan follow-up", "Mostly yes. Weekends are harder, I end up skipping breakfast."),
+    ],
+    [
+        ("Pharmacist", "Medication refill", "Your metformin refill is due. Any side effects since the dose change?"),
+        ("Patient", "Re: Medication refill", "Some stomach upset the first week, better now. Please send the refill."),
+    ],
+]
+
+
+def _full_name(rng: random.Random, gender: str) -> str:
+    return f"{rng.choice(FIRST_NAMES[gender])} {rng.choice(LAST_NAMES)}"
+
+
+def _address(rng: random.Random) -> str:
+    city, state, zip_prefix = rng.choice(CITIES)
+    return (f"{rng.randint(100, 9999)} {rng.choice(STREET_NAMES)} {rng.choice(STREET_SUFFIXES)}, "
+            f"{city}, {state} {zip_prefix}{rng.randint(0, 99):02d}")
+
+
+def _phone(rng: random.Random) -> str:
+    return f"{rng.randint(201, 989)}{rng.randint(200, 999)}{rng.randint(0, 9999):04d}"
+
+
+# --- Mechanical Sections ---
+# Also used by the LLM formatter node for the parts of a patient that need no model.
+
+def a1c_series(baseline_a1c: float, journey_log: List[Dict]) -> List[Dict]:
+    """`a1cData` points: the baseline as Month 0, then one per journey entry."""
+    a1c_data = [{"name": "Month 0", "a1c": baseline_a1c}]
+    a1c_data += [{"name": f"Month {entry['month']}", "a1c": entry["a1c"]} for entry in journey_log]
+    return a1c_data
+
+
+def todo_items(rng: random.Random, journey_log: List[Dict]) -> List[Dict]:
+    """To-dos for the care team from the last five journey events."""
+    return [
+        {"id": i + 1, "text": entry["event"], "priority": rng.choice(["P0", "P1", "P2"]),
+         "completed": rng.random() < 0.4}
+        for i, entry in enumerate(journey_log[-5:])
+    ]
+
+
+def care_team(rng: random.Random) -> List[Dict]:
+    return [{"name": _full_name(rng, rng.choice(["Female", "Male"])), "role": role}
+            for role in rng.sample(CARE_TEAM_ROLES, 3)]
+
+
+def additional_details(rng: random.Random, patient_id: str, name: str) -> Dict:
+    """Contact and account details; `participantId` always equals the patient id."""
+    first, last = name.lower().split(" ", 1) if " " in name else (name.lower(), "member")
+    return {
+        "participantId": patient_id,
+        "email": f"{first}.{last.replace(' ', '')}{rng.randint(1, 99)}@{rng.choice(EMAIL_DOMAINS)}",
+        "phoneNumber": _phone(rng),
+        "address": _address(rng),
+        "clientAccount": "Verily Health",
+        "accountStatus": "Active",
+    }
+
+
+def build_fast_patient(
+    rng: random.Random,
+    care_protocol: ProtocolIndex,
+    profile_name: Optional[str] = 'default'
+) -> Dict:
+    """
+    Builds one complete `CliniversePatient` dict (alias keys, as stored in the DB)
+    from local templates and the existing clinical numerics. No LLM calls.
+    """
+    pathway = sample_care_pathway(rng)
+    profile = sample_clinical_profile(pathway, rng)
+    journey_log = run_journey_simulation(
+        pathway, profile["baseline_a1c"], profile["baseline_weight"], care_protocol, rng
+    )
+
+    patient_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    gender = rng.choice(["Female", "Male"])
+    age = rng.randint(25, 80)
+    name = _full_name(rng, gender)
+    template = PATHWAY_TEMPLATES[pathway]
+    motivation = rng.choice(MOTIVATIONS)
+    final = journey_log[-1]
+
+    a1c_data = a1c_series(profile["baseline_a1c"], journey_log)
+    to_do = todo_items(rng, journey_log)
+    team = care_team(rng)
+
+    notes = [{
+        "subjective": f"Patient reports: {motivation.lower()}. Concerned about {template['concerns'].split(',')[0].lower()}.",
+        "objective": f"A1c {profile['baseline_a1c']:.2f}% -> {final['a1c']:.2f}%, weight {profile['baseline_weight']:.1f} -> {final['weight']:.1f} lbs over {final['month']} months.",
+        "assessment": f"{pathway.replace('_', ' ')}; {'improving' if final['a1c'] < profile['baseline_a1c'] else 'not yet improving'} glycemic control.",
+        "plan": f"Continue current plan. Next step: {journey_log[-1]['event']}",
+        "updated": rng.choice(RELATIVE_TIMES[2:]),
+    }]
+
+    messages = []
+    for sender, subject, content in rng.choice(MESSAGE_THREADS):
+        messages.append({
+            "from": name if sender == "Patient" else sender,
+            "subject": subject,
+            "time": rng.choice(RELATIVE_TIMES),
+            "unread": rng.random() < 0.3,
+            "content": content,
+        })
+
+    return {
+        "id": patient_id,
+        "name": name,
+        "details": f"{'Senior' if age >= 65 else 'Adult'} • {age} yo, {gender}",
+        "additionalDetails": additional_details(rng, patient_id, name),
+        "carePlan": {
+            "careLead": rng.choice(CARE_LEADS),
+            "motivators": motivation,
+            "concerns": template["concerns"],
+            "devices": rng.choice(template["devices"]),
+            "goals": template["goals"],
+            "language": rng.choice(LANGUAGES),
+            "lastUpdated": rng.choice(RELATIVE_TIMES[3:]),
+        },
+        "a1cData": a1c_data,
+        "toDo": to_do,
+        "notes": notes,
+        "careTeam": team,
+        "messages": messages,
+        "profile_name": profile_name,
+        "care_pathway": pathway,
+    }
+
+
+def fast_patient_rng(seed: int, seq: int) -> random.Random:
+    """
+    The RNG for the `seq`-th patient of a seeded cohort. Each patient gets its own
+    stream, so /generate-patients/ and a (possibly resumed) job give the same seed
+    the same patients.
+    """
+    return random.Random(f"{seed}:{seq}")
+
+
+def generate_fast_cohort(
+    num_patients: int,
+    seed: Optional[int] = None,
+    profile_name: Optional[str] = 'default'
+) -> List[Dict]:
+    """
+    Generates `num_patients` patients without any network calls.
+    The same seed always reproduces the same cohort.
+    """
+    if seed is None:
+        seed = random.getrandbits(32)
+    care_protocol = care_protocol_registry.index()
+    return [build_fast_patient(fast_patient_rng(seed, seq), care_protocol, profile_name)
+            for seq in range(num_patients)]
@@ -0,0 +1,308 @@
+"""
+FHIR R4 export of stored patients as bulk-data NDJSON. Run from synth_data/:
+
+    python -m app.fhir --out fhir_export/ --workers 8
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+from app.database import iter_patients_from_db
+
+# --- FHIR R4 Mapping ---
+# One stored patient document (the CliniversePatient shape) becomes:
+#   Patient, one Observation per a1cData point, CarePlan, CareTeam,
+#   one Communication per message and one DocumentReference per SOAP note.
+# Resource ids are derived from the patient id, so re-exporting a patient yields
+# the same ids and references. Relative times such as "Month 3" or "2d ago" have
+# no absolute date, so they are kept as text instead of invented timestamps.
+
+FHIR_RESOURCE_TYPES = ("Patient", "Observation", "CarePlan", "CareTeam", "Communication", "DocumentReference")
+FHIR_EXPORT_WORKERS = int(os.getenv("FHIR_EXPORT_WORKERS", str(os.cpu_count() or 1)))
+FHIR_EXPORT_CHUNK_SIZE = int(os.getenv("FHIR_EXPORT_CHUNK_SIZE", "500"))
+FHIR_BASE_URL = os.getenv("FHIR_BASE_URL", "http://localhost:8000/fhir")  # Only recorded in the manifest's "request"
+
+A1C_CODE = {"coding": [{"system": "http://loinc.org", "code": "4548-4",
+                        "display": "Hemoglobin A1c/Hemoglobin.total in Blood"}], "text": "HbA1c"}
+LAB_CATEGORY = [{"coding": [{"system": "http://terminology.hl7.org/CodeSystem/observation-category",
+                             "code": "laboratory", "display": "Laboratory"}]}]
+PROGRESS_NOTE_TYPE = {"coding": [{"system": "http://loinc.org", "code": "11506-3", "display": "Progress note"}]}
+PARTICIPANT_ID_SYSTEM = "urn:cliniverse:participant-id"
+FHIR_GENDERS = {"male": "male", "female": "female", "other": "other", "non-binary": "other"}
+
+_GENDER_IN_DETAILS = re.compile(r",\s*([A-Za-z-]+)\s*$")
+
+
+def _gender(details: str) -> str:
+    """'Adult • 49 yo, Female' -> 'female'; anything unrecognized -> 'unknown'."""
+    match = _GENDER_IN_DETAILS.search(details or "")
+    return FHIR_GENDERS.get(match.group(1).lower(), "unknown") if match else "unknown"
+
+
+def _effective_date(label: str) -> Optional[str]:
+    """'Jan 23' -> '2023-01'; relative labels like 'Month 3' have no date."""
+    try:
+        return datetime.strptime(label, "%b %y").strftime("%Y-%m")
+    except (TypeError, ValueError):
+        return None
+
+
+def _human_name(name: str) -> Dict:
+    parts = name.split()
+    human = {"use": "official", "text": name}
+    if parts:
+        human["family"] = parts[-1]
+        if len(parts) > 1:
+            human["given"] = parts[:-1]
+    return human
+
+
+def _patient_resource(p: Dict) -> Dict:
+    details = p.get("additionalDetails") or {}
+    resource = {
+        "resourceType": "Patient",
+        "id": p["id"],
+        "identifier": [{"system": PARTICIPANT_ID_SYSTEM, "value": details.get("participantId", p["id"])}],
+        "active": details.get("accountStatus", "Active") == "Active",
+        "name": [_human_name(p.get("name", ""))],
+        "gender": _gender(p.get("details", "")),
+    }
+    telecom = [{"system": "email", "value": details["email"]}] if details.get("email") else []
+    if details.get("phoneNumber"):
+        telecom.append({"system": "phone", "value": details["phoneNumber"]})
+    if telecom:
+        resource["telecom"] = telecom
+    if details.get("address"):
+        resource["address"] = [{"text": details["address"]}]
+    if p.get("carePlan", {}).get("language"):
+        resource["communication"] = [{"language": {"text": p["carePlan"]["language"]}, "preferred": True}]
+    return resource
+
+
+def _observation_resources(p: Dict, subject: Dict) -> List[Dict]:
+    observations = []
+    for idx, point in enumerate(p.get("a1cData") or []):
+        observation = {
+            "resourceType": "Observation",
+            "id": f"{p['id']}-a1c-{idx}",
+            "status": "final",
+            "category": LAB_CATEGORY,
+            "code": A1C_CODE,
+            "subject": subject,
+            "valueQuantity": {"value": point.get("a1c"), "unit": "%", "system": "http://unitsofmeasure.org", "code": "%"},
+        }
+        effective = _effective_date(point.get("name"))
+        if effective:
+            observation["effectiveDateTime"] = effective
+        else:
+            observation["note"] = [{"text": str(point.get("name", ""))}]
+        observations.append(observation)
+    return observations
+
+
+def _care_plan_resource(p: Dict, subject: Dict) -> Dict:
+    plan = p.get("carePlan") or {}
+    notes = [f"{label}: {plan[key]}" for key, label in (
+        ("motivators", "Motivators"), ("concerns", "Concerns"), ("devices", "Devices"),
+        ("lastUpdated", "Last updated")) if plan.get(key)]
+    resource = {
+        "resourceType": "CarePlan",
+        "id": f"{p['id']}-careplan",
+        "status": "active",
+        "intent": "plan",
+        "title": f"{p.get('care_pathway') or 'Care'} plan",
+        "description": plan.get("goals", ""),
+        "subject": subject,
+        "careTeam": [{"reference": f"CareTeam/{p['id']}-careteam"}],
+        "activity": [
+            {"detail": {"status": "completed" if todo.get("completed") else "not-started",
+                        "description": f"[{todo.get('priority')}] {todo.get('text', '')}"}}
+            for todo in p.get("toDo") or []
+        ],
+    }
+    if plan.get("careLead"):
+        resource["author"] = {"display": plan["careLead"]}
+    if notes:
+        resource["note"] = [{"text": text} for text in notes]
+    return resource
+
+
+def _care_team_resource(p: Dict, subject: Dict) -> Dict:
+    return {
+        "resourceType": "CareTeam",
+        "id": f"{p['id']}-careteam",
+        "status": "active",
+        "subject": subject,
+        "participant": [
+            {"role": [{"text": member.get("role", "")}], "member": {"display": member.get("name", "")}}
+            for member in p.get("careTeam") or []
+        ],
+    }
+
+
+def _communication_resources(p: Dict, subject: Dict) -> List[Dict]:
+    communications = []
+    for idx, message in enumerate(p.get("messages") or []):
+        sender = message.get("from", message.get("from_party", ""))
+        from_patient = sender in (p.get("name"), "Patient")
+        communication = {
+            "resourceType": "Communication",
+            "id": f"{p['id']}-message-{idx}",
+            "status": "completed",
+            "subject": subject,
+            "topic": {"text": message.get("subject", "")},
+            "sender": subject if from_patient else {"display": sender},
+            "payload": [{"contentString": message.get("content", "")}],
+            "note": [{"text": f"Sent {message.get('time', '')}; {'unread' if message.get('unread') else 'read'}"}],
+        }
+        if not from_patient:
+            communication["recipient"] = [subject]
+        communications.append(communication)
+    return communications
+
+
+def _document_reference_resources(p: Dict, subject: Dict) -> List[Dict]:
+    documents = []
+    for idx, note in enumerate(p.get("notes") or []):
+        text = "\n".join(f"{label}: {note.get(key, '')}" for key, label in (
+            ("subjective", "S"), ("objective", "O"), ("assessment", "A"), ("plan", "P")))
+        documents.append({
+            "resourceType": "DocumentReference",
+            "id": f"{p['id']}-note-{idx}",
+            "status": "current",
+            "type": PROGRESS_NOTE_TYPE,
+            "subject": subject,
+            "description": f"SOAP note, updated {note.get('updated', '')}",
+            "content": [{"attachment": {"contentType": "text/plain; charset=utf-8",
+                                        "data": base64.b64encode(text.encode("utf-8")).decode("ascii")}}],
+        })
+    return documents
+
+
+def patient_to_fhir(patient: Dict) -> Dict[str, List[Dict]]:
+    """Maps one patient document to its FHIR R4 resources, grouped by resource type."""
+    subject = {"reference": f"Patient/{patient['id']}", "display": patient.get("name", "")}
+    return {
+        "Patient": [_patient_resource(patient)],
+        "Observation": _observation_resources(patient, subject),
+        "CarePlan": [_care_plan_resource(patient, subject)],
+        "CareTeam": [_care_team_resource(patient, subject)],
+        "Communication": _communication_resources(patient, subject),
+        "DocumentReference": _document_reference_resources(patient, subject),
+    }
+
+
+def patient_bundle(patient: Dict) -> Dict:
+    """All of one patient's resources as a FHIR collection Bundle."""
+    resources = [r for group in patient_to_fhir(patient).values() for r in group]
+    return {
+        "resourceType": "Bundle",
+        "id": f"{patient['id']}-bundle",
+        "type": "collection",
+        "entry": [{"fullUrl": f"{r['resourceType']}/{r['id']}", "resource": r} for r in resources],
+    }
+
+
+# --- Bulk NDJSON Export ---
+# The main process streams patient chunks from the database; worker processes map
+# and serialize each chunk into one NDJSON blob per resource type. At most two
+# chunks per worker are in flight, and blobs are written in submission order, so
+# memory stays bounded and the output order matches patient id order.
+
+def _encode_chunk(patients: List[Dict]) -> Dict[str, tuple]:
+    """Worker task: resource type -> (NDJSON bytes, resource count) for a chunk."""
+    lines: Dict[str, List[str]] = {t: [] for t in FHIR_RESOURCE_TYPES}
+    for patient in patients:
+        for resource_type, resources in patient_to_fhir(patient).items():
+            lines[resource_type].extend(json.dumps(r, separators=(",", ":")) for r in resources)
+    return {t: ("".join(line + "\n" for line in rows).encode("utf-8"), len(rows)) for t, rows in lines.items()}
+
+
+def export_fhir_ndjson(
+    out_dir: str,
+    max_workers: Optional[int] = None,
+    chunk_size: int = FHIR_EXPORT_CHUNK_SIZE,
+    **filters,
+) -> Dict:
+    """
+    Writes <ResourceType>.ndjson files plus a bulk-data style manifest.json to
+    `out_dir`. `max_workers` defaults to FHIR_EXPORT_WORKERS; 1 runs in-process.
+    Filters match list_patients_from_db. Returns the manifest.
+    """
+    workers = max_workers or FHIR_EXPORT_WORKERS
+    os.makedirs(out_dir, exist_ok=True)
+    transaction_time = datetime.now(timezone.utc).isoformat()
+    files = {t: open(os.path.join(out_dir, f"{t}.ndjson"), "wb") for t in FHIR_RESOURCE_TYPES}
+    counts = dict.fromkeys(FHIR_RESOURCE_TYPES, 0)
+
+    def write(encoded: Dict[str, tuple]):
+        for resource_type, (data, count) in encoded.items():
+            files[resource_type].write(data)
+            counts[resource_type] += count
+
+    try:
+        chunks = iter_patients_from_db(chunk_size, **filters)
+        if workers <= 1:
+            for patients in chunks:
+                write(_encode_chunk(patients))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for patients in chunks:
+                    pending.append(pool.submit(_encode_chunk, patients))
+                    if len(pending) >= workers * 2:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+    finally:
+        for f in files.values():
+            f.close()
+
+    # Bulk-data manifests name the kick-off request; there is none here, so record an
+    # equivalent $export URL carrying the resource types and filters that were used.
+    query = {"_type": ",".join(FHIR_RESOURCE_TYPES)}
+    query.update({key: value for key, value in sorted(filters.items()) if value is not None})
+    manifest = {
+        "transactionTime": transaction_time,
+        "request": f"{FHIR_BASE_URL}/Patient/$export?{urlencode(query, safe=',')}",
+        "requiresAccessToken": False,
+        "output": [{"type": t, "url": f"{t}.ndjson", "count": counts[t]} for t in FHIR_RESOURCE_TYPES],
+        "error": [],
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    from app import database
+
+    parser = argparse.ArgumentParser(description="Export stored patients as FHIR R4 bulk-data NDJSON.")
+    parser.add_argument("--out", default="fhir_export", help="Output directory")
+    parser.add_argument("--db", default=database.DB_FILE, help="SQLite database file")
+    parser.add_argument("--workers", type=int, default=FHIR_EXPORT_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=FHIR_EXPORT_CHUNK_SIZE)
+    parser.add_argument("--profile-name")
+    parser.add_argument("--care-pathway")
+    args = parser.parse_args()
+
+    database.DB_FILE = args.db
+    start = time.perf_counter()
+    manifest = export_fhir_ndjson(args.out, args.workers, args.chunk_size,
+                                  profile_name=args.profile_name, care_pathway=args.care_pathway)
+    elapsed = time.perf_counter() - start
+    for output in manifest["output"]:
+        print(f"{os.path.join(args.out, output['url'])}: {output['count']} resources")
+    print(f"Exported {manifest['output'][0]['count']} patients in {elapsed:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
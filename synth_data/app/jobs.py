@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import random
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.models import GenerationRequest
+from app.agent import purge_checkpoints, run_patient_graph
+from app.fast_generator import build_fast_patient, fast_patient_rng
+from app.tools import care_protocol_registry
+from app.demographics import resolve_population_profile, sample_demographics, seed_from_text
+from app.database import (
+    add_patients_to_db,
+    create_generation_job,
+    get_generation_job,
+    get_generation_job_status,
+    claim_next_generation_job,
+    set_generation_job_status,
+    requeue_interrupted_generation_jobs,
+    add_generation_job_result,
+    add_generation_job_results,
+    get_finished_generation_job_seqs,
+    get_generation_job_results,
+)
+
+# --- Background Generation Jobs ---
+# Jobs are persisted in SQLite, so a restart re-queues interrupted jobs and only
+# the patients without a stored result are generated again.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_PATIENT_CONCURRENCY = int(os.getenv("JOB_PATIENT_CONCURRENCY", "8"))
+JOB_FAST_CHUNK_SIZE = int(os.getenv("JOB_FAST_CHUNK_SIZE", "500"))
+TERMINAL_STATUSES = ("completed", "cancelled", "failed")
+
+_job_available = asyncio.Event()
+_worker_tasks: List[asyncio.Task] = []
+
+
+def submit_job(request: GenerationRequest) -> Dict:
+    """Queues a generation request and returns the new job."""
+    job_id = uuid.uuid4().hex
+    params = request.model_dump()
+    if params["mode"] == "fast" and params["seed"] is None:
+        # Pin the seed so a resumed job regenerates exactly the missing patients.
+        params["seed"] = random.getrandbits(32)
+    create_generation_job(job_id, params, request.num_patients)
+    _job_available.set()
+    return get_generation_job(job_id)
+
+
+def cancel_job(job_id: str) -> bool:
+    """Marks a queued or running job as cancelled; workers stop at the next patient."""
+    return set_generation_job_status(job_id, "cancelled", only_if=["queued", "running"])
+
+
+def _generate_fast_chunk(job: Dict, seqs: List[int], care_protocol) -> None:
+    """Builds a chunk of fast-mode patients and bulk-saves them with their job results."""
+    params = job["request"]
+    patients = [
+        build_fast_patient(fast_patient_rng(params["seed"], seq), care_protocol, params["profile_name"])
+        for seq in seqs
+    ]
+    add_patients_to_db(patients)
+    add_generation_job_results(job["id"], [(seq, p["id"], None) for seq, p in zip(seqs, patients)])
+
+
+async def _run_fast_job(job: Dict, pending: List[int]) -> bool:
+    """Runs a fast-mode job in chunks; returns False if it was cancelled."""
+    care_protocol = await asyncio.to_thread(care_protocol_registry.index)
+    for start in range(0, len(pending), JOB_FAST_CHUNK_SIZE):
+        if await asyncio.to_thread(get_generation_job_status, job["id"]) == "cancelled":
+            return False
+        await asyncio.to_thread(_generate_fast_chunk, job, pending[start:start + JOB_FAST_CHUNK_SIZE], care_protocol)
+    return True
+
+
+async def _generate_one(job: Dict, seq: int, demographics: Optional[Dict]) -> str:
+    """
+    Runs the agent graph for one patient, returning its id. The thread id is stable
+    per (job, seq), so a patient interrupted by a restart resumes from its last node.
+    """
+    params = job["request"]
+    state = await run_patient_graph(
+        f"job:{job['id']}:{seq}",
+        {"profile": params["profile"], "profile_name": params["profile_name"], "demographics": demographics}
+    )
+    if "cliniverse_patient" not in state:
+        raise RuntimeError("Graph finished without a formatted patient.")
+    return state["cliniverse_patient"]["id"]
+
+
+async def _run_graph_job(job: Dict, pending: List[int]) -> bool:
+    """Runs the agent graph per patient with bounded concurrency; returns False if cancelled."""
+    job_id = job["id"]
+    params = job["request"]
+    # The whole cohort is drawn at once from the request's seed (or one tied to the job),
+    # so a resumed job gives each remaining patient the same demographics it would have had.
+    profile = await asyncio.to_thread(resolve_population_profile, params["profile"], params["profile_name"])
+    seed = params.get("seed")
+    demographics = await asyncio.to_thread(sample_demographics, profile, job["total"],
+                                           seed_from_text(job_id) if seed is None else seed)
+    semaphore = asyncio.Semaphore(JOB_PATIENT_CONCURRENCY)
+    cancelled = False
+
+    async def run(seq: int):
+        nonlocal cancelled
+        async with semaphore:
+            if cancelled:
+                return
+            if await asyncio.to_thread(get_generation_job_status, job_id) == "cancelled":
+                cancelled = True
+                return
+            try:
+                patient_id = await _generate_one(job, seq, demographics[seq])
+                await asyncio.to_thread(add_generation_job_result, job_id, seq, patient_id, None)
+            except Exception as e:
+                print(f"Job {job_id}: patient {seq} failed: {e}")
+                await asyncio.to_thread(add_generation_job_result, job_id, seq, None, str(e))
+
+    await asyncio.gather(*(run(seq) for seq in pending))
+    return not cancelled
+
+
+async def _run_job(job: Dict):
+    job_id = job["id"]
+    done = await asyncio.to_thread(get_finished_generation_job_seqs, job_id)
+    pending = [seq for seq in range(job["total"]) if seq not in done]
+    if job["request"]["mode"] == "fast":
+        finished = await _run_fast_job(job, pending)
+    else:
+        finished = await _run_graph_job(job, pending)
+    status = "cancelled"
+    if finished:
+        # Partial failures still complete (the failed count is on the job); a job that
+        # produced no patient at all is failed.
+        counts = await asyncio.to_thread(get_generation_job, job_id)
+        status = "completed" if counts["completed"] else "failed"
+        await asyncio.to_thread(set_generation_job_status, job_id, status, ["running"])
+    print(f"Job {job_id} finished ({status}).")
+
+
+async def _worker_loop():
+    while True:
+        job = await asyncio.to_thread(claim_next_generation_job)
+        if job is None:
+            _job_available.clear()
+            try:
+                await asyncio.wait_for(_job_available.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await _run_job(job)
+        except Exception as e:
+            print(f"Job {job['id']} crashed: {e}")
+            await asyncio.to_thread(set_generation_job_status, job["id"], "failed", ["running"])
+        if job["request"]["mode"] != "fast":
+            # The job is terminal, so nothing resumes its threads; failed patients left checkpoints behind.
+            purged = await purge_checkpoints(f"job:{job['id']}:")
+            if purged:
+                print(f"Job {job['id']}: deleted {purged} leftover checkpoint thread(s).")
+
+
+async def start_job_workers(num_workers: int = JOB_WORKERS):
+    """Re-queues jobs interrupted by a restart and starts the worker tasks."""
+    requeued = await asyncio.to_thread(requeue_interrupted_generation_jobs)
+    if requeued:
+        print(f"Re-queued {requeued} interrupted generation job(s).")
+    _worker_tasks.extend(asyncio.create_task(_worker_loop()) for _ in range(num_workers))
+
+
+async def stop_job_workers():
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
+
+
+async def stream_job_results(job_id: str, after: int = 0, follow: bool = True,
+                             poll_interval: float = 0.5) -> AsyncIterator[str]:
+    """
+    Yields NDJSON lines, one per patient result, starting after cursor `after`.
+    With `follow`, keeps polling until the job reaches a terminal state, then ends
+    with a summary line.
+    """
+    while True:
+        status = await asyncio.to_thread(get_generation_job_status, job_id)
+        results = await asyncio.to_thread(get_generation_job_results, job_id, after)
+        for result in results:
+            after = result["cursor"]
+            yield json.dumps(result) + "\n"
+        if results:
+            continue
+        if not follow or status in TERMINAL_STATUSES:
+            break
+        await asyncio.sleep(poll_interval)
+    job = await asyncio.to_thread(get_generation_job, job_id)
+    summary = {key: job[key] for key in ("id", "status", "total", "completed", "failed")}
+    yield json.dumps({"job": summary, "cursor": after}) + "\n"
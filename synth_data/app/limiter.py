@@ -0,0 +1,77 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+# --- Shared LLM Concurrency Limiter ---
+# One limiter instance is shared by every graph run and endpoint in the process,
+# so several concurrent /generate-patients/ callers queue behind the same budget
+# instead of each fanning out unbounded LLM calls.
+
+class AsyncLimiter:
+    """
+    Bounds concurrent calls with a semaphore and, optionally, their start rate with
+    a token bucket. Use as `async with limiter: ...`.
+    """
+
+    def __init__(self, max_concurrency: int, requests_per_minute: Optional[float] = None):
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket_lock = asyncio.Lock()
+        self._tokens = float(max_concurrency)
+        self._last_refill = time.monotonic()
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+
+    async def _take_token(self):
+        """Waits until the token bucket has a token, refilling at requests_per_minute."""
+        if not self.requests_per_minute:
+            return
+        rate = self.requests_per_minute / 60.0
+        capacity = float(self.max_concurrency)
+        async with self._bucket_lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(capacity, self._tokens + (now - self._last_refill) * rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / rate)
+
+    async def __aenter__(self):
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+            try:
+                await self._take_token()
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        """Current in-flight and queued counts plus the configured limits."""
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "max_concurrency": self.max_concurrency,
+            "requests_per_minute": self.requests_per_minute,
+        }
+
+
+llm_limiter = AsyncLimiter(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")) or None,
+)
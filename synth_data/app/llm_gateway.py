@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Type
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+
+from app.cache import SingleFlight
+from app.limiter import llm_limiter
+
+load_dotenv()
+
+# --- Shared LLM Gateway ---
+# Every agent node, tool and endpoint goes through `llm_gateway`. It gives them
+# one pooled HTTP client, a per-call timeout, bounded retries with jittered
+# backoff on 429/5xx, the shared concurrency limiter, and coalescing of identical
+# in-flight requests. The OpenAI SDK's own retries are disabled so the retry
+# budget is defined in one place.
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+LLM_POOL_CONNECTIONS = int(os.getenv("LLM_POOL_CONNECTIONS", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "30"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class LLMUnavailable(Exception):
+    """Raised when an LLM call still fails after all retries (rate limits, 5xx, timeouts)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                          openai.InternalServerError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After header on the failed response, if any."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _backoff(attempt: int, error: BaseException) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+    return max(delay, _retry_after(error) or 0.0)
+
+
+def _prompt_key(model_input: Any) -> str:
+    if hasattr(model_input, "to_string"):
+        return model_input.to_string()
+    return json.dumps(model_input, default=str, sort_keys=True)
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+async def _close_at_loop_shutdown(client: httpx.AsyncClient):
+    """
+    Parked async generator that closes `client` when its loop shuts down async
+    generators (asyncio.run and anyio runners do this before closing the loop).
+    """
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+class LLMGateway:
+    """
+    Shared entry point for chat-model calls. Use `await llm_gateway.ainvoke(prompt)`
+    from async code and `llm_gateway.invoke(prompt)` from sync tools.
+    """
+
+    def __init__(self, model: str = LLM_MODEL):
+        self.model = model
+        self._flight = SingleFlight()
+        self._limits = httpx.Limits(
+            max_connections=LLM_POOL_CONNECTIONS,
+            max_keepalive_connections=LLM_POOL_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+        )
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+        self._async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._models: Dict[float, ChatOpenAI] = {}
+        self._loop_guards = []  # Strong refs; the loop itself only tracks async generators weakly
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.coalesced = 0
+
+    def _clients(self):
+        """
+        The shared sync and async HTTP clients. An AsyncClient's connections belong to
+        the event loop that opened them, so it (and every model holding it) is rebuilt
+        when called from a different running loop; sync callers reuse whatever exists.
+        """
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=self._limits, timeout=LLM_TIMEOUT_SECONDS)
+        loop = _running_loop()
+        if self._http_async_client is None or (loop is not None and loop is not self._async_client_loop):
+            self._retire_async_client()
+            self._http_async_client = httpx.AsyncClient(limits=self._limits, timeout=LLM_TIMEOUT_SECONDS)
+            self._async_client_loop = loop
+            if loop is not None:
+                guard = _close_at_loop_shutdown(self._http_async_client)
+                self._loop_guards.append(guard)
+                asyncio.ensure_future(anext(guard))
+        return self._http_client, self._http_async_client
+
+    def _retire_async_client(self):
+        """
+        Releases the AsyncClient (and the models holding it) from another loop. If that
+        loop still runs in another thread, the client is closed there; a loop that has
+        finished already closed it through its shutdown guard.
+        """
+        client, loop = self._http_async_client, self._async_client_loop
+        self._http_async_client = self._async_client_loop = None
+        self._models.clear()
+        self._loop_guards = [guard for guard in self._loop_guards if guard.ag_frame is not None]
+        if client is not None and loop is not None and loop.is_running() and loop is not _running_loop():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    def chat_model(self, temperature: float = 0.7) -> ChatOpenAI:
+        """A ChatOpenAI bound to the shared HTTP pool; one instance per temperature."""
+        http_client, http_async_client = self._clients()
+        model = self._models.get(temperature)
+        if model is None:
+            model = self._models[temperature] = ChatOpenAI(
+                model=self.model,
+                temperature=temperature,
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=0,
+                http_client=http_client,
+                http_async_client=http_async_client,
+            )
+        return model
+
+    def runnable(self, temperature: float = 0.7, schema: Optional[Type[BaseModel]] = None):
+        model = self.chat_model(temperature)
+        return model.with_structured_output(schema) if schema is not None else model
+
+    def _key(self, model_input: Any, temperature: float, schema: Optional[Type[BaseModel]]) -> str:
+        schema_name = schema.__name__ if schema is not None else ""
+        raw = f"{self.model}|{temperature}|{schema_name}|{_prompt_key(model_input)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def ainvoke(
+        self,
+        model_input: Any,
+        temperature: float = 0.7,
+        schema: Optional[Type[BaseModel]] = None,
+        timeout: Optional[float] = None,
+        coalesce: bool = True,
+    ) -> Any:
+        """
+        Calls the model with retries. With `coalesce`, concurrent calls with the same
+        input share one request; pass False where each call must be an independent
+        sample (e.g. generating distinct patients).
+        """
+        if not coalesce:
+            return await self._ainvoke_with_retries(model_input, temperature, schema, timeout)
+        key = self._key(model_input, temperature, schema)
+        if self._flight.is_in_flight(key):
+            self.coalesced += 1
+        return await self._flight.do(
+            key, lambda: self._ainvoke_with_retries(model_input, temperature, schema, timeout)
+        )
+
+    async def _ainvoke_with_retries(self, model_input, temperature, schema, timeout):
+        runnable = self.runnable(temperature, schema)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            self.calls += 1
+            try:
+                async with llm_limiter:
+                    return await asyncio.wait_for(runnable.ainvoke(model_input), timeout or LLM_TIMEOUT_SECONDS)
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                if attempt == LLM_MAX_RETRIES:
+                    self.failures += 1
+                    raise LLMUnavailable(f"LLM call failed after {attempt + 1} attempts: {e}", _retry_after(e)) from e
+                self.retries += 1
+                delay = _backoff(attempt, e)
+                print(f"LLM call failed ({type(e).__name__}); retrying in {delay:.2f}s.")
+                await asyncio.sleep(delay)
+
+    async def astream(
+        self,
+        model_input: Any,
+        temperature: float = 0.7,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Yields the completion's text chunks as they arrive. Failures before the first
+        chunk are retried like `ainvoke`; once text has been sent they propagate.
+        `timeout` bounds the wait for each chunk rather than the whole completion.
+        """
+        model = self.chat_model(temperature)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            self.calls += 1
+            started = False
+            try:
+                async with llm_limiter:
+                    chunks = model.astream(model_input).__aiter__()
+                    try:
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout or LLM_TIMEOUT_SECONDS)
+                            except StopAsyncIteration:
+                                return
+                            started = True
+                            if chunk.content:
+                                yield chunk.content
+                    finally:
+                        await chunks.aclose()
+            except Exception as e:
+                if started or not _is_retryable(e):
+                    raise
+                if attempt == LLM_MAX_RETRIES:
+                    self.failures += 1
+                    raise LLMUnavailable(f"LLM call failed after {attempt + 1} attempts: {e}", _retry_after(e)) from e
+                self.retries += 1
+                delay = _backoff(attempt, e)
+                print(f"LLM stream failed ({type(e).__name__}); retrying in {delay:.2f}s.")
+                await asyncio.sleep(delay)
+
+    def invoke(
+        self,
+        model_input: Any,
+        temperature: float = 0.7,
+        schema: Optional[Type[BaseModel]] = None,
+    ) -> Any:
+        """Blocking variant for sync tools; same retry policy, no coalescing or async limiter."""
+        runnable = self.runnable(temperature, schema)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            self.calls += 1
+            try:
+                return runnable.invoke(model_input)
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                if attempt == LLM_MAX_RETRIES:
+                    self.failures += 1
+                    raise LLMUnavailable(f"LLM call failed after {attempt + 1} attempts: {e}", _retry_after(e)) from e
+                self.retries += 1
+                time.sleep(_backoff(attempt, e))
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "coalesced": self.coalesced,
+            "timeout_seconds": LLM_TIMEOUT_SECONDS,
+            "max_retries": LLM_MAX_RETRIES,
+            "limiter": llm_limiter.stats(),
+        }
+
+    async def aclose(self):
+        """Closes the pooled HTTP clients (call on shutdown)."""
+        if self._http_async_client is not None and self._async_client_loop in (None, _running_loop()):
+            await self._http_async_client.aclose()
+            self._http_async_client = None
+        self._retire_async_client()
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+
+
+llm_gateway = LLMGateway()
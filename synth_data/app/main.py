@@ -1,19 +1,50 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Response, Request, Header
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import AsyncIterator, List, Optional, Tuple
 import asyncio
 import json
+import os
 import re
+import uuid
 
-from app.models import GenerationRequest, CliniversePatient, PopulationProfile, ChatRequest, AdviceRequest   # Import the necessary models
-from app.agent import app_graph, AgentState, llm
+from app.models import GenerationRequest, CliniversePatient, PopulationProfile, ChatRequest, AdviceRequest, ToDoUpdate   # Import the necessary models
+from app.agent import run_patient_graph, close_checkpointer, purge_checkpoints
+from app.fast_generator import generate_fast_cohort
+from app.limiter import llm_limiter
+from app.llm_gateway import llm_gateway, LLMUnavailable
+from app.semantic_cache import advice_cache, semantic_cache_stats
+from app.prompts import prompt_registry
+from app.context import compact_patient_context
+from app.export import check_export_request, stream_export, EXPORT_CHUNK_SIZE, EXPORT_MEDIA_TYPES
+from app.fhir import patient_bundle
+from app.bulk_import import import_patients_ndjson, IMPORT_BATCH_SIZE
+from app.demographics import sample_demographics, sampler_for_profile, resolve_population_profile
+from app.cache import CacheStats, SingleFlight
+from app.patching import (
+    apply_json_patch, apply_merge_patch, touched_fields, validate_fields, diff,
+    PatchError, JSON_PATCH_MEDIA_TYPE
+)
+from app.jobs import submit_job, cancel_job, start_job_workers, stop_job_workers, stream_job_results
 from app.database import (
     init_db, 
-    get_all_patients_from_db, 
+    add_patients_to_db,
+    list_patients_from_db,
     get_patient_details_from_db,
+    get_patient_with_version_from_db,
+    patch_patient_in_db,
+    VersionConflict,
+    get_patient_section_from_db,
+    update_patient_todo_in_db,
+    PATIENT_SECTIONS,
     update_patient_in_db,
     add_population_profile_to_db,
-    get_all_population_profiles_from_db
+    get_all_population_profiles_from_db,
+    get_population_profile_from_db,
+    get_generation_job,
+    get_cached_population_stats,
+    put_cached_population_stats,
+    count_cached_population_stats
 )
 
 app = FastAPI(
@@ -25,6 +56,7 @@ app = FastAPI(
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Generation-Errors", "X-Generation-Error-Count"],
 )
 # allowed_origins = [
 #     "https://3000-kumar-w.cluster-6uv4xm4q3bh5uv7a4kg6x63de6.cloudworkstations.dev",
@@ -39,31 +71,185 @@ app.add_middleware(
 #     allow_headers=["*"],
 # )
 
+MAX_SYNC_PATIENTS = 50  # Graph mode: one LLM pipeline per patient
+MAX_SYNC_FAST_PATIENTS = int(os.getenv("MAX_SYNC_FAST_PATIENTS", "10000"))  # Fast mode is local and cheap
+MAX_ERROR_HEADER_ENTRIES = 10  # X-Generation-Errors lists at most this many failures...
+MAX_ERROR_HEADER_CHARS = 200   # ...each cut to this length; X-Generation-Error-Count has the total
+
+@app.exception_handler(LLMUnavailable)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailable):
+    """Upstream rate limits and outages that outlast the retries become a 503, not a 500."""
+    headers = {"Retry-After": str(int(exc.retry_after or 5))}
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers=headers)
+
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
+    # Synchronous batches are never resumed, so checkpoints left by a crash are dead weight.
+    purged = await purge_checkpoints("sync:")
+    if purged:
+        print(f"Purged {purged} stale synchronous checkpoint threads.")
+    await start_job_workers()
 
-@app.post("/generate-patients/", response_model=List[CliniversePatient])
-async def generate_patients_endpoint(request: GenerationRequest):
-    """Generates a specified number of synthetic patients."""
-    tasks = [app_graph.ainvoke({}) for _ in range(request.num_patients)]
-    generated_states: List[AgentState] = await asyncio.gather(*tasks)
-    final_patients = [state['cliniverse_patient'] for state in generated_states if 'cliniverse_patient' in state]
-    return final_patients
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_job_workers()
+    await llm_gateway.aclose()
+    await close_checkpointer()
 
 @app.get("/patients/", response_model=List[dict])
-async def list_patients_endpoint():
-    """Returns a summary list of all patients."""
-    return get_all_patients_from_db()
+async def list_patients_endpoint(
+    response: Response,
+    limit: int = Query(500, gt=0, le=5000),
+    after: Optional[str] = None,
+    profile_name: Optional[str] = None,
+    care_pathway: Optional[str] = None,
+    a1c_min: Optional[float] = None,
+    a1c_max: Optional[float] = None,
+    name_prefix: Optional[str] = None,
+):
+    """
+    Returns one page of patient summaries, filtered server-side. When more rows
+    remain, the `X-Next-Cursor` header holds the value to pass as `after`.
+    """
+    patients = await asyncio.to_thread(
+        list_patients_from_db, limit, after, profile_name, care_pathway, a1c_min, a1c_max, name_prefix
+    )
+    if len(patients) == limit:
+        response.headers["X-Next-Cursor"] = patients[-1]["id"]
+    return patients
+
+@app.get("/patients/export")
+async def export_patients_endpoint(
+    format: str = Query("ndjson", description="ndjson, csv or parquet"),
+    table: Optional[str] = Query(None, description="For csv/parquet: patients (default) or a section table such as patient_a1c_points"),
+    chunk_size: int = Query(EXPORT_CHUNK_SIZE, gt=0, le=10000),
+    profile_name: Optional[str] = None,
+    care_pathway: Optional[str] = None,
+    a1c_min: Optional[float] = None,
+    a1c_max: Optional[float] = None,
+    name_prefix: Optional[str] = None,
+):
+    """
+    Streams every matching patient, read from the database in chunks. NDJSON holds
+    full documents; csv/parquet return one flat table per request (see `table`).
+    """
+    try:
+        table = check_export_request(format, table)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    body = stream_export(
+        format, table, chunk_size, profile_name=profile_name, care_pathway=care_pathway,
+        a1c_min=a1c_min, a1c_max=a1c_max, name_prefix=name_prefix,
+    )
+    filename = f"{table}.{format}"
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.post("/patients/import")
+async def import_patients_endpoint(request: Request, batch_size: int = Query(IMPORT_BATCH_SIZE, gt=0, le=10000)):
+    """
+    Upserts patients from a streamed NDJSON body (one CliniversePatient per line).
+    Invalid lines are skipped and reported by line number; valid ones are still saved.
+    """
+    return await import_patients_ndjson(request.stream(), batch_size)
+
+def _etag(version: int) -> str:
+    return f'"{version}"'
+
+def _version_from_if_match(if_match: Optional[str]) -> Optional[int]:
+    if not if_match or if_match.strip() == "*":
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be an ETag returned by this API.")
 
 @app.get("/patients/{patient_id}", response_model=CliniversePatient)
-async def get_patient_endpoint(patient_id: str):
-    """Returns the full details for a single patient."""
-    patient = get_patient_details_from_db(patient_id)
-    if patient:
+async def get_patient_endpoint(patient_id: str, response: Response):
+    """Returns the full details for a single patient, with its version as the ETag."""
+    found = await asyncio.to_thread(get_patient_with_version_from_db, patient_id)
+    if found:
+        patient, version = found
+        response.headers["ETag"] = _etag(version)
         return patient
     raise HTTPException(status_code=404, detail="Patient not found")
 
+@app.get("/patients/{patient_id}/fhir")
+async def get_patient_fhir_endpoint(patient_id: str):
+    """Returns the patient as a FHIR R4 collection Bundle."""
+    patient = await asyncio.to_thread(get_patient_details_from_db, patient_id)
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return JSONResponse(patient_bundle(patient), media_type="application/fhir+json")
+
+@app.patch("/patients/{patient_id}")
+async def patch_patient_endpoint(
+    patient_id: str,
+    request: Request,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+):
+    """
+    Partially updates a patient with a JSON Patch (application/json-patch+json, a
+    list of operations) or a JSON Merge Patch (application/merge-patch+json, an
+    object). Send the ETag from GET as If-Match to reject concurrent edits (412).
+    Responds with the JSON Patch that was actually applied and the new ETag.
+    """
+    try:
+        patch = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be JSON.")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    is_json_patch = content_type == JSON_PATCH_MEDIA_TYPE or isinstance(patch, list)
+    if is_json_patch and not (isinstance(patch, list) and all(isinstance(op, dict) for op in patch)):
+        raise HTTPException(status_code=422, detail="A JSON Patch must be an array of operation objects.")
+    if not is_json_patch and not isinstance(patch, dict):
+        raise HTTPException(status_code=422, detail="A merge patch must be a JSON object.")
+    expected_version = _version_from_if_match(if_match)
+
+    def apply(document: dict) -> dict:
+        if is_json_patch:
+            patched = apply_json_patch(document, patch)
+        else:
+            patched = apply_merge_patch(document, patch)
+        validate_fields(patched, touched_fields(patch, is_json_patch))
+        return patched
+
+    try:
+        result = await asyncio.to_thread(patch_patient_in_db, patient_id, apply, expected_version)
+    except VersionConflict as e:
+        raise HTTPException(status_code=412, detail=str(e))
+    except PatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    old, new, version = result
+    response.headers["ETag"] = _etag(version)
+    return diff(old, new)
+
+@app.get("/patients/{patient_id}/sections/{section}", response_model=List[dict])
+async def get_patient_section_endpoint(patient_id: str, section: str):
+    """Returns one repeating section of a patient (a1cData, toDo, notes or messages)."""
+    if section not in PATIENT_SECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown section '{section}'")
+    items = await asyncio.to_thread(get_patient_section_from_db, patient_id, section)
+    if items is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return items
+
+@app.patch("/patients/{patient_id}/toDo/{todo_id}")
+async def update_patient_todo_endpoint(patient_id: str, todo_id: int, changes: ToDoUpdate):
+    """Updates a single to-do item (e.g. marks it completed) and returns it."""
+    item = await asyncio.to_thread(
+        update_patient_todo_in_db, patient_id, todo_id, changes.model_dump(exclude_unset=True)
+    )
+    if item is None:
+        raise HTTPException(status_code=404, detail="Patient or to-do item not found")
+    return item
+
 @app.put("/patients/{patient_id}", status_code=204)
 async def update_patient_endpoint(patient_id: str, patient_data: CliniversePatient):
     """Updates an existing patient's data in the database."""
@@ -78,22 +264,113 @@ async def update_patient_endpoint(patient_id: str, patient_data: CliniversePatie
         raise HTTPException(status_code=500, detail="Failed to update patient data.")
 
 @app.post("/generate-patients/", response_model=List[CliniversePatient])
-async def generate_patients_endpoint(request: GenerationRequest):
-    """Generates a specified number of synthetic patients based on a profile."""
-    # Pass the profile into the agent invocation
-    tasks = [app_graph.ainvoke({"profile": request.profile,
-                                "profile_name": request.profile_name
-                                }) for _ in range(request.num_patients)]
-    generated_states: List[AgentState] = await asyncio.gather(*tasks)
-    final_patients = [state['cliniverse_patient'] for state in generated_states if 'cliniverse_patient' in state]
+async def generate_patients_endpoint(request: GenerationRequest, response: Response):
+    """
+    Generates a specified number of synthetic patients based on a profile. If some
+    patients fail, the others are still returned and saved; X-Generation-Error-Count
+    holds the number of failures and X-Generation-Errors lists the first few as JSON.
+    """
+    limit = MAX_SYNC_FAST_PATIENTS if request.mode == "fast" else MAX_SYNC_PATIENTS
+    if request.num_patients > limit:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {limit} {request.mode}-mode patients per synchronous request; submit larger cohorts to /jobs/."
+        )
+    if request.mode == "fast":
+        final_patients = await asyncio.to_thread(
+            generate_fast_cohort, request.num_patients, request.seed, request.profile_name
+        )
+        await asyncio.to_thread(add_patients_to_db, final_patients)
+        return final_patients
+
+    # Each patient runs on its own checkpointed thread, so a failing node is retried
+    # without redoing the nodes before it, and one failure does not sink the batch.
+    batch_id = uuid.uuid4().hex
+    profile = await asyncio.to_thread(resolve_population_profile, request.profile, request.profile_name)
+    demographics = await asyncio.to_thread(sample_demographics, profile, request.num_patients, request.seed)
+    inputs = {"profile": request.profile, "profile_name": request.profile_name, "defer_save": True}
+    generated_states = await asyncio.gather(
+        *(run_patient_graph(f"sync:{batch_id}:{i}", {**inputs, "demographics": demographics[i]}, resumable=False)
+          for i in range(request.num_patients)),
+        return_exceptions=True
+    )
+    final_patients, errors = [], []
+    for i, state in enumerate(generated_states):
+        if isinstance(state, BaseException):
+            errors.append({"index": i, "error": str(state)[:300]})
+        elif 'cliniverse_patient' in state:
+            final_patients.append(state['cliniverse_patient'])
+        else:
+            errors.append({"index": i, "error": "Graph finished without a formatted patient."})
+    if not final_patients and errors:
+        raise HTTPException(status_code=502, detail={"message": "Every patient failed to generate.", "errors": errors})
+    await asyncio.to_thread(add_patients_to_db, final_patients)
+    if errors:
+        # The body stays a plain patient list; failures are reported alongside it,
+        # capped so the header stays well under proxy header-size limits.
+        response.headers["X-Generation-Error-Count"] = str(len(errors))
+        response.headers["X-Generation-Errors"] = json.dumps(
+            [{**e, "error": e["error"][:MAX_ERROR_HEADER_CHARS]} for e in errors[:MAX_ERROR_HEADER_ENTRIES]]
+        )
     return final_patients
 
 
-@app.get("/population-stats/{condition}")
-async def get_population_stats(condition: str):
+@app.post("/jobs/", status_code=202)
+async def submit_generation_job(request: GenerationRequest):
+    """Queues a generation job and returns its id immediately."""
+    return await asyncio.to_thread(submit_job, request)
+
+@app.get("/jobs/{job_id}")
+async def get_generation_job_endpoint(job_id: str):
+    """Returns a job's status and progress counts."""
+    job = await asyncio.to_thread(get_generation_job, job_id)
+    if job:
+        return job
+    raise HTTPException(status_code=404, detail="Job not found")
+
+@app.get("/jobs/{job_id}/results")
+async def stream_generation_job_results(job_id: str, after: int = 0, follow: bool = True):
     """
-    Gets population statistics for a given condition from OpenAI.
+    Streams per-patient results as NDJSON. Each line carries a `cursor`; reconnect
+    with `?after=<cursor>` to resume. The last line is a job summary.
     """
+    if not await asyncio.to_thread(get_generation_job, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(stream_job_results(job_id, after, follow), media_type="application/x-ndjson")
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_generation_job(job_id: str):
+    """Cancels a queued or running job. Patients already generated are kept."""
+    if not await asyncio.to_thread(cancel_job, job_id):
+        raise HTTPException(status_code=409, detail="Job not found or already finished")
+    return await asyncio.to_thread(get_generation_job, job_id)
+
+
+@app.get("/generation-limiter/")
+async def get_generation_limiter_stats():
+    """Returns in-flight and queued counts for the shared LLM limiter."""
+    return llm_limiter.stats()
+
+@app.get("/llm-gateway/")
+async def get_llm_gateway_stats():
+    """Returns call, retry, failure and coalescing counters for the shared LLM gateway."""
+    return llm_gateway.stats()
+
+
+# --- Population Stats (cached) ---
+# Bump the prompt version whenever the prompt below changes so stale entries miss.
+POPULATION_STATS_PROMPT_VERSION = "v1"
+POPULATION_STATS_TTL_SECONDS = float(os.getenv("POPULATION_STATS_TTL_SECONDS", str(7 * 24 * 3600)))
+POPULATION_STATS_CACHE_MAX = int(os.getenv("POPULATION_STATS_CACHE_MAX", "256"))
+population_stats_cache_stats = CacheStats()
+population_stats_flight = SingleFlight()
+
+def _population_stats_key(condition: str) -> str:
+    normalized = " ".join(condition.lower().split())
+    return f"{POPULATION_STATS_PROMPT_VERSION}:{normalized}"
+
+async def _fetch_population_stats(condition: str) -> dict:
+    """Asks the LLM for population statistics and parses its JSON answer."""
     prompt = f"""
     Provide population statistics and common co-morbidities for "{condition}" in the US.
     Return a single, valid JSON object and nothing else.
@@ -114,7 +391,7 @@ async def get_population_stats(condition: str):
     Ensure the percentages for each category sum to 100. Provide realistic, data-informed estimates.
     """
     
-    response = llm.invoke(prompt)
+    response = await llm_gateway.ainvoke(prompt)
     try:
         # FIX: Clean the string before parsing
         json_str = response.content
@@ -133,6 +410,45 @@ async def get_population_stats(condition: str):
         raise HTTPException(status_code=500, detail=f"Failed to parse JSON from LLM response {response.content}")
 
 
+@app.get("/population-stats/{condition}")
+async def get_population_stats(condition: str):
+    """
+    Gets population statistics for a given condition, from the cache when possible.
+    Concurrent misses for the same condition share one LLM call.
+    """
+    key = _population_stats_key(condition)
+    cached = await asyncio.to_thread(get_cached_population_stats, key, POPULATION_STATS_TTL_SECONDS)
+    if cached is not None:
+        population_stats_cache_stats.hits += 1
+        return cached
+
+    if population_stats_flight.is_in_flight(key):
+        population_stats_cache_stats.coalesced += 1
+    else:
+        population_stats_cache_stats.misses += 1
+
+    async def fetch_and_store():
+        stats = await _fetch_population_stats(condition)
+        await asyncio.to_thread(
+            put_cached_population_stats, key, condition, POPULATION_STATS_PROMPT_VERSION,
+            stats, POPULATION_STATS_CACHE_MAX
+        )
+        return stats
+
+    return await population_stats_flight.do(key, fetch_and_store)
+
+@app.get("/population-stats-cache/")
+async def get_population_stats_cache_stats():
+    """Returns hit/miss counters and the current size of the population stats cache."""
+    size = await asyncio.to_thread(count_cached_population_stats)
+    return {**population_stats_cache_stats.as_dict(), "entries": size, "max_entries": POPULATION_STATS_CACHE_MAX}
+
+@app.get("/llm-response-cache/")
+async def get_llm_response_cache_stats():
+    """Returns exact and near-duplicate hit counters for the behavioral advice and barrier caches."""
+    return await asyncio.to_thread(semantic_cache_stats)
+
+
 @app.post("/population-profiles/", status_code=201)
 async def create_population_profile(profile: PopulationProfile):
     """Saves a new population profile to the database."""
@@ -144,50 +460,122 @@ async def list_population_profiles_endpoint():
     """Returns a list of all saved population profiles."""
     return get_all_population_profiles_from_db()
 
-from langchain_openai import ChatOpenAI
-llm = ChatOpenAI(model="gpt-4o", temperature=0.7)
+@app.get("/population-profiles/{name}/marginals")
+async def population_profile_marginals(
+    name: str,
+    n: int = Query(1000, gt=0, le=1_000_000),
+    seed: Optional[int] = None,
+    stratified: bool = True,
+):
+    """Samples `n` patients from a saved profile and compares the cohort's marginals to the target."""
+    profile = await asyncio.to_thread(get_population_profile_from_db, name)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Population profile not found")
+    sampler = sampler_for_profile(profile)
+    sample = await asyncio.to_thread(sampler.sample, n, seed, stratified)
+    return sampler.marginals_report(sample)
+
+def _chat_messages(request: ChatRequest) -> Tuple[list, dict]:
+    """Builds the system + user messages for /chat and the context compaction stats."""
+    patient_context, context_stats = compact_patient_context(request.patient)
+    system_prompt = prompt_registry.get("chat").render(patient_data=patient_context)
+    return [("system", system_prompt), ("user", request.user_prompt)], context_stats
+
 @app.post("/chat")
 async def chat_with_patient_data(request: ChatRequest):
-    """Handles chat requests by loading a system prompt from a file."""
+    """Answers a question about a patient using the chat prompt and a compacted patient context."""
     try:
-        # 1. Read the prompt template from the file
-        with open('chat_prompt.txt', 'r') as f:
-            prompt_template = f.read()
-
-        print(f"Loaded prompt template: {prompt_template[:100]}...")  # Debugging line to check the template
-        # 2. Format the template with the patient data from the request
-        print(f"Patient data: {request.patient}")  # Debugging line to check the 
-        patient_json_string = json.dumps(request.patient, indent=2)
-        system_prompt = prompt_template.replace('{patient_data}', patient_json_string)
-
-        # 3. Call the LLM with the formatted prompt
-        messages = [
-            ("system", system_prompt),
-            ("user", request.user_prompt)
-        ]
-        response = llm.invoke(messages)
-
-        return {"response": response.content}
+        messages, context_stats = _chat_messages(request)
+        response = await llm_gateway.ainvoke(messages)
+        return {"response": response.content, "context": context_stats}
         
+    except LLMUnavailable:
+        raise
     except FileNotFoundError:
         raise HTTPException(status_code=500, detail="chat_prompt.txt not found.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
+def _advice_prompt(request: AdviceRequest) -> str:
+    if request.is_for_provider:
+        return f"""A patient is struggling with this: "{request.prompt}". As a behavioral change coach, provide 3 distinct, ranked suggestions based on the BeST framework. For each suggestion, provide: 1. The core advice for the patient (as a single paragraph). 2. The primary Barrier it addresses. 3. The main Strategy used. 4. The key Tactic applied. Format each suggestion starting with "SUGGESTION:", followed by "ADVICE:", "BARRIER:", "STRATEGY:", and "TACTIC:" on new lines."""
+    return f"""As a behavioral change coach, provide concise, actionable advice for the following user question: "{request.prompt}". Use the BeST framework (Barriers, Strategies, Tactics) to structure your answer if applicable. Use markdown for formatting (bolding with **, lists with *)."""
+
+def _advice_variant(request: AdviceRequest) -> str:
+    # Provider and patient phrasings are cached separately.
+    return "provider" if request.is_for_provider else "patient"
+
 @app.post("/api/behavioral-advice")
 async def get_behavioral_advice(request: AdviceRequest):
     """
     Generates behavioral change advice using an LLM based on a prompt.
+    Near-identical questions are served from the semantic cache.
     """
     try:
-        full_prompt = ""
-        if request.is_for_provider:
-            full_prompt = f"""A patient is struggling with this: "{request.prompt}". As a behavioral change coach, provide 3 distinct, ranked suggestions based on the BeST framework. For each suggestion, provide: 1. The core advice for the patient (as a single paragraph). 2. The primary Barrier it addresses. 3. The main Strategy used. 4. The key Tactic applied. Format each suggestion starting with "SUGGESTION:", followed by "ADVICE:", "BARRIER:", "STRATEGY:", and "TACTIC:" on new lines."""
-        else:
-            full_prompt = f"""As a behavioral change coach, provide concise, actionable advice for the following user question: "{request.prompt}". Use the BeST framework (Barriers, Strategies, Tactics) to structure your answer if applicable. Use markdown for formatting (bolding with **, lists with *)."""
+        async def ask_llm():
+            response = await llm_gateway.ainvoke(_advice_prompt(request))
+            return {"advice": response.content}
+
+        return await advice_cache.get_or_compute(request.prompt, ask_llm, _advice_variant(request))
+    except LLMUnavailable:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error during LLM call: {str(e)}")
+
 
-        response = llm.invoke(full_prompt)
-        return {"advice": response.content}
+# --- Streaming (Server-Sent Events) ---
+# Each text chunk is sent as `data: {"delta": ...}` as soon as the model produces
+# it; the stream ends with an `event: done` carrying the full text, or an
+# `event: error` if the model fails midway.
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def _stream_completion(model_input, result_key: str, on_complete=None,
+                             extra: Optional[dict] = None) -> AsyncIterator[str]:
+    parts = []
+    try:
+        async for text in llm_gateway.astream(model_input):
+            parts.append(text)
+            yield _sse({"delta": text})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error during LLM call: {str(e)}")
\ No newline at end of file
+        yield _sse({"detail": str(e)}, event="error")
+        return
+    result = {result_key: "".join(parts)}
+    if on_complete is not None:
+        await on_complete(result)
+    yield _sse({**result, **(extra or {})}, event="done")
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.post("/chat/stream")
+async def stream_chat_with_patient_data(request: ChatRequest):
+    """Streaming variant of /chat as text/event-stream."""
+    try:
+        messages, context_stats = _chat_messages(request)
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="chat_prompt.txt not found.")
+    return StreamingResponse(_stream_completion(messages, "response", extra={"context": context_stats}),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/api/behavioral-advice/stream")
+async def stream_behavioral_advice(request: AdviceRequest):
+    """
+    Streaming variant of /api/behavioral-advice as text/event-stream. A cache hit
+    is sent as a single delta; a streamed answer is added to the cache when done.
+    """
+    variant = _advice_variant(request)
+    cached = await asyncio.to_thread(advice_cache.lookup, request.prompt, variant)
+    if cached is not None:
+        async def replay():
+            yield _sse({"delta": cached["advice"]})
+            yield _sse(cached, event="done")
+        return StreamingResponse(replay(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    async def store(result: dict):
+        await asyncio.to_thread(advice_cache.store, request.prompt, result, variant)
+
+    return StreamingResponse(_stream_completion(_advice_prompt(request), "advice", store),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
\ No newline at end of file
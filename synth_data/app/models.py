@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field 
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Literal
 
 # --- Original Agent Models (used for intermediate steps) ---
 
@@ -26,9 +26,11 @@ class SyntheticPatient(BaseModel):
     journey_log: List[JourneyLogEntry]
 
 class GenerationRequest(BaseModel):
-    num_patients: int = Field(default=1, gt=0, le=50, description="Number of synthetic patients to generate.")
+    num_patients: int = Field(default=1, gt=0, le=10000, description="Number of synthetic patients to generate. Synchronous 'llm' requests above 50 must go through /jobs/; 'fast' mode allows up to 10000.")
     profile: Optional[Dict] = None
     profile_name: Optional[str] = 'default'
+    mode: Literal['llm', 'fast'] = Field(default='llm', description="'llm' runs the full agent graph; 'fast' builds patients from local templates with no network calls.")
+    seed: Optional[int] = Field(default=None, description="Reproducibility seed. In 'fast' mode the same seed reproduces the same cohort; in 'llm' mode it only fixes the demographics drawn from the profile, since the LLM output still varies.")
 
 class PopulationProfile(BaseModel):
     name: str = Field(description="The unique name of the population profile.")
@@ -79,6 +81,12 @@ class Note(BaseModel):
     plan: str = Field(description="The plan part of a SOAP note.")
     updated: str = Field(description="A relative time string for when the note was updated.")
 
+class ToDoUpdate(BaseModel):
+    """Partial update for a single to-do item; omitted fields are left unchanged."""
+    text: Optional[str] = None
+    priority: Optional[str] = None
+    completed: Optional[bool] = None
+
 class CareTeamMember(BaseModel):
     name: str = Field(description="The full name of the care team member.")
     role: str = Field(description="The role of the care team member (e.g., 'Health coach', 'Registered dietitian').")
@@ -96,8 +104,19 @@ class CliniversePatient(BaseModel):
     careTeam: List[CareTeamMember]
     messages: List[Message]
     profile_name: Optional[str] = Field(None, description="The name of the population profile used for generation.")
+    care_pathway: Optional[str] = Field(None, description="The care pathway the patient was simulated on, e.g. 'T2D_HighRisk'.")
     # Surveys can be added here if needed in the future.
 
+# --- Formatter Section Models ---
+# The formatter node asks the LLM for each narrative section separately, so an
+# invalid section is regenerated on its own. carePlan uses CarePlan directly.
+
+class NotesSection(BaseModel):
+    notes: List[Note] = Field(description="Two or three SOAP notes from the care journey, oldest first.")
+
+class MessagesSection(BaseModel):
+    messages: List[Message] = Field(description="A back-and-forth message thread between the patient and care team members, oldest first.")
+
 class ChatRequest(BaseModel):
     user_prompt: str
     patient: Optional[dict] = None # Make patient optional and default to None
@@ -0,0 +1,88 @@
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Set
+
+import jsonpatch
+from pydantic import TypeAdapter
+
+from app.models import CliniversePatient
+
+# --- Patient Patching ---
+# JSON Patch (RFC 6902) and JSON Merge Patch (RFC 7396) support for PATCH
+# /patients/{id}. Only the top-level fields a patch touches are re-validated,
+# instead of the whole CliniversePatient.
+
+JSON_PATCH_MEDIA_TYPE = "application/json-patch+json"
+MERGE_PATCH_MEDIA_TYPE = "application/merge-patch+json"
+
+
+class PatchError(ValueError):
+    """Raised when a patch cannot be applied or produces an invalid patient."""
+
+
+def apply_json_patch(document: Dict, operations: List[Dict]) -> Dict:
+    try:
+        return jsonpatch.apply_patch(document, operations, in_place=True)
+    except (jsonpatch.JsonPatchException, jsonpatch.JsonPointerException, TypeError) as e:
+        raise PatchError(str(e)) from e
+
+
+def apply_merge_patch(target: Any, patch: Any) -> Any:
+    """RFC 7396: objects merge recursively, null deletes a key, anything else replaces."""
+    if not isinstance(patch, dict):
+        return patch
+    if not isinstance(target, dict):
+        target = {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = apply_merge_patch(target.get(key), value)
+    return target
+
+
+def touched_fields(patch: Any, is_json_patch: bool) -> Set[str]:
+    """Top-level CliniversePatient keys a patch can change."""
+    if not is_json_patch:
+        return set(patch) if isinstance(patch, dict) else set(CliniversePatient.model_fields)
+    fields = set()
+    for op in patch:
+        for pointer in (op.get("path"), op.get("from")):
+            if pointer is None:
+                continue
+            if pointer == "":
+                return set(CliniversePatient.model_fields)  # Whole-document operation
+            fields.add(pointer.split("/")[1].replace("~1", "/").replace("~0", "~"))
+    return fields
+
+
+@lru_cache(maxsize=None)
+def _field_adapter(field: str) -> TypeAdapter:
+    return TypeAdapter(CliniversePatient.model_fields[field].annotation)
+
+
+def validate_fields(document: Any, fields: Iterable[str]) -> None:
+    """
+    Validates only the given top-level fields of a patient document and replaces
+    each with its validated form, so coerced values (e.g. "yes" -> True) are stored
+    with their real types.
+    """
+    if not isinstance(document, dict):
+        raise PatchError("The patched patient must be a JSON object.")
+    for field in fields:
+        if field not in CliniversePatient.model_fields:
+            raise PatchError(f"Unknown patient field '{field}'.")
+        model_field = CliniversePatient.model_fields[field]
+        if field not in document:
+            if model_field.is_required():
+                raise PatchError(f"Field '{field}' is required.")
+            continue
+        adapter = _field_adapter(field)
+        try:
+            document[field] = adapter.dump_python(adapter.validate_python(document[field]), mode="json", by_alias=True)
+        except ValueError as e:
+            raise PatchError(f"Invalid value for '{field}': {e}") from e
+
+
+def diff(old: Dict, new: Dict) -> List[Dict]:
+    """The minimal JSON Patch that turns `old` into `new`."""
+    return jsonpatch.make_patch(old, new).patch
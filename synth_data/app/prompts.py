@@ -0,0 +1,68 @@
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# --- Prompt Registry ---
+# Prompt templates are read from disk once, split into literal text and
+# `{placeholder}` slots, and re-read only when the file's mtime changes. Paths
+# resolve against the synth_data directory, not the process's working directory.
+
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PROMPT_FILES = {
+    "chat": "chat_prompt.txt",
+}
+
+_PLACEHOLDER = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+
+class PromptTemplate:
+    """A template pre-split into literal parts and placeholder names."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(text):
+            self._parts.append((text[position:match.start()], match.group(1)))
+            position = match.end()
+        self._parts.append((text[position:], None))
+        self.placeholders = [name for _, name in self._parts if name]
+
+    def render(self, **values: str) -> str:
+        """Fills the placeholders; any placeholder without a value is left as written."""
+        out = []
+        for literal, name in self._parts:
+            out.append(literal)
+            if name is not None:
+                out.append(values[name] if name in values else "{" + name + "}")
+        return "".join(out)
+
+
+class PromptRegistry:
+    """Named prompt templates loaded from PROMPTS_DIR and reloaded when edited."""
+
+    def __init__(self, files: Dict[str, str] = PROMPT_FILES, directory: str = PROMPTS_DIR):
+        self.paths = {name: os.path.join(directory, filename) for name, filename in files.items()}
+        self._lock = threading.Lock()
+        self._templates: Dict[str, Tuple[int, PromptTemplate]] = {}
+        self.loads = 0
+
+    def get(self, name: str) -> PromptTemplate:
+        """Raises KeyError for unknown names and FileNotFoundError if the file is missing."""
+        path = self.paths[name]
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = self._templates.get(name)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        with self._lock:
+            cached = self._templates.get(name)
+            if cached is None or cached[0] != mtime_ns:
+                with open(path, "r", encoding="utf-8") as f:
+                    cached = (mtime_ns, PromptTemplate(f.read()))
+                self._templates[name] = cached
+                self.loads += 1
+            return cached[1]
+
+
+prompt_registry = PromptRegistry()
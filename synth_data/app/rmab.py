@@ -0,0 +1,318 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# --- Vectorized RMAB Engine ---
+# Restless multi-armed bandit simulation behind RMABTool. Arm states live in one
+# NumPy array; each step draws the noisy observations, picks the top-K arms with
+# argpartition and applies the active/passive multipliers in place, so a step is
+# O(n) with no Python-level work per arm.
+
+POLICIES = ("myopic", "whittle", "random")
+
+
+WHITTLE_GRID_POINTS = 65     # State grid on [0, 1] for the per-arm Bellman solve
+WHITTLE_EFFECT_POINTS = 17   # Effect values tabulated when arms differ; others are interpolated
+WHITTLE_BISECTIONS = 40
+
+
+def _arm_values(subsidy: np.ndarray, effects: np.ndarray, decay: float, discount: float):
+    """
+    Optimal discounted cost on the state grid for one arm per row, when resting is
+    paid `subsidy`. Both actions shrink the state (effects are clipped to <= 1), so
+    each grid point only depends on smaller ones plus a self-loop from the linear
+    interpolation, and one ascending sweep solves the Bellman equation exactly.
+    Returns the active and passive action costs at state 1.
+    """
+    points = WHITTLE_GRID_POINTS
+    grid = np.linspace(0.0, 1.0, points)
+    rows = np.arange(len(effects))
+    values = np.zeros((len(effects), points))
+    for j in range(points):
+        costs = []
+        for multiplier, paid in ((effects, 0.0), (np.full(len(effects), decay), subsidy)):
+            position = multiplier * j
+            lower = np.minimum(np.floor(position).astype(int), points - 2)
+            weight = position - lower
+            upper = lower + 1
+            self_weight = np.where(lower == j, 1 - weight, 0.0) + np.where(upper == j, weight, 0.0)
+            known = (np.where(lower < j, (1 - weight) * values[rows, np.minimum(lower, j)], 0.0)
+                     + np.where(upper < j, weight * values[rows, np.minimum(upper, j)], 0.0))
+            costs.append((grid[j] - paid + discount * known) / (1 - discount * self_weight))
+        values[:, j] = np.minimum(*costs)
+    return costs[0], costs[1]
+
+
+@lru_cache(maxsize=64)
+def _unit_whittle_indices(effects: Tuple[float, ...], decay: float, discount: float) -> np.ndarray:
+    """Whittle index at state 1 for each effect: the subsidy for resting at which both actions cost the same."""
+    effects_array = np.clip(np.array(effects), 0.0, 1.0)
+    bound = 1.0 / (1.0 - discount) if discount < 1 else 1e6
+    low, high = np.full(len(effects), -bound), np.full(len(effects), bound)
+    for _ in range(WHITTLE_BISECTIONS):
+        subsidy = (low + high) / 2
+        active, passive = _arm_values(subsidy, effects_array, decay, discount)
+        treat = active < passive  # Still worth treating: the subsidy has to rise
+        low = np.where(treat, subsidy, low)
+        high = np.where(treat, high, subsidy)
+    return (low + high) / 2
+
+
+def whittle_unit_index(effect: np.ndarray, decay: float, discount: float) -> np.ndarray:
+    """
+    Per-arm Whittle index of an arm at state 1. Costs and dynamics are both
+    proportional to the state, so an arm's index at state s is s times this.
+    Identical arms are solved once; otherwise the index is solved on a grid of
+    effect values and interpolated.
+    """
+    effect = np.asarray(effect, dtype=float)
+    if effect.size == 0:
+        return effect.copy()
+    low, high = float(effect.min()), float(effect.max())
+    if high - low < 1e-12:
+        return np.full(effect.shape, _unit_whittle_indices((low,), float(decay), float(discount))[0])
+    table = np.linspace(low, high, WHITTLE_EFFECT_POINTS)
+    return np.interp(effect, table, _unit_whittle_indices(tuple(table), float(decay), float(discount)))
+
+
+def whittle_index(states: np.ndarray, effect: np.ndarray, decay: float, discount: float) -> np.ndarray:
+    """
+    Whittle index for arms whose state (cost, 1 = worst) is multiplied by `effect`
+    when treated and by `decay` when resting: the subsidy for resting at which
+    treating and resting cost the same, found by bisection on a numerical solve of
+    each arm's discounted-cost Bellman equation. Where treatment shrinks the state
+    faster than rest, this equals the closed form beta * s * (decay - effect) /
+    (1 - beta * decay); arms whose treatment is no better than rest rank last.
+    """
+    return states * whittle_unit_index(effect, decay, discount)
+
+
+def simulate_rmab(
+    num_patients: int,
+    horizon: int,
+    budget: int,
+    decay: float = 0.95,
+    noise: float = 0.1,
+    policy: str = "myopic",
+    seed: Optional[int] = 42,
+    effect: float = 0.7,
+    effect_spread: float = 0.0,
+    discount: float = 0.9,
+    initial_states: Optional[np.ndarray] = None,
+    return_states: bool = False,
+) -> Dict:
+    """
+    Simulates `horizon` steps of treating `budget` arms per step.
+    Args:
+        policy: "myopic" treats the highest observed states, "whittle" the highest
+            Whittle indices (observed state times the arm's index at state 1,
+            solved once per run) and "random" a uniform sample.
+        seed: Seed for a local NumPy Generator; global NumPy state is untouched.
+        effect: State multiplier for treated arms. With `effect_spread` > 0 each
+            arm gets its own multiplier drawn from effect +/- effect_spread, which
+            is where the Whittle policy differs from the myopic one.
+        initial_states: Optional starting states (copied); drawn uniformly in [0, 1) otherwise.
+        return_states: Include the final per-arm states array.
+    Returns:
+        Per-step arrays (`mean_state`, `treated_mean_state`), per-arm `times_treated`
+        and summary stats.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy '{policy}'. Expected one of {POLICIES}.")
+    rng = np.random.default_rng(seed)
+    if initial_states is None:
+        states = rng.random(num_patients)
+    else:
+        states = np.array(initial_states, dtype=float)
+        num_patients = len(states)
+    budget = max(0, min(budget, num_patients))
+
+    if effect_spread > 0:
+        effects = np.clip(rng.uniform(effect - effect_spread, effect + effect_spread, num_patients), 0.0, None)
+    else:
+        effects = np.full(num_patients, effect)
+    multiplier = np.full(num_patients, decay)
+    times_treated = np.zeros(num_patients, dtype=np.int32)
+    mean_state = np.empty(horizon)
+    treated_mean_state = np.empty(horizon)
+    observed = np.empty(num_patients)
+    unit_index = whittle_unit_index(effects, decay, discount) if policy == "whittle" else None
+
+    for t in range(horizon):
+        if budget == 0:
+            selected = np.empty(0, dtype=np.intp)
+        elif policy == "random":
+            selected = rng.choice(num_patients, size=budget, replace=False)
+        else:
+            rng.standard_normal(num_patients, out=observed)
+            observed *= noise
+            observed += states
+            scores = observed if policy == "myopic" else np.maximum(observed, 0.0, out=observed) * unit_index
+            selected = np.argpartition(scores, num_patients - budget)[num_patients - budget:]
+
+        treated_mean_state[t] = states[selected].mean() if budget else np.nan
+        multiplier[selected] = effects[selected]
+        states *= multiplier
+        multiplier[selected] = decay
+        times_treated[selected] += 1
+        mean_state[t] = states.mean()
+
+    result = {
+        "policy": policy,
+        "mean_state": mean_state,
+        "treated_mean_state": treated_mean_state,
+        "times_treated": times_treated,
+        "final_mean_state": float(states.mean()),
+        "final_p90_state": float(np.quantile(states, 0.9)) if num_patients else 0.0,
+        "cumulative_cost": float(mean_state.sum()),
+        "treated_share": float(np.count_nonzero(times_treated) / num_patients) if num_patients else 0.0,
+    }
+    if return_states:
+        result["final_states"] = states
+    return result
+
+
+def compare_policies(num_patients: int, horizon: int, budget: int, **kwargs) -> Dict[str, Dict]:
+    """Runs every policy from the same seed and initial states; returns summary stats per policy."""
+    rng = np.random.default_rng(kwargs.pop("seed", 42))
+    initial_states = rng.random(num_patients)
+    seed = int(rng.integers(2**32))
+    summaries = {}
+    for policy in POLICIES:
+        run = simulate_rmab(num_patients, horizon, budget, policy=policy, seed=seed,
+                            initial_states=initial_states, **kwargs)
+        summaries[policy] = {key: run[key] for key in ("final_mean_state", "final_p90_state",
+                                                       "cumulative_cost", "treated_share")}
+    return summaries
+
+
+# --- Parameter Sweeps ---
+# Runs a grid of configurations x replicate seeds across a process pool. Initial
+# states for each (num_patients, replicate) are drawn once in the parent and shared
+# with the workers through shared memory, so every configuration in a replicate
+# starts from the same cohort and nothing large is pickled per task.
+
+RMAB_SWEEP_WORKERS = int(os.getenv("RMAB_SWEEP_WORKERS", str(os.cpu_count() or 1)))
+SWEEP_METRICS = ("final_mean_state", "final_p90_state", "cumulative_cost", "treated_share")
+SIMULATION_PARAMS = ("horizon", "budget", "decay", "noise", "policy", "effect", "effect_spread", "discount")
+
+# Two-sided 95% Student t critical values, exact for df <= 30. Between tabulated
+# values the next lower df is used, which is the larger (conservative) value.
+_T_CRITICAL_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+                  9: 2.262, 10: 2.228, 11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131,
+                  16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086, 21: 2.080, 22: 2.074,
+                  23: 2.069, 24: 2.064, 25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045,
+                  30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980}
+
+_shared_states: Dict[int, np.ndarray] = {}
+_shared_blocks: List[shared_memory.SharedMemory] = []
+
+
+def _t_critical(df: int) -> float:
+    tabulated = [bound for bound in _T_CRITICAL_95 if bound <= df]
+    return _T_CRITICAL_95[max(tabulated)] if tabulated else _T_CRITICAL_95[1]
+
+
+def rmab_grid(base: Dict, **axes: Iterable) -> List[Dict]:
+    """Cartesian product of `axes` over a base config, e.g. rmab_grid(base, budget=[10, 50], decay=[0.9, 0.95])."""
+    names = list(axes)
+    return [{**base, **dict(zip(names, values))} for values in itertools.product(*axes.values())]
+
+
+def _attach_shared_states(blocks: Dict[int, Tuple[str, Tuple[int, int]]]):
+    """Pool initializer: maps each num_patients to its (replicates x n) shared array."""
+    for num_patients, (name, shape) in blocks.items():
+        block = shared_memory.SharedMemory(name=name)
+        _shared_blocks.append(block)
+        _shared_states[num_patients] = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+
+
+def _release_shared_states():
+    _shared_states.clear()
+    for block in _shared_blocks:
+        block.close()
+    _shared_blocks.clear()
+
+
+def _run_sweep_task(task: Tuple[int, int, Dict, int]) -> Tuple[int, Dict[str, float]]:
+    config_index, replicate, config, seed = task
+    initial_states = _shared_states[config["num_patients"]][replicate]
+    params = {key: config[key] for key in SIMULATION_PARAMS if key in config}
+    run = simulate_rmab(config["num_patients"], seed=seed, initial_states=initial_states, **params)
+    return config_index, {metric: run[metric] for metric in SWEEP_METRICS}
+
+
+def run_rmab_sweep(
+    configs: Sequence,
+    replicates: int = 5,
+    seeds: Optional[Sequence[int]] = None,
+    max_workers: Optional[int] = None,
+) -> List[Dict]:
+    """
+    Simulates every configuration once per replicate seed and aggregates the runs.
+    Args:
+        configs: RMABInput models or dicts with the same fields. Their `seed` is
+            ignored; replicate seeds are used instead.
+        replicates: Number of replicates when `seeds` is not given (seeds 0..n-1).
+        seeds: Explicit replicate seeds. Replicate r of every configuration shares
+            the same initial states and noise seed (common random numbers).
+        max_workers: Process count; defaults to RMAB_SWEEP_WORKERS. 1 runs in-process.
+    Returns:
+        One row per configuration: its parameters, `replicates`, and for each metric
+        `<metric>_mean`, `<metric>_std` and a 95% `<metric>_ci_low`/`<metric>_ci_high`.
+    """
+    configs = [dict(c) if isinstance(c, dict) else c.model_dump() for c in configs]
+    seeds = list(seeds) if seeds is not None else list(range(replicates))
+    workers = max_workers or RMAB_SWEEP_WORKERS
+
+    owned, blocks = [], {}
+    try:
+        for num_patients in sorted({c["num_patients"] for c in configs}):
+            shape = (len(seeds), num_patients)
+            block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+            owned.append(block)
+            states = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+            for r, seed in enumerate(seeds):
+                states[r] = np.random.default_rng([seed, num_patients]).random(num_patients)
+            blocks[num_patients] = (block.name, shape)
+
+        tasks = [(i, r, config, seed) for i, config in enumerate(configs) for r, seed in enumerate(seeds)]
+        if workers <= 1:
+            _attach_shared_states(blocks)
+            try:
+                outcomes = [_run_sweep_task(task) for task in tasks]
+            finally:
+                _release_shared_states()
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared_states,
+                                     initargs=(blocks,)) as pool:
+                outcomes = list(pool.map(_run_sweep_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    finally:
+        for block in owned:
+            block.close()
+            block.unlink()
+
+    runs: Dict[int, List[Dict[str, float]]] = {}
+    for config_index, metrics in outcomes:
+        runs.setdefault(config_index, []).append(metrics)
+    return [_aggregate(config, runs[i]) for i, config in enumerate(configs)]
+
+
+def _aggregate(config: Dict, runs: List[Dict[str, float]]) -> Dict:
+    row = {key: value for key, value in config.items() if key != "seed"}
+    row["replicates"] = len(runs)
+    for metric in SWEEP_METRICS:
+        values = np.array([run[metric] for run in runs])
+        mean = float(values.mean())
+        std = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+        half_width = _t_critical(len(values) - 1) * std / len(values) ** 0.5 if len(values) > 1 else 0.0
+        row[f"{metric}_mean"] = mean
+        row[f"{metric}_std"] = std
+        row[f"{metric}_ci_low"] = mean - half_width
+        row[f"{metric}_ci_high"] = mean + half_width
+    return row
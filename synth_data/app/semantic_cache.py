@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import os
+import re
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.cache import CacheStats, SingleFlight
+from app.database import (
+    get_cached_llm_response,
+    find_cached_llm_response_candidates,
+    put_cached_llm_response,
+    count_cached_llm_responses,
+)
+
+# --- Semantic Response Cache ---
+# Caches LLM answers for free-text coaching prompts in SQLite. A lookup first tries
+# an exact match on the normalized prompt, then a near-duplicate match: prompts are
+# reduced to stemmed content tokens, summarized as a MinHash signature, and bucketed
+# with LSH bands so only prompts sharing a band are compared. No embeddings needed.
+
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.6"))
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 Jaccard almost always share a band
+_ROWS_PER_BAND = NUM_PERMUTATIONS // LSH_BANDS
+_MERSENNE_PRIME = (1 << 31) - 1
+_perm_rng = np.random.default_rng(1234)  # Fixed so stored signatures stay comparable
+_PERM_A = _perm_rng.integers(1, _MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _perm_rng.integers(0, _MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+STOPWORDS = frozenset("""
+a an the to of and or is are am be been was were my his her their its our your
+patient patients member members he she they them i me we you it this that
+with for in on at about how what when why do does did can could should would
+take takes taking get gets help
+""".split())
+_SUFFIXES = ("ing", "ed", "es", "s")
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Lowercased content words with stopwords dropped and common suffixes stripped."""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS:
+            continue
+        for suffix in _SUFFIXES:
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        tokens.append(word)
+    return tokens
+
+
+def minhash_signature(tokens: List[str]) -> Optional[np.ndarray]:
+    """64-value MinHash over the token set, or None for prompts with no content words."""
+    if not tokens:
+        return None
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(t.encode(), digest_size=4).digest(), "little") for t in set(tokens)],
+        dtype=np.uint64,
+    ) % _MERSENNE_PRIME
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def band_keys(namespace: str, signature: Optional[np.ndarray]) -> List[str]:
+    if signature is None:
+        return []
+    return [
+        f"{namespace}:{band}:{hashlib.blake2b(signature[band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND].tobytes(), digest_size=8).hexdigest()}"
+        for band in range(LSH_BANDS)
+    ]
+
+
+class SemanticCache:
+    """
+    One logical cache (e.g. behavioral advice) inside the shared SQLite table.
+    `variant` values such as is_for_provider are part of the key, so provider and
+    patient answers never mix.
+    """
+
+    def __init__(self, kind: str, prompt_version: str = "v1", threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.kind = kind
+        self.prompt_version = prompt_version
+        self.threshold = threshold
+        self.stats = CacheStats()
+        self.similar_hits = 0
+        self._flight = SingleFlight()
+
+    def _namespace(self, variant: str) -> str:
+        return f"{self.kind}:{self.prompt_version}:{variant}"
+
+    def _exact_key(self, namespace: str, prompt: str) -> str:
+        normalized = " ".join(prompt.lower().split())
+        return hashlib.sha256(f"{namespace}|{normalized}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, variant: str = "") -> Optional[Dict]:
+        """Exact match first, then the most similar prompt above the threshold."""
+        namespace = self._namespace(variant)
+        cached = get_cached_llm_response(self._exact_key(namespace, prompt), SEMANTIC_CACHE_TTL_SECONDS)
+        if cached is not None:
+            self.stats.hits += 1
+            return cached
+        signature = minhash_signature(normalize_tokens(prompt))
+        best_key, best_score = None, self.threshold
+        for key, stored in find_cached_llm_response_candidates(band_keys(namespace, signature), SEMANTIC_CACHE_TTL_SECONDS):
+            score = float(np.mean(np.frombuffer(stored, dtype=np.uint32) == signature))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is not None:
+            cached = get_cached_llm_response(best_key, SEMANTIC_CACHE_TTL_SECONDS)
+            if cached is not None:
+                self.stats.hits += 1
+                self.similar_hits += 1
+                return cached
+        self.stats.misses += 1
+        return None
+
+    def store(self, prompt: str, data: Dict, variant: str = "") -> None:
+        namespace = self._namespace(variant)
+        signature = minhash_signature(normalize_tokens(prompt))
+        put_cached_llm_response(
+            self._exact_key(namespace, prompt), namespace, prompt,
+            signature.tobytes() if signature is not None else None,
+            data, band_keys(namespace, signature), SEMANTIC_CACHE_MAX_ENTRIES,
+        )
+
+    async def get_or_compute(self, prompt: str, compute: Callable[[], Awaitable[Dict]], variant: str = "") -> Dict:
+        """Serves from the cache, otherwise awaits `compute` (coalesced per prompt) and stores it."""
+        cached = await asyncio.to_thread(self.lookup, prompt, variant)
+        if cached is not None:
+            return cached
+        key = self._exact_key(self._namespace(variant), prompt)
+        if self._flight.is_in_flight(key):
+            self.stats.coalesced += 1
+
+        async def compute_and_store():
+            data = await compute()
+            await asyncio.to_thread(self.store, prompt, data, variant)
+            return data
+
+        return await self._flight.do(key, compute_and_store)
+
+    def as_dict(self) -> dict:
+        return {**self.stats.as_dict(), "similar_hits": self.similar_hits, "threshold": self.threshold}
+
+
+advice_cache = SemanticCache("behavioral_advice")
+barrier_analysis_cache = SemanticCache("barrier_analysis")
+
+
+def semantic_cache_stats() -> dict:
+    """Per-cache counters plus the shared table's size."""
+    return {
+        "behavioral_advice": advice_cache.as_dict(),
+        "barrier_analysis": barrier_analysis_cache.as_dict(),
+        "entries": count_cached_llm_responses(),
+        "max_entries": SEMANTIC_CACHE_MAX_ENTRIES,
+        "ttl_seconds": SEMANTIC_CACHE_TTL_SECONDS,
+    }
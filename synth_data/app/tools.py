@@ -1,14 +1,49 @@
+import bisect
+import csv
 import random
 import os
 import json
+import re
+import threading
 import numpy as np
-from typing import Type, List
+from typing import Type, List, Dict, Optional, Tuple, Sequence, Union
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool, BaseTool
-from langchain_openai import ChatOpenAI
+
+from app.llm_gateway import llm_gateway
+from app.semantic_cache import barrier_analysis_cache
 
 # --- Existing Tools ---
 
+PATHWAY_WEIGHTS = {'T2D_HighRisk': 0.35, 'T2D_ModerateRisk': 0.35, 'Obesity': 0.30}
+
+# Uniform ranges for baseline draws, per pathway.
+BASELINE_RANGES = {
+    'T2D_HighRisk': {'a1c': (10.0, 12.5), 'weight': (180, 350)},
+    'T2D_ModerateRisk': {'a1c': (8.0, 9.9), 'weight': (180, 350)},
+    'Obesity': {'a1c': (5.7, 6.4), 'weight': (250, 400)},  # Pre-diabetic range for context
+}
+
+def sample_clinical_profile(condition: str, rng: random.Random = random) -> dict:
+    """Draws baseline A1c and weight for a condition using the given RNG."""
+    ranges = BASELINE_RANGES.get(condition, BASELINE_RANGES['Obesity'])
+    baseline_a1c = rng.uniform(*ranges['a1c'])
+    baseline_weight = rng.uniform(*ranges['weight'])
+    return {
+        "baseline_a1c": round(baseline_a1c, 2),
+        "baseline_weight": round(baseline_weight, 1)
+    }
+
+def sample_care_pathway(rng: random.Random = random) -> str:
+    """Draws a care pathway for a new patient using the given RNG."""
+    rand = rng.random()
+    cumulative = 0.0
+    for pathway, weight in PATHWAY_WEIGHTS.items():
+        cumulative += weight
+        if rand < cumulative:
+            return pathway
+    return pathway
+
 @tool
 def generate_clinical_profile(condition: str) -> dict:
     """
@@ -18,20 +53,7 @@ def generate_clinical_profile(condition: str) -> dict:
     Returns:
         A dictionary with baseline A1c and weight.
     """
-    if condition == 'T2D_HighRisk':
-        baseline_a1c = random.uniform(10.0, 12.5)
-        baseline_weight = random.uniform(180, 350)
-    elif condition == 'T2D_ModerateRisk':
-        baseline_a1c = random.uniform(8.0, 9.9)
-        baseline_weight = random.uniform(180, 350)
-    else:  # Obesity
-        baseline_a1c = random.uniform(5.7, 6.4) # Pre-diabetic range for context
-        baseline_weight = random.uniform(250, 400)
-        
-    return {
-        "baseline_a1c": round(baseline_a1c, 2),
-        "baseline_weight": round(baseline_weight, 1)
-    }
+    return sample_clinical_profile(condition)
 
 @tool
 def get_care_pathway() -> str:
@@ -40,13 +62,7 @@ def get_care_pathway() -> str:
     Returns:
         A string representing the chosen pathway.
     """
-    rand = random.random()
-    if rand < 0.35:
-        return 'T2D_HighRisk'
-    elif rand < 0.7:
-        return 'T2D_ModerateRisk'
-    else:
-        return 'Obesity'
+    return sample_care_pathway()
 
 CARE_PATHWAY_LOGIC = {
     'T2D_HighRisk': [
@@ -130,15 +146,12 @@ class BehavioralAnalysisTool(BaseTool):
     args_schema: Type[BaseModel] = AnalysisInput
     return_direct: bool = False
 
-    def _run(self, text: str) -> dict:
-        """Use the tool."""
-        try:
-            llm = ChatOpenAI(model="gpt-4o", temperature=0.5)
-            framework_str = "\n".join([
-                f"- Barrier: {item['barrier']}, Strategies: {', '.join(item['strategies'])}, Tactics: {', '.join(item['tactics'])}"
-                for item in FRAMEWORK_DATA
-            ])
-            prompt = f"""
+    def _prompt(self, text: str) -> str:
+        framework_str = "\n".join([
+            f"- Barrier: {item['barrier']}, Strategies: {', '.join(item['strategies'])}, Tactics: {', '.join(item['tactics'])}"
+            for item in FRAMEWORK_DATA
+        ])
+        return f"""
             You are a behavioral change expert. Analyze the following user's text and identify the top 3 most likely behavioral barriers they are facing, based *only* on the provided BeST framework data.
             For each identified barrier, select the most relevant strategy and tactic from the framework data and formulate a single, actionable piece of advice for the user.
             User's Text: "{text}"
@@ -146,19 +159,36 @@ class BehavioralAnalysisTool(BaseTool):
             {framework_str}
             Structure your output as a Pydantic model with the key "suggestions".
             """
-            structured_llm = llm.with_structured_output(AnalysisOutput)
-            validated_output = structured_llm.invoke(prompt)
+
+    def _run(self, text: str) -> dict:
+        """Use the tool."""
+        try:
+            cached = barrier_analysis_cache.lookup(text)
+            if cached is not None:
+                return cached
+            validated_output = llm_gateway.invoke(self._prompt(text), temperature=0.5, schema=AnalysisOutput)
+            result = validated_output.model_dump()
+            barrier_analysis_cache.store(text, result)
+            return result
+        except Exception as e:
+            return {"error": f"An error occurred in the BehavioralAnalysisTool: {str(e)}"}
+
+    async def _arun(self, text: str) -> dict:
+        """Use the tool asynchronously through the shared gateway."""
+        async def analyze():
+            validated_output = await llm_gateway.ainvoke(self._prompt(text), temperature=0.5, schema=AnalysisOutput)
             return validated_output.model_dump()
+        try:
+            return await barrier_analysis_cache.get_or_compute(text, analyze)
         except Exception as e:
             return {"error": f"An error occurred in the BehavioralAnalysisTool: {str(e)}"}
 
 behavioral_tool = BehavioralAnalysisTool()
 
 
-from pydantic import BaseModel
-import numpy as np
-from langchain_core.tools import BaseTool
-from typing import Type
+from typing import Literal
+
+from app.rmab import simulate_rmab
 
 class RMABInput(BaseModel):
     """
@@ -169,10 +199,15 @@ class RMABInput(BaseModel):
     budget: int = Field(..., description="Number of patients that can be treated per step.")
     decay: float = Field(0.95, description="Decay factor for unobserved patient states.")
     noise: float = Field(0.1, description="Stochastic noise in state transition.")
+    policy: Literal["myopic", "whittle", "random"] = Field("myopic", description="Which arms to treat: highest observed state, highest Whittle index, or random.")
+    seed: int = Field(42, description="Seed for the simulation's local random generator.")
+    effect: float = Field(0.7, description="State multiplier applied to treated patients.")
+    effect_spread: float = Field(0.0, description="Per-patient spread of the treatment effect (0 = identical patients).")
+    discount: float = Field(0.9, description="Discount factor used by the Whittle-index policy.")
 
 class RMABTool(BaseTool):
     """
-    A simple simulation-based Restless Multi-Armed Bandit (RMAB) tool.
+    A simulation-based Restless Multi-Armed Bandit (RMAB) tool.
     Selects top-K patients to intervene with over time under budget constraints.
     """
     name: str = "rmab_tool"
@@ -183,35 +218,25 @@ class RMABTool(BaseTool):
     args_schema: Type[BaseModel] = RMABInput
     return_direct: bool = False
 
-    def _run(self, num_patients: int, horizon: int, budget: int, decay: float, noise: float) -> dict:
-        np.random.seed(42)  # Reproducibility
-
-        # Initialize patient states between [0, 1], where 1 = worst
-        states = np.random.rand(num_patients)
-        logs = []
-
-        for t in range(horizon):
-            # Compute priority score = current state + noise
-            scores = states + np.random.normal(0, noise, size=num_patients)
-            selected_indices = np.argsort(scores)[-budget:]  # Select top-K
-
-            # Apply "intervention" to selected arms (simulate improvement)
-            states[selected_indices] *= 0.7  # Treatment improves state
-
-            # Rest decay for unselected arms
-            unselected = list(set(range(num_patients)) - set(selected_indices))
-            states[unselected] *= decay  # Passive evolution worsens or improves slightly
-
-            logs.append({
-                "step": t + 1,
-                "treated_patients": selected_indices.tolist(),
-                "mean_state": float(np.mean(states))
-            })
-
-        return {"final_states": states.tolist(), "log": logs}
+    def _run(self, num_patients: int, horizon: int, budget: int, decay: float = 0.95, noise: float = 0.1,
+             policy: str = "myopic", seed: int = 42, effect: float = 0.7, effect_spread: float = 0.0,
+             discount: float = 0.9) -> dict:
+        result = simulate_rmab(num_patients, horizon, budget, decay=decay, noise=noise, policy=policy,
+                               seed=seed, effect=effect, effect_spread=effect_spread, discount=discount)
+        # Summaries only: per-arm lists would be millions of entries for large cohorts.
+        return {
+            "policy": policy,
+            "final_mean_state": result["final_mean_state"],
+            "final_p90_state": result["final_p90_state"],
+            "cumulative_cost": result["cumulative_cost"],
+            "treated_share": result["treated_share"],
+            "log": [
+                {"step": t + 1, "mean_state": round(float(m), 6), "treated_mean_state": round(float(tm), 6)}
+                for t, (m, tm) in enumerate(zip(result["mean_state"], result["treated_mean_state"]))
+            ],
+        }
 rmab_tool = RMABTool()
 
-import pandas as pd
 from pydantic import BaseModel
 
 class CareProtocolStep(BaseModel):
@@ -221,64 +246,238 @@ class CareProtocolStep(BaseModel):
     task: str
     persona: str
 
+CARE_PROTOCOL_PATH = os.path.join(os.path.dirname(__file__), "carepathways_sample.csv")
+
+def read_care_protocol(path: str = CARE_PROTOCOL_PATH) -> List[CareProtocolStep]:
+    """Parses the care protocol CSV into a list of CareProtocolStep objects."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [
+            CareProtocolStep(
+                pathway=row["Care Pathway"],
+                sub_pathway=row["Sub-Pathway"],
+                trigger=row["Trigger(s)"],
+                task=row["Task / Interaction"],
+                persona=row["Primary Persona(s)"]
+            )
+            for row in csv.DictReader(f)
+        ]
+
+# --- Protocol Sampling Index ---
+# The CSV's top-level pathways ("I. Onboarding...", "VI. Clinical Monitoring...") are
+# not the clinical pathways patients are assigned to, so each clinical pathway weights
+# the protocol sections by their leading numeral. Unknown pathways weight them evenly.
+PATHWAY_PROTOCOL_WEIGHTS = {
+    'T2D_HighRisk': {'I': 1.0, 'II': 1.5, 'III': 1.0, 'IV': 1.5, 'V': 1.0, 'VI': 2.5},
+    'T2D_ModerateRisk': {'I': 1.0, 'II': 1.5, 'III': 1.0, 'IV': 1.0, 'V': 1.5, 'VI': 1.0},
+    'Obesity': {'I': 1.0, 'II': 0.5, 'III': 1.0, 'IV': 1.0, 'V': 2.5, 'VI': 0.5},
+}
+
+# A trigger that waits a number of days/weeks after enrollment or onboarding
+# ("25 days have passed since onboarding") is an early follow-up, not part of
+# onboarding itself, so this is checked before the keyword rules.
+FOLLOW_UP_OFFSET = re.compile(r'\b\d+\s*(?:days?|weeks?)\b.*\b(?:after|since)\b.*\b(?:enrollment|onboarding|join)')
+
+# First matching rule wins; triggers matching none can happen at any point.
+TRIGGER_TIMING_RULES = [
+    ('onboarding', ('first time', 'enrollment', 'onboarding', 'transferred', 'moved between', 'join date')),
+    ('exit', ('exit',)),
+    ('glycemic', ('a1c of 9', 'bg reading', '< 54', 'hypoglycemic', 'average bg', 'high bg')),
+    ('periodic', ('90 days', 'every', 'checkpoint', 'date of birth')),
+]
+
+# Which trigger timings are eligible in each phase of the journey.
+PHASE_TIMINGS = {
+    'start': ('onboarding',),
+    'early': ('onboarding', 'follow_up', 'any', 'glycemic'),
+    'mid': ('any', 'glycemic', 'periodic'),
+    'late': ('any', 'periodic', 'exit'),
+}
+EARLY_MONTHS = 3
+GLYCEMIC_ALERT_A1C = 9.0
+GLYCEMIC_WEIGHT = {True: 3.0, False: 0.2}  # Keyed by "A1c above the alert threshold"
+
+def trigger_timing(trigger: str) -> str:
+    """Classifies a protocol trigger as onboarding, follow_up, exit, glycemic, periodic or any."""
+    text = trigger.lower()
+    if FOLLOW_UP_OFFSET.search(text):
+        return 'follow_up'
+    for timing, keywords in TRIGGER_TIMING_RULES:
+        if any(keyword in text for keyword in keywords):
+            return timing
+    return 'any'
+
+def journey_phase(month: int, horizon: int) -> str:
+    if month == 1:
+        return 'start'
+    if month == horizon:
+        return 'late'
+    return 'early' if month <= EARLY_MONTHS else 'mid'
+
+class ProtocolIndex:
+    """
+    Cumulative-weight tables over a fixed set of protocol steps, keyed by
+    (pathway, phase, glycemic alert). Each table is built on first use, so a draw
+    is a bisect instead of a scan over the whole protocol.
+    """
+
+    def __init__(self, steps: Sequence[CareProtocolStep]):
+        self.steps = tuple(steps)
+        self._timings = [trigger_timing(step.trigger) for step in self.steps]
+        self._sections = [step.pathway.split('.', 1)[0].strip() for step in self.steps]
+        self._tables: Dict[Tuple[str, str, bool], Tuple[List[int], List[float]]] = {}
+
+    def table(self, pathway: str, phase: str, alert: bool) -> Tuple[List[int], List[float]]:
+        key = (pathway, phase, alert)
+        table = self._tables.get(key)
+        if table is None:
+            table = self._build_table(pathway, phase, alert)
+            self._tables[key] = table
+        return table
+
+    def _build_table(self, pathway: str, phase: str, alert: bool) -> Tuple[List[int], List[float]]:
+        section_weights = PATHWAY_PROTOCOL_WEIGHTS.get(pathway, {})
+        eligible = PHASE_TIMINGS[phase]
+        positions, cum_weights, total = [], [], 0.0
+        for i, (timing, section) in enumerate(zip(self._timings, self._sections)):
+            if timing not in eligible:
+                continue
+            weight = section_weights.get(section, 1.0)
+            if timing == 'glycemic':
+                weight *= GLYCEMIC_WEIGHT[alert]
+            total += weight
+            positions.append(i)
+            cum_weights.append(total)
+        if not positions and phase != 'mid':
+            # No step fits this phase (e.g. a protocol without onboarding rows).
+            return self._build_table(pathway, 'mid', alert)
+        if not positions:
+            positions = list(range(len(self.steps)))
+            cum_weights = [float(i + 1) for i in positions]
+        return positions, cum_weights
+
+    def draw(self, pathway: str, phase: str, alert: bool, rng: random.Random) -> int:
+        positions, cum_weights = self.table(pathway, phase, alert)
+        return positions[bisect.bisect(cum_weights, rng.random() * cum_weights[-1])]
+
+class CareProtocolRegistry:
+    """
+    Parses the care protocol once and keeps it in memory, indexed by pathway and
+    (pathway, sub-pathway). The file's mtime is checked on every access and the
+    protocol is re-parsed only when it changes.
+    """
+
+    def __init__(self, path: str = CARE_PROTOCOL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime_ns = None
+        self._steps: Tuple[CareProtocolStep, ...] = ()
+        self._by_pathway: Dict[str, Tuple[CareProtocolStep, ...]] = {}
+        self._by_sub_pathway: Dict[Tuple[str, str], Tuple[CareProtocolStep, ...]] = {}
+        self._index = ProtocolIndex(())
+        self.loads = 0
+
+    def _refresh(self):
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        if mtime_ns == self._mtime_ns:
+            return
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return
+            steps = tuple(read_care_protocol(self.path))
+            by_pathway, by_sub_pathway = {}, {}
+            for step in steps:
+                by_pathway.setdefault(step.pathway, []).append(step)
+                by_sub_pathway.setdefault((step.pathway, step.sub_pathway), []).append(step)
+            self._by_pathway = {k: tuple(v) for k, v in by_pathway.items()}
+            self._by_sub_pathway = {k: tuple(v) for k, v in by_sub_pathway.items()}
+            self._index = ProtocolIndex(steps)
+            self._steps = steps
+            self._mtime_ns = mtime_ns
+            self.loads += 1
+
+    def steps(self) -> Tuple[CareProtocolStep, ...]:
+        self._refresh()
+        return self._steps
+
+    def index(self) -> ProtocolIndex:
+        self._refresh()
+        return self._index
+
+    def for_pathway(self, pathway: str) -> Tuple[CareProtocolStep, ...]:
+        self._refresh()
+        return self._by_pathway.get(pathway, ())
+
+    def for_sub_pathway(self, pathway: str, sub_pathway: str) -> Tuple[CareProtocolStep, ...]:
+        self._refresh()
+        return self._by_sub_pathway.get((pathway, sub_pathway), ())
+
+    def pathways(self) -> List[str]:
+        self._refresh()
+        return list(self._by_pathway)
+
+care_protocol_registry = CareProtocolRegistry()
+
 @tool
 def load_care_protocol() -> List[CareProtocolStep]:
     """
     Loads the care protocol from CSV and returns a list of structured care steps.
     """
-    path = os.path.join(os.path.dirname(__file__), "carepathways_sample.csv")
-    df = pd.read_csv(path)
-    steps = [
-        CareProtocolStep(
-            pathway=row["Care Pathway"],
-            sub_pathway=row["Sub-Pathway"],
-            trigger=row["Trigger(s)"],
-            task=row["Task / Interaction"],
-            persona=row["Primary Persona(s)"]
-        )
-        for _, row in df.iterrows()
-    ]
-    return steps
+    return list(care_protocol_registry.steps())
 
-@tool
-def simulate_patient_journey_realistic(
+def run_journey_simulation(
     pathway: str,
     baseline_a1c: float,
     baseline_weight: float,
-    care_protocol: List[CareProtocolStep]
+    care_protocol: Union[ProtocolIndex, Sequence[CareProtocolStep]],
+    rng: random.Random = random,
+    horizon: int = 12
 ) -> list:
     """
-    Simulates a journey based on care protocol steps.
-    Each log entry must include month, event, details.
+    Plain-Python core of `simulate_patient_journey_realistic`.
+    Schedules one protocol step per month, drawn by pathway, journey phase and
+    current A1c. Besides month/event/details, each entry carries the numeric `a1c`
+    and `weight` so downstream code does not have to parse them back out of `details`.
+    Pass `care_protocol_registry.index()` to reuse the cached sampling tables.
     """
+    index = care_protocol if isinstance(care_protocol, ProtocolIndex) else ProtocolIndex(care_protocol)
+    steps = index.steps
     journey_log = []
-    # filtered = [step for step in care_protocol if pathway.lower() in step.pathway.lower()]
-    # filtered = care_protocol[:30]  # Simulate a subset for demonstration; in practice, filter by pathway
-    filtered = random.sample(care_protocol, 12)
-
-    for i, step in enumerate(filtered):
-        month = (i + 1) * 1  # Simulate monthly steps, incrementally
-        a1c_jitter = random.uniform(-0.2, 0.1)
-        weight_jitter = random.uniform(-3, 1)
-        baseline_a1c += a1c_jitter
-        baseline_weight += weight_jitter
-
-        # journey_log.append({
-        #     "month": month,
-        #     "event": step.task,  # or use step.sub_pathway + ": " + step.task
-        #     "details": (
-        #         f"Trigger: {step.trigger}. "
-        #         f"A1c now {baseline_a1c:.2f}, Weight now {baseline_weight:.1f} lbs."
-        #     )
-        # })
+    used = set()
+
+    for month in range(1, horizon + 1):
+        phase = journey_phase(month, horizon)
+        alert = baseline_a1c >= GLYCEMIC_ALERT_A1C
+        position = index.draw(pathway, phase, alert, rng)
+        for _ in range(3):  # Redraw a few times to avoid repeating a step
+            if position not in used:
+                break
+            position = index.draw(pathway, phase, alert, rng)
+        used.add(position)
+        step = steps[position]
+
+        baseline_a1c += rng.uniform(-0.2, 0.1)
+        baseline_weight += rng.uniform(-3, 1)
         journey_log.append({
-            "month": i + 1,
+            "month": month,
             "event": step.task,
-            "details": f"Triggered by: {step.trigger}. A1c: {baseline_a1c:.2f}, Weight: {baseline_weight:.1f} lbs."
+            "details": f"Triggered by: {step.trigger}. A1c: {baseline_a1c:.2f}, Weight: {baseline_weight:.1f} lbs.",
+            "a1c": round(baseline_a1c, 2),
+            "weight": round(baseline_weight, 1)
         })
-        print(journey_log)
 
     return journey_log
 
-
-
+@tool
+def simulate_patient_journey_realistic(
+    pathway: str,
+    baseline_a1c: float,
+    baseline_weight: float,
+    care_protocol: Optional[List[CareProtocolStep]] = None
+) -> list:
+    """
+    Simulates a journey based on care protocol steps.
+    Each log entry must include month, event, details.
+    Omit `care_protocol` to use the loaded protocol and its cached sampling tables.
+    """
+    protocol = care_protocol_registry.index() if care_protocol is None else care_protocol
+    return run_journey_simulation(pathway, baseline_a1c, baseline_weight, protocol)
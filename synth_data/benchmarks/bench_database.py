@@ -0,0 +1,110 @@
+"""
+Compares the pooled WAL connection layer in app/database.py against the previous
+connect-per-call pattern. Run from synth_data/:
+
+    python -m benchmarks.bench_database --rows 2000 --threads 8
+"""
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import database
+from app.fast_generator import generate_fast_cohort
+
+
+# --- Legacy pattern: one connection per call, default rollback journal ---
+
+def legacy_add(db_file, patient):
+    with sqlite3.connect(db_file) as con:
+        con.execute(
+            "INSERT OR REPLACE INTO patients (id, name, data, profile_name) VALUES (?, ?, ?, ?)",
+            (patient['id'], patient['name'], json.dumps(patient), patient.get('profile_name', 'default'))
+        )
+
+def legacy_get(db_file, patient_id):
+    with sqlite3.connect(db_file) as con:
+        row = con.execute("SELECT data FROM patients WHERE id = ?", (patient_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+def legacy_list(db_file):
+    with sqlite3.connect(db_file) as con:
+        con.row_factory = sqlite3.Row
+        return [dict(row) for row in con.execute("SELECT id, name, profile_name FROM patients")]
+
+
+def _timed(fn, items, threads):
+    """Runs fn over items (serially or on a thread pool); returns (seconds, errors)."""
+    errors = 0
+    def call(item):
+        nonlocal errors
+        try:
+            fn(item)
+        except sqlite3.OperationalError:
+            errors += 1
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(call, items))
+    else:
+        for item in items:
+            call(item)
+    return time.perf_counter() - start, errors
+
+
+def run(rows: int, threads: int) -> dict:
+    patients = generate_fast_cohort(rows, seed=0)
+    ids = [p['id'] for p in patients]
+    results = {}
+    for variant in ("legacy", "pooled"):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, "bench.db")
+            database.DB_FILE = db_file
+            database.close_pool()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                database.init_db()
+            if variant == "legacy":
+                # init_db switched the file to WAL; the legacy baseline used the default journal.
+                database.close_pool()
+                with sqlite3.connect(db_file) as con:
+                    con.execute("PRAGMA journal_mode = DELETE")
+                add = lambda p: legacy_add(db_file, p)
+                get = lambda i: legacy_get(db_file, i)
+                list_all = lambda _: legacy_list(db_file)
+                add_many = lambda batch: [legacy_add(db_file, p) for p in batch]
+            else:
+                add = database.add_patient_to_db
+                get = database.get_patient_details_from_db
+                list_all = lambda _: database.get_all_patients_from_db()
+                add_many = database.add_patients_to_db
+
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                write_s, write_err = _timed(add, patients, threads)
+                read_s, read_err = _timed(get, ids, threads)
+                list_s, _ = _timed(list_all, range(20), 1)
+                bulk_s, _ = _timed(add_many, [patients], 1)
+            results[variant] = {
+                "writes_per_s": round(rows / write_s, 1),
+                "bulk_writes_per_s": round(rows / bulk_s, 1),
+                "reads_per_s": round(rows / read_s, 1),
+                "list_ms": round(list_s / 20 * 1000, 2),
+                "locked_errors": write_err + read_err,
+            }
+            database.close_pool()
+    results["speedup"] = {
+        key: round(results["pooled"][key] / results["legacy"][key], 2)
+        for key in ("writes_per_s", "bulk_writes_per_s", "reads_per_s")
+    }
+    return {"rows": rows, "threads": threads, **results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.threads), indent=2))
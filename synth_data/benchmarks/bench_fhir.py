@@ -0,0 +1,58 @@
+"""
+Measures FHIR R4 bulk export throughput, in-process vs. a process pool, and
+projects the time for a 100k-patient cohort. Run from synth_data/:
+
+    python -m benchmarks.bench_fhir --rows 20000 --workers 8
+"""
+import argparse
+import contextlib
+import json
+import os
+import tempfile
+import time
+
+from app import database
+from app.fast_generator import generate_fast_cohort
+from app.fhir import export_fhir_ndjson
+
+PROJECTED_COHORT = 100_000
+
+
+def run(rows: int, workers: int, chunk_size: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = os.path.join(tmp, "bench.db")
+        database.close_pool()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            database.init_db()
+            for start in range(0, rows, 5000):
+                database.add_patients_to_db(generate_fast_cohort(min(5000, rows - start), seed=start))
+
+        for label, worker_count in (("in_process", 1), ("process_pool", workers)):
+            out_dir = os.path.join(tmp, label)
+            start = time.perf_counter()
+            manifest = export_fhir_ndjson(out_dir, worker_count, chunk_size)
+            elapsed = time.perf_counter() - start
+            resources = sum(output["count"] for output in manifest["output"])
+            size = sum(os.path.getsize(os.path.join(out_dir, output["url"])) for output in manifest["output"])
+            results[label] = {
+                "workers": worker_count,
+                "seconds": round(elapsed, 2),
+                "patients_per_s": round(rows / elapsed, 1),
+                "resources_per_s": round(resources / elapsed, 1),
+                "resources": resources,
+                "output_mb": round(size / 1e6, 1),
+                "projected_100k_minutes": round(PROJECTED_COHORT / (rows / elapsed) / 60, 2),
+            }
+        database.close_pool()
+    results["speedup"] = round(results["in_process"]["seconds"] / results["process_pool"]["seconds"], 2)
+    return {"rows": rows, "chunk_size": chunk_size, **results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.workers, args.chunk_size), indent=2))
@@ -0,0 +1,90 @@
+"""
+Per-node and end-to-end latency of the patient generation graph, with the LLM
+replaced by the deterministic stub in benchmarks/llm_stub.py. Run from synth_data/:
+
+    python -m benchmarks.bench_graph --patients 50 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from app import agent
+from benchmarks.common import latency_ms, quiet, temp_database
+from benchmarks.llm_stub import stub_llm
+
+NODES = [
+    ("profiler", agent.profiler_agent),
+    ("persona_generator", agent.persona_agent),
+    ("journey_simulator", agent.journey_simulator_agent),
+    ("formatter", agent.formatter_agent),
+    ("save_to_db", agent.save_to_database_node),
+]
+
+
+async def _node_latencies(patients: int) -> dict:
+    """Runs the nodes by hand, threading state through, and times each one."""
+    samples = {name: [] for name, _ in NODES}
+    for _ in range(patients):
+        state = {"profile_name": "bench", "defer_save": False}
+        for name, node in NODES:
+            start = time.perf_counter()
+            update = await node(state)
+            samples[name].append(time.perf_counter() - start)
+            state.update(update or {})
+    return {name: latency_ms(values) for name, values in samples.items()}
+
+
+async def _end_to_end(patients: int, concurrency: int) -> dict:
+    """Sequential app_graph latency, then concurrent throughput with and without checkpointing."""
+    inputs = {"profile_name": "bench"}
+    sequential = []
+    for _ in range(patients):
+        start = time.perf_counter()
+        await agent.app_graph.ainvoke(inputs)
+        sequential.append(time.perf_counter() - start)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(run):
+        async with semaphore:
+            await run()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded(lambda: agent.app_graph.ainvoke(inputs)) for _ in range(patients)))
+    concurrent_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded(lambda i=i: agent.run_patient_graph(f"bench:{i}", inputs)) for i in range(patients)))
+    checkpointed_s = time.perf_counter() - start
+    await agent.close_checkpointer()
+    return {
+        "app_graph": latency_ms(sequential),
+        "concurrent_patients_per_s": round(patients / concurrent_s, 1),
+        "checkpointed_patients_per_s": round(patients / checkpointed_s, 1),
+    }
+
+
+def run(patients: int, concurrency: int, latency_s: float = 0.0) -> dict:
+    random.seed(0)
+    with temp_database() as db_file, quiet(), stub_llm(latency_s):
+        previous_checkpoints = agent.CHECKPOINT_DB_FILE
+        agent.CHECKPOINT_DB_FILE = os.path.join(os.path.dirname(db_file), "checkpoints.db")
+        try:
+            nodes = asyncio.run(_node_latencies(patients))
+            end_to_end = asyncio.run(_end_to_end(patients, concurrency))
+        finally:
+            agent.CHECKPOINT_DB_FILE = previous_checkpoints
+    return {"patients": patients, "concurrency": concurrency, "stub_latency_s": latency_s,
+            "nodes": nodes, **end_to_end}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Seconds added to every stubbed LLM call")
+    args = parser.parse_args()
+    print(json.dumps(run(args.patients, args.concurrency, args.stub_latency), indent=2))
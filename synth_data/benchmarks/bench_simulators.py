@@ -0,0 +1,62 @@
+"""
+Per-call cost of the care protocol loader and journey simulator, and RMABTool
+scaling in arms x horizon. Run from synth_data/:
+
+    python -m benchmarks.bench_simulators --arms 100 1000 10000 --horizons 12 52
+"""
+import argparse
+import json
+import random
+
+from app.tools import (
+    care_protocol_registry, load_care_protocol, read_care_protocol, rmab_tool,
+    run_journey_simulation, simulate_patient_journey_realistic,
+)
+from benchmarks.common import latency_ms, time_calls
+
+CALLS = 200
+
+
+def protocol_costs(calls: int = CALLS) -> dict:
+    steps = load_care_protocol.invoke({})
+    index = care_protocol_registry.index()
+    rng = random.Random(0)
+    tool_args = {"pathway": "T2D_HighRisk", "baseline_a1c": 8.5, "baseline_weight": 210.0}
+    return {
+        "protocol_steps": len(steps),
+        "read_care_protocol_cold": latency_ms(time_calls(read_care_protocol, calls)),
+        "load_care_protocol_tool": latency_ms(time_calls(lambda: load_care_protocol.invoke({}), calls)),
+        "registry_index": latency_ms(time_calls(care_protocol_registry.index, calls)),
+        "simulate_journey_tool": latency_ms(time_calls(lambda: simulate_patient_journey_realistic.invoke(tool_args), calls)),
+        "simulate_journey_tool_explicit_protocol": latency_ms(time_calls(
+            lambda: simulate_patient_journey_realistic.invoke({**tool_args, "care_protocol": steps}), calls)),
+        "run_journey_simulation_indexed": latency_ms(time_calls(
+            lambda: run_journey_simulation("T2D_HighRisk", 8.5, 210.0, index, rng), calls)),
+    }
+
+
+def rmab_scaling(arms, horizons, policies=("myopic", "whittle"), repeats: int = 3) -> dict:
+    results = {}
+    for policy in policies:
+        for num_patients in arms:
+            for horizon in horizons:
+                args = {"num_patients": num_patients, "horizon": horizon, "budget": max(1, num_patients // 10),
+                        "policy": policy, "seed": 0}
+                samples = time_calls(lambda: rmab_tool.invoke(args), repeats)
+                summary = latency_ms(samples)
+                summary["arm_steps_per_s"] = round(num_patients * horizon / (summary["p50_ms"] / 1000), 1)
+                results[f"{policy}_{num_patients}x{horizon}"] = summary
+    return results
+
+
+def run(arms, horizons, calls: int = CALLS) -> dict:
+    return {"protocol": protocol_costs(calls), "rmab": rmab_scaling(arms, horizons)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--arms", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--horizons", type=int, nargs="+", default=[12, 52])
+    parser.add_argument("--calls", type=int, default=CALLS)
+    args = parser.parse_args()
+    print(json.dumps(run(args.arms, args.horizons, args.calls), indent=2))
@@ -0,0 +1,71 @@
+"""
+Read/write/list throughput of app/database.py as the patients table grows. Run
+from synth_data/:
+
+    python -m benchmarks.bench_storage --sizes 1000 10000 50000
+"""
+import argparse
+import json
+import random
+import time
+
+from app import database
+from app.fast_generator import generate_fast_cohort
+from benchmarks.common import latency_ms, quiet, temp_database, time_calls, time_each
+
+WRITE_BATCH = 1000
+SAMPLE_CALLS = 200
+
+
+def _measure(patients, rng: random.Random) -> dict:
+    ids = [p["id"] for p in patients]
+    start = time.perf_counter()
+    with quiet():
+        for i in range(0, len(patients), WRITE_BATCH):
+            database.add_patients_to_db(patients[i:i + WRITE_BATCH])
+    bulk_s = time.perf_counter() - start
+
+    sample = rng.sample(patients, min(SAMPLE_CALLS, len(patients)))
+    with quiet():
+        single_writes = time_each(database.add_patient_to_db, sample)
+    reads = time_each(database.get_patient_details_from_db, rng.sample(ids, len(sample)))
+    middle_id = sorted(ids)[len(ids) // 2]
+    first_page = time_calls(lambda: database.list_patients_from_db(limit=500), 20)
+    deep_page = time_calls(lambda: database.list_patients_from_db(limit=500, after=middle_id), 20)
+    filtered = time_calls(lambda: database.list_patients_from_db(limit=500, care_pathway="T2D_HighRisk",
+                                                                 a1c_min=7.0), 20)
+    start = time.perf_counter()
+    streamed = sum(len(chunk) for chunk in database.iter_patients_from_db(500))
+    scan_s = time.perf_counter() - start
+    return {
+        "bulk_writes_per_s": round(len(patients) / bulk_s, 1),
+        "single_write": latency_ms(single_writes),
+        "read": latency_ms(reads),
+        "list_first_page": latency_ms(first_page),
+        "list_deep_page": latency_ms(deep_page),
+        "list_filtered": latency_ms(filtered),
+        "full_scan_patients_per_s": round(streamed / scan_s, 1),
+    }
+
+
+def run(sizes) -> dict:
+    rng = random.Random(0)
+    results = {}
+    for size in sizes:
+        patients = generate_fast_cohort(size, seed=size)
+        for mode in ("blob", "normalized"):
+            previous = database.PATIENT_STORAGE_MODE
+            database.PATIENT_STORAGE_MODE = mode
+            try:
+                with temp_database():
+                    results[f"{mode}_{size}"] = _measure(patients, rng)
+            finally:
+                database.PATIENT_STORAGE_MODE = previous
+    return {"sizes": list(sizes), "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes), indent=2))
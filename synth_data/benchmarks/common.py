@@ -0,0 +1,62 @@
+"""Helpers shared by the benchmark modules."""
+import contextlib
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from app import database
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the app's progress prints while a benchmark runs."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+@contextlib.contextmanager
+def temp_database():
+    """Points app.database at a fresh SQLite file for the duration of the block."""
+    previous = database.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = os.path.join(tmp, "bench.db")
+        database.close_pool()
+        try:
+            with quiet():
+                database.init_db()
+            yield database.DB_FILE
+        finally:
+            database.close_pool()
+            database.DB_FILE = previous
+
+
+def latency_ms(samples: List[float]) -> Dict[str, float]:
+    """mean/p50/p95 in milliseconds for a list of durations in seconds."""
+    ordered = sorted(samples)
+    return {
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+    }
+
+
+def time_calls(fn: Callable[[], object], repeats: int) -> List[float]:
+    """Per-call durations of `repeats` calls to fn."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def time_each(fn: Callable[[object], object], items) -> List[float]:
+    """Per-call durations of fn(item) for each item."""
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - start)
+    return samples
@@ -0,0 +1,66 @@
+"""
+A deterministic local stand-in for the LLM, so graph benchmarks run offline and
+measure the pipeline itself. The same prompt always gets the same answer.
+"""
+import asyncio
+import contextlib
+import hashlib
+import random
+
+from app.llm_gateway import llm_gateway
+from app.models import CarePlan, MessagesSection, NotesSection
+
+FIRST_NAMES = ["Maria", "James", "Aisha", "Wei", "Carlos", "Linda", "Omar", "Grace"]
+LAST_NAMES = ["Garcia", "Smith", "Johnson", "Nguyen", "Patel", "Brown", "Lopez", "Kim"]
+
+
+def _rng(model_input) -> random.Random:
+    text = model_input.to_string() if hasattr(model_input, "to_string") else str(model_input)
+    return random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+
+
+def stub_response(model_input, schema=None):
+    """The structured (or plain-text) answer the stub gives for a prompt."""
+    rng = _rng(model_input)
+    if schema is CarePlan:
+        return CarePlan(careLead="L. Rodriguez", motivators="Staying active with family",
+                        concerns="Rising A1c", devices="CGM", goals="A1c below 7%",
+                        language=rng.choice(["English", "Spanish"]), lastUpdated=f"{rng.randint(1, 9)}d ago")
+    if schema is NotesSection:
+        return NotesSection(notes=[
+            {"subjective": "Reports better energy.", "objective": f"A1c {rng.uniform(6, 10):.1f}",
+             "assessment": "Improving control.", "plan": "Continue current plan.", "updated": f"{w}w ago"}
+            for w in (6, 3, 1)
+        ])
+    if schema is MessagesSection:
+        return MessagesSection(messages=[
+            {"from": sender, "subject": "Check-in", "time": when, "unread": unread, "content": "How are things going?"}
+            for sender, when, unread in (("Health Coach", "2d ago", False), ("Patient", "1d ago", False),
+                                         ("Health Coach", "Now", True))
+        ])
+    if schema is not None and "motivation" in schema.model_fields:
+        return schema(name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                      motivation="Wants to stay healthy for their family",
+                      age=rng.randint(25, 80), gender=rng.choice(["Male", "Female"]))
+    if schema is not None:
+        raise ValueError(f"The LLM stub has no response for schema {schema.__name__}")
+    return "Stub response."
+
+
+@contextlib.contextmanager
+def stub_llm(latency_s: float = 0.0):
+    """
+    Routes llm_gateway.ainvoke to the stub for the duration of the block.
+    `latency_s` adds a fixed per-call delay to model network time.
+    """
+    async def ainvoke(model_input, temperature=0.7, schema=None, timeout=None, coalesce=True):
+        llm_gateway.calls += 1
+        if latency_s:
+            await asyncio.sleep(latency_s)
+        return stub_response(model_input, schema)
+
+    llm_gateway.ainvoke = ainvoke
+    try:
+        yield
+    finally:
+        del llm_gateway.ainvoke  # Back to the class method
@@ -0,0 +1,214 @@
+"""
+Runs the benchmark suites offline and writes one machine-readable JSON report,
+optionally compared against a saved baseline. Run from synth_data/:
+
+    python -m benchmarks.run --quick --out results.json
+    python -m benchmarks.run --quick --baseline benchmarks/baselines/quick.json --fail-on-regression
+    python -m benchmarks.run --quick --save-baseline benchmarks/baselines/quick.json
+
+Every suite runs `--repeats` times (round-robin) and the report keeps the median
+of each metric. Metrics ending in `_per_s` are better when higher; `p50_ms` is
+better when lower. Means, p95 and sizes are reported but not compared. A latency
+only counts as a regression when it is worse by more than the tolerance *and* by
+at least MIN_DELTA_MS; latencies under NOISE_FLOOR_MS in the baseline are left
+out of the gate, and a rate computed from a latency in the same result follows
+that latency. Raw numbers are compared: the calibration time each report records
+is shown as a ratio for judging the machines but never applied. Baselines are
+best compared on similar hardware.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")  # Nothing calls OpenAI; agent imports need a key
+
+with contextlib.redirect_stdout(sys.stderr):  # Keep import-time prints out of the JSON on stdout
+    from benchmarks import bench_fhir, bench_graph, bench_simulators, bench_storage
+from benchmarks.common import time_calls
+
+# Suite -> (full-run kwargs, --quick kwargs)
+SUITES = {
+    "graph": (bench_graph.run, {"patients": 50, "concurrency": 10}, {"patients": 10, "concurrency": 5}),
+    "storage": (bench_storage.run, {"sizes": [1000, 10000, 50000]}, {"sizes": [1000, 5000]}),
+    "simulators": (bench_simulators.run, {"arms": [100, 1000, 10000, 100000], "horizons": [12, 52]},
+                   {"arms": [100, 1000, 10000], "horizons": [12], "calls": 100}),
+    "fhir": (bench_fhir.run, {"rows": 20000, "workers": os.cpu_count() or 1, "chunk_size": 500},
+             {"rows": 2000, "workers": 2, "chunk_size": 250}),
+}
+DEFAULT_TOLERANCE = 0.5  # Single-core CI machines swing by a third between identical runs
+DEFAULT_REPEATS = 5
+MIN_DELTA_MS = 1.0  # Smaller latency changes are scheduler noise on shared machines
+NOISE_FLOOR_MS = 2.0  # Baseline latencies below this are reported but not gated
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _calibration_samples() -> List[float]:
+    return time_calls(lambda: sum(i * i for i in range(200_000)), 5)
+
+
+def _median_of(runs: List):
+    """Element-wise median of repeated suite results with the same shape."""
+    first = runs[0]
+    if isinstance(first, dict):
+        return {key: _median_of([run[key] for run in runs]) for key in first}
+    if isinstance(first, (int, float)) and not isinstance(first, bool):
+        value = statistics.median(runs)
+        return round(value, 3) if isinstance(value, float) else value
+    return first
+
+
+def run_suites(names: List[str], quick: bool, repeats: int = DEFAULT_REPEATS) -> Dict:
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "profile": "quick" if quick else "full",
+            "repeats": repeats,
+        },
+        "suites": {},
+    }
+    # A fixed pure-Python loop timed around every suite; its median is the run's machine-speed proxy.
+    calibration = _calibration_samples()
+    runs = {name: [] for name in names}
+    seconds = dict.fromkeys(names, 0.0)
+    # Round-robin over the suites, so a slow spell on the machine lands in one repeat of each
+    # suite (and drops out of the median) instead of in every repeat of one suite.
+    for repeat in range(repeats):
+        for name in names:
+            fn, full, quick_kwargs = SUITES[name]
+            print(f"Running {name} ({repeat + 1}/{repeats})...", file=sys.stderr)
+            start = time.perf_counter()
+            runs[name].append(fn(**(quick_kwargs if quick else full)))
+            seconds[name] += time.perf_counter() - start
+            calibration += _calibration_samples()
+    for name in names:
+        report["suites"][name] = _median_of(runs[name])
+        report["meta"][f"{name}_seconds"] = round(seconds[name], 1)
+    report["meta"]["calibration_ms"] = round(statistics.median(calibration) * 1000, 3)
+    return report
+
+
+def flatten(value, prefix: str = "") -> Dict[str, float]:
+    """Nested results -> {'suite.path.metric': number}."""
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            out.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+        return out
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def _direction(metric: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 if not compared."""
+    if metric.endswith("_per_s"):
+        return 1
+    if metric.endswith("p50_ms"):
+        return -1
+    return 0
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float = DEFAULT_TOLERANCE) -> Dict:
+    """Relative change per shared metric, split into regressions and improvements beyond `tolerance`."""
+    now, before = flatten(current["suites"]), flatten(baseline["suites"])
+    baseline_calibration = baseline.get("meta", {}).get("calibration_ms")
+    regressions, improvements = [], []
+    compared = 0
+    for metric in sorted(now.keys() & before.keys()):
+        direction = _direction(metric)
+        if not direction or not before[metric]:
+            continue
+        # A rate computed from a latency in the same result (arm_steps_per_s next to p50_ms) is
+        # only as trustworthy as that latency, so it shares the latency's floor and minimum delta.
+        latency = metric if direction < 0 else metric.rsplit(".", 1)[0] + ".p50_ms"
+        if latency in before and before[latency] < NOISE_FLOOR_MS:
+            continue
+        compared += 1
+        change = (now[metric] - before[metric]) / before[metric]
+        if latency in now and latency in before and abs(now[latency] - before[latency]) < MIN_DELTA_MS:
+            continue
+        entry = {"metric": metric, "baseline": before[metric], "current": now[metric], "change": round(change, 3)}
+        if change * direction < -tolerance:
+            regressions.append(entry)
+        elif change * direction > tolerance:
+            improvements.append(entry)
+    return {
+        "baseline_commit": baseline.get("meta", {}).get("git_commit"),
+        "profile_matches": baseline.get("meta", {}).get("profile") == current["meta"]["profile"],
+        "tolerance": tolerance,
+        "min_delta_ms": MIN_DELTA_MS,
+        "noise_floor_ms": NOISE_FLOOR_MS,
+        # Informational only: >1 means this machine ran the calibration loop slower than the baseline's.
+        "calibration_ratio": (round(current["meta"]["calibration_ms"] / baseline_calibration, 3)
+                              if baseline_calibration else None),
+        "compared": compared,
+        "regressions": regressions,
+        "improvements": improvements,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", choices=list(SUITES), action="append", help="Suites to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="Small sizes, for CI and local checks")
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Compare against this saved report")
+    parser.add_argument("--save-baseline", help="Also save this run as a baseline file")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Runs per suite; medians are reported")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    if args.repeats < 1:
+        parser.error("--repeats must be at least 1")
+    report = run_suites(args.suite or list(SUITES), args.quick, args.repeats)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump({k: v for k, v in report.items() if k != "comparison"}, f, indent=2)
+            f.write("\n")
+
+    comparison = report.get("comparison")
+    if comparison:
+        for entry in comparison["regressions"]:
+            print(f"REGRESSION {entry['metric']}: {entry['baseline']} -> {entry['current']} ({entry['change']:+.0%})",
+                  file=sys.stderr)
+        ratio = comparison["calibration_ratio"]
+        if comparison["regressions"] and ratio and abs(ratio - 1) > 0.1:
+            print(f"Note: the calibration loop ran {ratio:.2f}x the baseline's time; the machine itself may be "
+                  "slower or busier than when the baseline was saved.", file=sys.stderr)
+        if args.fail_on_regression and comparison["regressions"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()